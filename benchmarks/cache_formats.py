@@ -0,0 +1,85 @@
+# python -m benchmarks.cache_formats
+
+import json
+from pathlib import Path
+import tempfile
+import time
+from ytmusicbot.common.storage import CODECS, COMPRESSIONS, CacheFormat, FileStorage
+
+SONG_COUNT = 10_000
+ROUNDS = 5
+
+
+def make_song_queue_data() -> dict:
+    queue = [
+        {
+            "id": f"{i:011d}",
+            "title": f"Artist {i % 300} - Song number {i} (Official Audio)",
+            "url": f"https://www.youtube.com/watch?v={i:011d}",
+            "thumbnail_url": f"https://i.ytimg.com/vi/{i:011d}/hqdefault.jpg",
+        }
+        for i in range(SONG_COUNT)
+    ]
+    return {"data": {"queue": queue, "current_index": 0}}
+
+
+def best_of(func) -> float:
+    timings: list[float] = []
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def bench_legacy(data: dict, folder: Path):
+    path = folder / "legacy.json"
+
+    def save():
+        with open(path, "w") as f:
+            json.dump(data, f, indent=4)
+
+    def load():
+        with open(path, "r") as f:
+            json.load(f)
+
+    save_time = best_of(save)
+    load_time = best_of(load)
+    report("legacy json indent=4", save_time, load_time, path.stat().st_size)
+
+
+def bench_format(data: dict, folder: Path, codec: str, compression: str):
+    try:
+        cache_format = CacheFormat(codec, compression)
+    except ValueError as e:
+        print(f"{codec} + {compression}: skipped, {e}")
+        return
+    file_storage = FileStorage(folder / f"{codec}-{compression}.cache", cache_format)
+    save_time = best_of(lambda: file_storage.save(data))
+    load_time = best_of(file_storage.load)
+    report(
+        f"{codec} + {compression}",
+        save_time,
+        load_time,
+        file_storage.file_path.stat().st_size,
+    )
+
+
+def report(name: str, save_time: float, load_time: float, size: int):
+    print(
+        f"{name:<22} save {save_time * 1000:8.2f} ms | load {load_time * 1000:8.2f} ms | size {size / 1024:8.1f} KiB"
+    )
+
+
+def main():
+    data = make_song_queue_data()
+    print(f"SongQueue with {SONG_COUNT} songs, best of {ROUNDS} rounds")
+    with tempfile.TemporaryDirectory() as folder:
+        bench_legacy(data, Path(folder))
+        for codec in CODECS:
+            for compression in COMPRESSIONS:
+                bench_format(data, Path(folder), codec, compression)
+
+
+if __name__ == "__main__":
+    main()
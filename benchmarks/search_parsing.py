@@ -0,0 +1,153 @@
+# python -m benchmarks.search_parsing [--fixtures DIR] [--record QUERY ...]
+
+import argparse
+import json
+from pathlib import Path
+import time
+from ytmusicbot.youtube.search_client import (
+    YOUTUBE_HOST,
+    ConnectionPool,
+    SearchClient,
+    continuation_fixture_path,
+    fixture_path,
+    parse_results_page,
+    parse_videos,
+    renderer_to_video,
+)
+
+ROUNDS = 20
+VIDEO_COUNT = 20
+MAX_RESULTS = (1, 5, None)
+
+
+def make_video_renderer(i: int) -> dict:
+    """Shaped like a real videoRenderer, most of its size is fields the bot doesn't use"""
+    id = f"{i:011d}"
+    return {
+        "videoId": id,
+        "thumbnail": {
+            "thumbnails": [
+                {"url": f"https://i.ytimg.com/vi/{id}/hq720.jpg?sqp={'x' * 60}", "width": w}
+                for w in (360, 720)
+            ]
+        },
+        "title": {"runs": [{"text": f"Artist {i} - Song number {i} (Official Video)"}]},
+        "longBylineText": {"runs": [{"text": f"Artist {i}", "navigationEndpoint": {}}]},
+        "lengthText": {"simpleText": "3:45"},
+        "viewCountText": {"simpleText": f"{i * 1000} views"},
+        "navigationEndpoint": {
+            "commandMetadata": {"webCommandMetadata": {"url": f"/watch?v={id}"}},
+            "watchEndpoint": {"videoId": id, "params": "p" * 40},
+        },
+        "detailedMetadataSnippets": [{"snippetText": {"runs": [{"text": "lyrics " * 30}]}}],
+        "menu": {
+            "menuRenderer": {
+                "items": [
+                    {"menuServiceItemRenderer": {"text": {"runs": [{"text": "Add"}]}}}
+                ]
+                * 8
+            }
+        },
+        "trackingParams": "t" * 200,
+        "accessibility": {"accessibilityData": {"label": "Artist song " * 20}},
+    }
+
+
+def make_results_page() -> str:
+    data = {
+        "responseContext": {"serviceTrackingParams": [{"params": ["s" * 100] * 50}]},
+        "contents": {
+            "twoColumnSearchResultsRenderer": {
+                "primaryContents": {
+                    "sectionListRenderer": {
+                        "contents": [
+                            {
+                                "itemSectionRenderer": {
+                                    "contents": [
+                                        {"videoRenderer": make_video_renderer(i)}
+                                        for i in range(VIDEO_COUNT)
+                                    ]
+                                }
+                            }
+                        ]
+                    }
+                }
+            }
+        },
+        "topbar": {"desktopTopbarRenderer": {"params": ["b" * 100] * 200}},
+    }
+    initial_data = json.dumps(data, separators=(",", ":"))
+    player_script = "var a=1;" * 20_000
+    return f"<html><script>{player_script}</script><script>var ytInitialData = {initial_data};</script></html>"
+
+
+def full_parse(page: str, max_results: int | None) -> list[dict]:
+    """The previous backend, youtube_search, decoded all of ytInitialData"""
+    start = page.index("ytInitialData") + len("ytInitialData") + 3
+    end = page.index("};", start) + 1
+    data = json.loads(page[start:end])
+    videos = []
+    sections = data["contents"]["twoColumnSearchResultsRenderer"]["primaryContents"]
+    for section in sections["sectionListRenderer"]["contents"]:
+        for item in section.get("itemSectionRenderer", {}).get("contents", []):
+            if "videoRenderer" in item:
+                videos.append(renderer_to_video(item["videoRenderer"]))
+    return videos[:max_results]
+
+
+def best_of(func) -> float:
+    timings: list[float] = []
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def bench_page(name: str, page: str):
+    print(f"{name}: {len(page) / 1024:.0f} KiB, best of {ROUNDS} rounds")
+    for max_results in MAX_RESULTS:
+        full_time = best_of(lambda: full_parse(page, max_results))
+        targeted_time = best_of(lambda: parse_videos(page, max_results))
+        print(
+            f"  max_results={str(max_results):<5} full {full_time * 1000:7.2f} ms | targeted {targeted_time * 1000:7.2f} ms | {full_time / targeted_time:5.1f}x"
+        )
+
+
+def record(fixtures_dir: Path, queries: list[str]):
+    """Save live results pages and their next page, needs network access"""
+    fixtures_dir.mkdir(parents=True, exist_ok=True)
+    client = SearchClient(ConnectionPool(YOUTUBE_HOST, 1, 10))
+    for query in queries:
+        path = fixture_path(fixtures_dir, query)
+        page = client.results_page(query)
+        path.write_text(page, encoding="utf-8")
+        print(f"Saved {query!r} to {path}")
+        if continuation := parse_results_page(page).continuation:
+            path = continuation_fixture_path(fixtures_dir, continuation)
+            path.write_text(client.continuation_response(continuation), encoding="utf-8")
+            print(f"Saved the next page of {query!r} to {path}")
+    client.pool.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark search results parsing")
+    parser.add_argument(
+        "--fixtures",
+        type=Path,
+        help="folder of saved results pages, a generated page is used without it",
+    )
+    parser.add_argument("--record", nargs="+", metavar="QUERY", help="save live pages")
+    args = parser.parse_args()
+    if args.record:
+        record(args.fixtures or Path("search_fixtures"), args.record)
+        return
+    if args.fixtures:
+        for path in sorted(args.fixtures.glob("*.html")):
+            bench_page(path.name, path.read_text(encoding="utf-8"))
+    else:
+        bench_page("generated page", make_results_page())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+# python -m benchmarks.startup
+
+import json
+import os
+from pathlib import Path
+import subprocess
+import sys
+import tempfile
+
+ROUNDS = 3
+REPO_DIR = Path(__file__).resolve().parent.parent
+
+# Runs in a fresh interpreter so nothing is already imported
+PROBE = """
+import json
+import time
+
+start = time.perf_counter()
+import ytmusicbot.youtube as youtube
+youtube_import = time.perf_counter() - start
+
+import ytmusicbot.discord.logic
+bot_import = time.perf_counter() - start
+
+youtube.warmup().join()
+ready = time.perf_counter() - start
+print(json.dumps({"youtube_import": youtube_import, "bot_import": bot_import, "ready": ready}))
+"""
+
+
+def probe(cwd: str) -> dict[str, float]:
+    env = {
+        **os.environ,
+        "PYTHONPATH": str(REPO_DIR),
+        "DISCORD_TOKEN": os.getenv("DISCORD_TOKEN", "benchmark"),
+        "SERVER_IDS": os.getenv("SERVER_IDS", "0"),
+    }
+    output = subprocess.check_output(
+        [sys.executable, "-c", PROBE], cwd=cwd, env=env, stderr=subprocess.DEVNULL
+    )
+    return json.loads(output.splitlines()[-1])
+
+
+def main():
+    # A scratch working directory so the bot's caches aren't touched
+    with tempfile.TemporaryDirectory() as cwd:
+        results = [probe(cwd) for _ in range(ROUNDS)]
+    print(f"Best of {ROUNDS} fresh interpreters")
+    for name, label in (
+        ("youtube_import", "import ytmusicbot.youtube"),
+        ("bot_import", "import ytmusicbot.discord.logic"),
+        ("ready", "extractor warmed up"),
+    ):
+        best = min(r[name] for r in results)
+        print(f"{label:<32} {best * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
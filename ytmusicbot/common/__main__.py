@@ -0,0 +1,3 @@
+from ytmusicbot.common.main import main
+
+main()
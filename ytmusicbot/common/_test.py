@@ -0,0 +1,339 @@
+import asyncio
+import json
+from pathlib import Path
+import threading
+import time
+import pytest
+import ytmusicbot.common.main as common
+from ytmusicbot.common.main import Cache, logger
+from ytmusicbot.common.singleflight import SingleFlight
+from ytmusicbot.common.storage import (
+    CacheFormat,
+    FileStorage,
+    JournalStorage,
+    SqliteDatabase,
+    SqliteStorage,
+    snapshot,
+)
+
+
+@pytest.fixture(autouse=True)
+def tmp_cache_dir(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(common, "cache_dir", tmp_path)
+    monkeypatch.setattr(Cache, "all", {})
+    return tmp_path
+
+
+def read_cache_file(cache: Cache):
+    assert isinstance(cache.storage, FileStorage)
+    data, _ = CacheFormat.loads(cache.storage.file_path.read_bytes())
+    return data
+
+
+def test_write_behind(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(Cache, "flush_interval", 60)
+    cache = Cache("write_behind", logger, {"count": 0})
+    cache.save()
+    cache.flush()
+    for i in range(100):
+        cache["count"] = i
+    assert cache.dirty
+    assert read_cache_file(cache) == {"count": 0}
+    Cache.flush_all()
+    assert not cache.dirty
+    assert read_cache_file(cache) == {"count": 99}
+
+
+def test_write_through(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(Cache, "flush_interval", 0)
+    cache = Cache("write_through", logger, {})
+    cache["key"] = "value"
+    assert read_cache_file(cache) == {"key": "value"}
+    del cache["key"]
+    assert read_cache_file(cache) == {}
+
+
+def test_lazy_load(tmp_cache_dir: Path):
+    cache = Cache("lazy", logger, {"count": 0})
+    assert cache._data is None
+    Cache.flush_all()
+    assert not list(tmp_cache_dir.iterdir())
+    assert cache["count"] == 0
+    Cache.flush_all()
+    assert not list(tmp_cache_dir.iterdir())
+    with pytest.raises(ValueError):
+        Cache("lazy", logger, {})
+
+
+def test_aload(monkeypatch: pytest.MonkeyPatch):
+    Cache("aload", logger, {"count": 0}).flush()
+    monkeypatch.setattr(Cache, "all", {})
+    cache = Cache("aload", logger, {"count": 0})
+    load_threads: list[str] = []
+    storage_load = cache.storage.load
+
+    def recording_load():
+        load_threads.append(threading.current_thread().name)
+        return storage_load()
+
+    monkeypatch.setattr(cache.storage, "load", recording_load)
+    asyncio.run(Cache.aload_all())
+    assert cache._data == {"count": 0}
+    assert len(load_threads) == 1
+    assert load_threads[0].startswith("cache-io")
+
+
+def test_async_save(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(Cache, "flush_interval", 0)
+    cache = Cache("async_save", logger, {"queue": []})
+    save_threads: list[str] = []
+    storage_save = cache.storage.save
+
+    def recording_save(data: dict, changes=None):
+        save_threads.append(threading.current_thread().name)
+        storage_save(data, changes)
+
+    monkeypatch.setattr(cache.storage, "save", recording_save)
+
+    async def mutate():
+        for i in range(10):
+            cache["queue"].append(i)
+            cache.save()
+        await cache.aset("volume", 50)
+
+    asyncio.run(mutate())
+    assert read_cache_file(cache) == {"queue": list(range(10)), "volume": 50}
+    assert save_threads
+    assert all(name.startswith("cache-io") for name in save_threads)
+
+
+def test_flush_copies_on_loop(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(Cache, "flush_interval", 60)
+    cache = Cache("flush_on_loop", logger, {"queue": []})
+    copy_threads: list[str] = []
+    storage_snapshot = common.snapshot
+
+    def recording_snapshot(value):
+        copy_threads.append(threading.current_thread().name)
+        return storage_snapshot(value)
+
+    monkeypatch.setattr(common, "snapshot", recording_snapshot)
+
+    async def mutate():
+        for i in range(10):
+            cache["queue"].append(i)
+            cache.save()
+        # The flusher's thread asks the loop to copy the queue
+        await asyncio.to_thread(cache.flush)
+
+    asyncio.run(mutate())
+    assert read_cache_file(cache) == {"queue": list(range(10))}
+    assert set(copy_threads) == {threading.main_thread().name}
+
+
+def test_subclass_properties_dont_collide(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(Cache, "flush_interval", 60)
+
+    class LoopConfig(Cache):
+        """Like the discord Config, whose settings are properties over its data"""
+
+        def __init__(self) -> None:
+            super().__init__("loop_config", logger, {"data": {"loop": False}})
+            self.loop = True
+
+        @property
+        def loop(self):
+            return self["data"]["loop"]
+
+        @loop.setter
+        def loop(self, value: bool):
+            self["data"]["loop"] = value
+            self.save(("set", ("data", "loop"), value))
+
+    async def save_on_loop():
+        config = LoopConfig()
+        config.loop = False
+        config.flush()
+
+    asyncio.run(save_on_loop())
+    assert read_cache_file(Cache.all["loop_config"]) == {"data": {"loop": False}}
+
+
+def test_sqlite_storage(tmp_cache_dir: Path):
+    database = SqliteDatabase(tmp_cache_dir / "cache.sqlite3")
+    storage = SqliteStorage(database, "song_queue")
+    assert storage.load() is None
+    queue = [{"id": str(i), "title": f"Song {i}"} for i in range(100)]
+    data = {"data": {"queue": queue, "current_index": 0}, "empty": {}}
+    storage.save(data)
+    queue.append({"id": "100", "title": "Song 100"})
+    queue.pop(3)
+    data["data"]["current_index"] = 5
+    storage.save(
+        None,
+        [
+            ("append", ("data", "queue"), {"id": "100", "title": "Song 100"}),
+            ("pop", ("data", "queue"), 3),
+            ("set", ("data", "current_index"), 5),
+        ],
+    )
+    assert SqliteStorage(database, "song_queue").load() == data
+
+
+def test_cache_records_changes(tmp_cache_dir: Path, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(common, "cache_storage", "sqlite")
+    monkeypatch.setattr(common, "cache_database_path", tmp_cache_dir / "cache.sqlite3")
+    monkeypatch.setattr(Cache, "flush_interval", 60)
+    cache = Cache("changes", logger, {"queue": [], "volume": 50})
+    writes: list[tuple] = []
+    storage_save = cache.storage.save
+
+    def recording_save(data: dict | None, changes=None):
+        writes.append((data, changes))
+        storage_save(data, changes)
+
+    monkeypatch.setattr(cache.storage, "save", recording_save)
+    cache.reset()
+    cache.flush()
+    for i in range(3):
+        cache["queue"].append(i)
+        cache.save(("append", ("queue",), i))
+    cache["queue"].pop(0)
+    cache.save(("pop", ("queue",), 0))
+    cache["volume"] = 20
+    cache.flush()
+    assert writes[0] == ({"queue": [], "volume": 50}, None)
+    assert writes[1] == (
+        None,
+        [
+            ("append", ("queue",), 0),
+            ("append", ("queue",), 1),
+            ("append", ("queue",), 2),
+            ("pop", ("queue",), 0),
+            ("set", ("volume",), 20),
+        ],
+    )
+    database = SqliteDatabase.get(tmp_cache_dir / "cache.sqlite3")
+    assert SqliteStorage(database, "changes").load() == {"queue": [1, 2], "volume": 20}
+
+
+def test_sqlite_storage_imports_json(tmp_cache_dir: Path):
+    json_path = tmp_cache_dir / "config.json"
+    data = {"data": {"volume": 50, "favourites": [{"id": "a"}]}}
+    with open(json_path, "w") as f:
+        json.dump(data, f, indent=4)
+    file_storage = FileStorage(tmp_cache_dir / "config.cache", legacy_path=json_path)
+    database = SqliteDatabase(tmp_cache_dir / "cache.sqlite3")
+    assert SqliteStorage(database, "config", file_storage).load() == data
+    assert not json_path.exists()
+    assert SqliteStorage(database, "config").load() == data
+
+
+def test_journal_storage(tmp_cache_dir: Path):
+    def make_storage():
+        return JournalStorage(
+            FileStorage(tmp_cache_dir / "search_results.snapshot.cache"),
+            tmp_cache_dir / "search_results.log",
+            max_journal_bytes=1024,
+        )
+
+    storage = make_storage()
+    assert storage.load() is None
+    data = {"data": []}
+    storage.save(snapshot(data), None)
+    for i in range(50):
+        data["data"].append({"id": str(i)})
+        changes = [("append", ("data",), {"id": str(i)})]
+        if len(data["data"]) > 10:
+            data["data"].pop(0)
+            changes.append(("pop", ("data",), 0))
+        storage.save(None, changes)
+        assert make_storage().load() == data
+    with open(storage.journal_path, "a") as f:
+        f.write('{"seq": 9999, "op": "app')
+    storage = make_storage()
+    assert storage.load() == data
+    data["data"].append({"id": "50"})
+    storage.save(None, [("append", ("data",), {"id": "50"})])
+    assert make_storage().load() == data
+
+
+@pytest.mark.parametrize(
+    "codec, compression",
+    [("json", "none"), ("orjson", "none"), ("msgpack", "none"), ("json", "zstd")],
+)
+def test_file_storage_formats(tmp_cache_dir: Path, codec: str, compression: str):
+    try:
+        cache_format = CacheFormat(codec, compression)
+    except ValueError as e:
+        pytest.skip(str(e))
+    data = {"data": {"queue": [{"id": "a", "title": "Song"}], "current_index": 0}}
+    file_storage = FileStorage(tmp_cache_dir / "song_queue.cache", cache_format)
+    file_storage.save(data)
+    assert FileStorage(tmp_cache_dir / "song_queue.cache").load() == data
+
+
+def test_file_storage_migration(tmp_cache_dir: Path):
+    json_path = tmp_cache_dir / "config.json"
+    with open(json_path, "w") as f:
+        json.dump({"volume": 50}, f, indent=4)
+
+    def migrate(data: dict, from_schema_version: int):
+        assert from_schema_version == 1
+        return {"data": data}
+
+    file_storage = FileStorage(
+        tmp_cache_dir / "config.cache", schema_version=2, migrate=migrate, legacy_path=json_path
+    )
+    assert file_storage.load() == {"data": {"volume": 50}}
+    assert not json_path.exists()
+    data, header = CacheFormat.loads(file_storage.file_path.read_bytes())
+    assert data == {"data": {"volume": 50}}
+    assert header and header.schema_version == 2
+
+
+def test_single_flight():
+    flights: SingleFlight[str, int] = SingleFlight()
+    calls: list[int] = []
+    started = threading.Event()
+    release = threading.Event()
+
+    def work(value: int) -> int:
+        calls.append(value)
+        started.set()
+        release.wait()
+        if value < 0:
+            raise ValueError(value)
+        return value
+
+    for value in (1, -1):
+        started.clear()
+        release.clear()
+        results: list[int | Exception] = []
+
+        def call():
+            try:
+                results.append(flights.do("key", work, value))
+            except ValueError as e:
+                results.append(e)
+
+        leader = threading.Thread(target=call)
+        leader.start()
+        started.wait()
+        waiters = [threading.Thread(target=call) for _ in range(3)]
+        for waiter in waiters:
+            waiter.start()
+        # Give every waiter time to block on the shared future
+        time.sleep(0.1)
+        release.set()
+        for thread in (leader, *waiters):
+            thread.join()
+        assert len(results) == 4
+        if value > 0:
+            assert results == [1, 1, 1, 1]
+        else:
+            assert all(isinstance(r, ValueError) for r in results)
+    assert calls == [1, -1]
+    assert not flights.in_flight
+    # The leader calling back into its own key runs the call instead of waiting on itself
+    assert flights.do("key", lambda: flights.do("key", lambda: 2)) == 2
@@ -1,9 +1,28 @@
-import json
+import asyncio
+import atexit
+from concurrent.futures import Future, ThreadPoolExecutor
 import logging
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+import os
 from pathlib import Path
+import queue
+import signal
+import sys
 import threading
+import time
 from typing import Callable, Generic, TypeVar
 import dotenv
+from ytmusicbot.common.storage import (
+    CacheFormat,
+    FileStorage,
+    JournalStorage,
+    Op,
+    SqliteDatabase,
+    SqliteStorage,
+    Storage,
+    snapshot,
+    snapshot_op,
+)
 
 
 def load_dotenv():
@@ -13,15 +32,33 @@ def load_dotenv():
 
 load_dotenv()
 logger = logging.getLogger("ytmusibot")
-logging.basicConfig(
-    level=logging.DEBUG,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+log_level = os.getenv("LOG_LEVEL", "DEBUG").upper()
+# Comma separated subsystem=level pairs e.g. youtube=INFO,discord.song_queue_cache=WARNING
+log_levels = os.getenv("LOG_LEVELS", "")
+log_file_max_bytes = int(os.getenv("LOG_FILE_MAX_BYTES", 10 * 1024**2))
+log_file_backups = int(os.getenv("LOG_FILE_BACKUPS", 3))
+
+log_formatter = logging.Formatter(
+    "%(asctime)s - %(name)s - %(levelname)s - %(message)s",
     datefmt="%Y-%m-%d %H:%M:%S",
-    handlers=[
-        logging.StreamHandler(),
-        logging.FileHandler("ytmusibot.log"),
-    ],
 )
+log_handlers: list[logging.Handler] = [
+    logging.StreamHandler(),
+    RotatingFileHandler(
+        "ytmusibot.log", maxBytes=log_file_max_bytes, backupCount=log_file_backups
+    ),
+]
+for handler in log_handlers:
+    handler.setFormatter(log_formatter)
+# Callers only enqueue records, the listener thread does the console and disk writes
+log_queue: queue.SimpleQueue[logging.LogRecord] = queue.SimpleQueue()
+log_listener = QueueListener(log_queue, *log_handlers)
+log_listener.start()
+atexit.register(log_listener.stop)
+log_queue_handler = QueueHandler(log_queue)
+# The message is merged with its args before enqueueing, the listener's handlers do the rest
+log_queue_handler.setFormatter(logging.Formatter("%(message)s"))
+logging.basicConfig(level=log_level, handlers=[log_queue_handler])
 
 logger_blocklist = [
     "interactions",
@@ -34,16 +71,83 @@ CREATOR_DISCORD_CHAT_URL = "https://discordapp.com/users/760954192399040522"
 for module in logger_blocklist:
     logging.getLogger(module).setLevel(logging.WARNING)
 
+for subsystem_level in filter(None, log_levels.split(",")):
+    subsystem, _, level = subsystem_level.partition("=")
+    logger.getChild(subsystem.strip()).setLevel(level.strip().upper())
+
 cache_dir = Path("cache")
 cache_dir.mkdir(exist_ok=True)
+# Seconds between write-behind flushes, 0 writes on every save
+cache_flush_interval = float(os.getenv("CACHE_FLUSH_INTERVAL", "1"))
+# "file", "sqlite" or "journal"
+cache_storage = os.getenv("CACHE_STORAGE", "file")
+# "json", "orjson" or "msgpack"
+cache_codec = os.getenv("CACHE_CODEC", "json")
+# "none" or "zstd"
+cache_compression = os.getenv("CACHE_COMPRESSION", "none")
+cache_database_path = cache_dir / "cache.sqlite3"
+cache_journal_max_bytes = int(os.getenv("CACHE_JOURNAL_MAX_BYTES", 1024**2))
+# Seconds a flush waits for the event loop to copy a cache's data before retrying next flush
+CACHE_LOOP_FLUSH_TIMEOUT = 5
+
+
+def make_storage(cache: "Cache") -> Storage:
+    cache_format = CacheFormat(cache_codec, cache_compression)
+    file_storage = FileStorage(
+        cache_dir / f"{cache.name}.cache",
+        cache_format,
+        cache.schema_version,
+        cache.migrate,
+        legacy_path=cache_dir / f"{cache.name}.json",
+        logger=cache.logger,
+    )
+    match cache_storage:
+        # json is the name from before the cache format was configurable
+        case "file" | "json":
+            return file_storage
+        case "sqlite":
+            database = SqliteDatabase.get(cache_database_path)
+            return SqliteStorage(database, cache.name, file_storage, cache.logger)
+        case "journal":
+            snapshot_storage = FileStorage(
+                cache_dir / f"{cache.name}.snapshot.cache",
+                cache_format,
+                legacy_path=cache_dir / f"{cache.name}.snapshot.json",
+                logger=cache.logger,
+            )
+            return JournalStorage(
+                snapshot_storage,
+                cache_dir / f"{cache.name}.log",
+                cache_journal_max_bytes,
+                file_storage,
+                cache.logger,
+            )
+        case _:
+            raise ValueError(f"Unknown CACHE_STORAGE: {cache_storage}")
 
 
 K = TypeVar("K")
 V = TypeVar("V")
+# All cache serialization off the event loop happens on this thread, in submission order
+cache_io_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="cache-io")
+
+
+def in_event_loop() -> bool:
+    try:
+        asyncio.get_running_loop()
+        return True
+    except RuntimeError:
+        return False
 
 
 class Cache(Generic[K, V]):
-    all: list["Cache"] = []
+    # One in-memory owner per cache file
+    all: dict[str, "Cache"] = {}
+    # Bump along with overriding migrate when the shape of the data changes
+    schema_version = 1
+    flush_interval = cache_flush_interval
+    _flusher: threading.Thread | None = None
+    _flusher_lock = threading.Lock()
 
     def __init__(
         self,
@@ -52,31 +156,222 @@ class Cache(Generic[K, V]):
         default_data: dict[K, V],
         on_reset: Callable[[], None] | None = None,
     ):
+        if name in Cache.all:
+            raise ValueError(f"Cache {name} already exists, use the shared instance")
         self.default_data = default_data
         self.name = name
-        self.file_path = cache_dir / f"{name}.json"
-        self.file_lock = threading.Lock()
+        # Reentrant since flushing may trigger the first load
+        self.file_lock = threading.RLock()
         self.logger = parent_logger.getChild(f"{name}_cache")
-        self.data = self._load_data()
+        self.storage = make_storage(self)
+        self.dirty = False
+        self.version = 0
+        self.saved_version = 0
+        # The operations applied since the last write, None when they aren't known
+        self.changes: list[Op] | None = []
+        self.changes_lock = threading.Lock()
+        # The event loop the cache is saved from, it owns the data while it runs
+        self._owner_loop: asyncio.AbstractEventLoop | None = None
+        self._data: dict[K, V] | None = None
         self.on_reset = on_reset
-        self.save()
-        self.all.append(self)
+        Cache.all[name] = self
+
+    @property
+    def data(self) -> dict[K, V]:
+        """Loaded from storage on first access unless aload loaded it ahead of time"""
+        if self._data is None:
+            with self.file_lock:
+                if self._data is None:
+                    self._data = self._load_data()
+        return self._data
+
+    @data.setter
+    def data(self, value: dict[K, V]):
+        self._data = value
 
     def _load_data(self) -> dict[K, V]:
-        if self.file_path.exists():
-            with self.file_lock, open(self.file_path, "r") as f:
-                return json.load(f)
-        return self.default_data
+        data = self.storage.load()
+        self.logger.debug("Loaded %s", self.name)
+        if data is None:
+            # The storage doesn't have the default data, the first write writes all of it
+            self.changes = None
+            return snapshot(self.default_data)
+        return data
+
+    async def aload(self):
+        """Load on the cache I/O thread so the first access doesn't read storage on the event loop"""
+        if self._data is None:
+            await asyncio.wrap_future(cache_io_executor.submit(lambda: self.data))
+
+    def migrate(self, data: dict, from_schema_version: int) -> dict:
+        return data
 
     def reset(self):
-        self.data = self.default_data
+        self.data = snapshot(self.default_data)
         self.save()
         if self.on_reset:
             self.on_reset()
 
-    def save(self):
-        with self.file_lock, open(self.file_path, "w") as f:
-            json.dump(self.data, f, indent=4)
+    async def areset(self):
+        self.data = snapshot(self.default_data)
+        await self.asave()
+        if self.on_reset:
+            await asyncio.get_running_loop().run_in_executor(
+                cache_io_executor, self.on_reset
+            )
+
+    def save(self, *changes: Op):
+        """
+        Mark the cache as dirty, the flusher coalesces saves into one write per interval.
+        changes are the operations just applied to the data, incremental storages only
+        write those, without them all of the data is written
+        """
+        self._record(changes)
+        self.version += 1
+        self.dirty = True
+        on_loop = in_event_loop()
+        if on_loop:
+            self._owner_loop = asyncio.get_running_loop()
+        if self.flush_interval > 0:
+            Cache._start_flusher()
+        elif on_loop:
+            # Never block the event loop with disk I/O
+            self._submit_save()
+        else:
+            self.flush()
+
+    async def asave(self, *changes: Op):
+        """Save without blocking the event loop, serialization and disk I/O run on the cache I/O thread"""
+        self._record(changes)
+        self.version += 1
+        self._owner_loop = asyncio.get_running_loop()
+        await asyncio.wrap_future(self._submit_save())
+
+    async def aset(self, key: K, value: V):
+        self.data[key] = value
+        await self.asave(("set", (key,), value))  # type: ignore
+
+    def _record(self, changes: tuple[Op, ...]):
+        if not self.storage.incremental:
+            return
+        with self.changes_lock:
+            if not changes:
+                self.changes = None
+            elif self.changes is not None:
+                # Copied now since the data keeps changing until the changes are written
+                self.changes.extend(snapshot_op(op) for op in changes)
+
+    def _take_changes(self) -> tuple[dict | None, list[Op] | None, int]:
+        """The data is only copied when all of it has to be written"""
+        data = self.data
+        with self.changes_lock:
+            if self.changes is None or not self.storage.incremental:
+                data = snapshot(data)
+            else:
+                data = None
+            changes, self.changes = self.changes, []
+            self.dirty = False
+            return data, changes, self.version
+
+    def _submit_save(self) -> Future[None]:
+        # Copying is cheap compared to serializing and the I/O thread never sees later mutations
+        future = cache_io_executor.submit(self._write, *self._take_changes())
+        future.add_done_callback(self._log_save_error)
+        return future
+
+    def _write(self, data: dict | None, changes: list[Op] | None, version: int):
+        with self.file_lock:
+            if version <= self.saved_version:
+                # A newer version was already written, whole or without these changes
+                if changes:
+                    self._rewrite()
+                return
+            try:
+                self.storage.save(data, changes)
+            except Exception:
+                self._rewrite()
+                raise
+            self.saved_version = version
+
+    def _rewrite(self):
+        """The storage missed changes, the next write writes all of the data"""
+        with self.changes_lock:
+            self.changes = None
+            self.dirty = True
+
+    def _log_save_error(self, future: Future[None]):
+        if e := future.exception():
+            self.logger.error("Failed to save %s: %s", self.name, e)
+
+    def flush(self):
+        """
+        Atomically write the cache to its storage if it has unsaved changes,
+        the data is copied on the event loop that owns it while that loop runs
+        """
+        if not self.dirty:
+            return
+        loop = self._owner_loop
+        if loop and loop.is_running() and not self._on_loop(loop):
+            future = asyncio.run_coroutine_threadsafe(self.aflush(), loop)
+            try:
+                future.result(CACHE_LOOP_FLUSH_TIMEOUT)
+            except TimeoutError:
+                self.logger.debug("Deferring flush, the event loop is busy")
+            return
+        # Caches saved from other threads only replace their entries, copying them can
+        # only fail when an entry is added or removed mid copy
+        with self.file_lock:
+            if not self.dirty:
+                return
+            try:
+                changes = self._take_changes()
+            except RuntimeError as e:
+                # Mutated by another thread mid copy, retry next flush
+                self.logger.debug("Deferring flush: %s", e)
+                return
+            self._write(*changes)
+
+    async def aflush(self):
+        if self.dirty:
+            await asyncio.wrap_future(self._submit_save())
+
+    @staticmethod
+    def _on_loop(loop: asyncio.AbstractEventLoop) -> bool:
+        return in_event_loop() and asyncio.get_running_loop() is loop
+
+    @classmethod
+    def flush_all(cls):
+        for cache in cls.all.values():
+            try:
+                cache.flush()
+            except Exception as e:
+                cache.logger.error("Failed to flush %s: %s", cache.name, e)
+
+    @classmethod
+    async def aload_all(cls):
+        for cache in list(cls.all.values()):
+            await cache.aload()
+
+    @classmethod
+    async def aflush_all(cls):
+        for cache in cls.all.values():
+            await cache.aflush()
+
+    @classmethod
+    def _start_flusher(cls):
+        with cls._flusher_lock:
+            if cls._flusher:
+                return
+            cls._flusher = threading.Thread(
+                target=cls._flush_forever, name="cache-flusher", daemon=True
+            )
+            cls._flusher.start()
+
+    @classmethod
+    def _flush_forever(cls):
+        while True:
+            time.sleep(cls.flush_interval)
+            cls.flush_all()
 
     def get(self, key: K) -> V | None:
         return self.data.get(key)
@@ -86,11 +381,53 @@ class Cache(Generic[K, V]):
 
     def __delitem__(self, key: K):
         del self.data[key]
-        self.save()
+        self.save(("del", (key,)))  # type: ignore
 
     def __getitem__(self, key: K) -> V:
         return self.data[key]
 
     def __setitem__(self, key: K, value: V):
         self.data[key] = value
-        self.save()
+        self.save(("set", (key,), value))  # type: ignore
+
+
+atexit.register(Cache.flush_all)
+
+
+def migrate_file_caches():
+    """Import the existing cache/*.cache and legacy cache/*.json files into the SQLite cache database"""
+    database = SqliteDatabase.get(cache_database_path)
+    names = {
+        path.stem
+        for path in (*cache_dir.glob("*.cache"), *cache_dir.glob("*.json"))
+        if not path.stem.endswith(".snapshot")
+    }
+    for name in names:
+        file_storage = FileStorage(
+            cache_dir / f"{name}.cache",
+            legacy_path=cache_dir / f"{name}.json",
+            logger=logger,
+        )
+        SqliteStorage(database, name, logger=logger).import_file(file_storage)
+
+
+def flush_caches_on_termination():
+    """Flush all caches on SIGTERM (sent by cloud/kill.sh) before terminating"""
+
+    def flush_then_terminate(signum: int):
+        Cache.flush_all()
+        log_listener.stop()
+        os.kill(os.getpid(), signum)
+
+    def on_signal(signum: int, _):
+        logger.info("Received signal %s, flushing caches", signum)
+        signal.signal(signum, signal.SIG_DFL)
+        # Flush from another thread since the main thread may be holding a file lock
+        threading.Thread(target=flush_then_terminate, args=(signum,)).start()
+
+    signal.signal(signal.SIGTERM, on_signal)
+
+
+def main():
+    if "--migrate-to-sqlite" in sys.argv or "-mts" in sys.argv:
+        migrate_file_caches()
@@ -0,0 +1,50 @@
+from concurrent.futures import Future
+import threading
+from typing import Callable, Generic, Hashable, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class SingleFlight(Generic[K, V]):
+    """
+    Concurrent calls with the same key share one execution, every caller gets
+    its result or exception the moment it completes
+    """
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.in_flight: dict[K, tuple[Future[V], int]] = {}
+
+    def join(self, key: K) -> Future[V] | None:
+        """The future of another thread's in-flight call for key"""
+        with self.lock:
+            flight = self.in_flight.get(key)
+        if not flight or flight[1] == threading.get_ident():
+            return None
+        return flight[0]
+
+    def do(self, key: K, func: Callable[..., V], *args) -> V:
+        thread_id = threading.get_ident()
+        with self.lock:
+            flight = self.in_flight.get(key)
+            if not flight:
+                future: Future[V] = Future()
+                self.in_flight[key] = (future, thread_id)
+        if flight:
+            future, leader_id = flight
+            # The leader calling back into itself would wait on itself forever
+            if leader_id == thread_id:
+                return func(*args)
+            return future.result()
+        try:
+            result = func(*args)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self.lock:
+                del self.in_flight[key]
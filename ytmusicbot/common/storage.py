@@ -0,0 +1,511 @@
+import importlib
+import json
+import logging
+import os
+from pathlib import Path
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Literal, NamedTuple
+
+KeyPath = tuple[str | int, ...]
+Op = (
+    tuple[Literal["set"], KeyPath, Any]
+    | tuple[Literal["del"], KeyPath]
+    | tuple[Literal["append"], KeyPath, Any]
+    | tuple[Literal["pop"], KeyPath, int]
+)
+
+
+def snapshot(value: Any) -> Any:
+    """Copy the containers of a JSON value, the leaves are immutable"""
+    if isinstance(value, dict):
+        return {k: snapshot(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [snapshot(v) for v in value]
+    return value
+
+
+def snapshot_op(op: Op) -> Op:
+    """Copy the value of an operation so later mutations of the data don't change it"""
+    match op:
+        case ("set", path, value):
+            return ("set", path, snapshot(value))
+        case ("append", path, value):
+            return ("append", path, snapshot(value))
+    return op
+
+
+def apply(data: dict, op: Op) -> None:
+    """Apply an operation recorded by a cache to data in place"""
+    *parent_path, key = op[1]
+    parent: Any = data
+    for segment in parent_path:
+        parent = parent[segment]
+    match op:
+        case ("set", _, value):
+            parent[key] = value
+        case ("del", _):
+            del parent[key]
+        case ("append", _, value):
+            parent[key].append(value)
+        case ("pop", _, index):
+            parent[key].pop(index)
+
+
+class Storage(ABC):
+    """Persists the data of a single cache"""
+
+    # Writes the changes made since the last save instead of all of the data
+    incremental = False
+
+    @abstractmethod
+    def load(self) -> dict | None: ...
+
+    @abstractmethod
+    def save(self, data: dict | None, changes: list[Op] | None = None) -> None:
+        """
+        An incremental storage is only given the data when the changes
+        aren't known e.g. after a reset
+        """
+
+
+class FormatHeader(NamedTuple):
+    format_version: int
+    codec: str
+    compression: str
+    schema_version: int
+
+
+FORMAT_MAGIC = "YTMBCACHE"
+FORMAT_VERSION = 1
+# Pretty printed JSON files from before the header was introduced
+LEGACY_SCHEMA_VERSION = 1
+CODECS = ("json", "orjson", "msgpack")
+COMPRESSIONS = ("none", "zstd")
+
+
+class CacheFormat:
+    """
+    A header line naming the format, codec, compression and schema versions,
+    followed by the encoded and optionally compressed data
+    """
+
+    def __init__(self, codec: str = "json", compression: str = "none") -> None:
+        if codec not in CODECS:
+            raise ValueError(f"Unknown cache codec: {codec}")
+        if compression not in COMPRESSIONS:
+            raise ValueError(f"Unknown cache compression: {compression}")
+        # Fail on startup instead of on the first save if an optional package is missing
+        self._module(codec)
+        if compression == "zstd":
+            self._module("zstandard")
+        self.codec = codec
+        self.compression = compression
+
+    def header(self, schema_version: int) -> FormatHeader:
+        return FormatHeader(FORMAT_VERSION, self.codec, self.compression, schema_version)
+
+    def dumps(self, data: Any, schema_version: int) -> bytes:
+        payload = self.encode(self.codec, data)
+        if self.compression == "zstd":
+            payload = self._module("zstandard").ZstdCompressor().compress(payload)
+        header = " ".join(str(field) for field in (FORMAT_MAGIC, *self.header(schema_version)))
+        return f"{header}\n".encode() + payload
+
+    @classmethod
+    def loads(cls, raw: bytes) -> tuple[Any, FormatHeader | None]:
+        """Decode data in any codec and compression, the header is None for legacy files"""
+        if not raw.startswith(FORMAT_MAGIC.encode()):
+            return json.loads(raw), None
+        header_line, _, payload = raw.partition(b"\n")
+        _, format_version, codec, compression, schema_version = header_line.decode().split(" ")
+        header = FormatHeader(int(format_version), codec, compression, int(schema_version))
+        if header.format_version > FORMAT_VERSION:
+            raise ValueError(f"Unsupported cache format version: {header.format_version}")
+        if compression == "zstd":
+            payload = cls._module("zstandard").ZstdDecompressor().decompress(payload)
+        return cls.decode(codec, payload), header
+
+    @classmethod
+    def encode(cls, codec: str, data: Any) -> bytes:
+        match codec:
+            case "orjson":
+                return cls._module("orjson").dumps(data)
+            case "msgpack":
+                return cls._module("msgpack").packb(data)
+            case _:
+                return json.dumps(data, separators=(",", ":")).encode()
+
+    @classmethod
+    def decode(cls, codec: str, payload: bytes) -> Any:
+        match codec:
+            case "orjson":
+                return cls._module("orjson").loads(payload)
+            case "msgpack":
+                return cls._module("msgpack").unpackb(payload, strict_map_key=False)
+            case _:
+                return json.loads(payload)
+
+    @staticmethod
+    def _module(name: str) -> Any:
+        if name == "json":
+            return json
+        try:
+            return importlib.import_module(name)
+        except ImportError:
+            raise ValueError(f"{name} is not installed, install it with: pip install {name}")
+
+
+class FileStorage(Storage):
+    """Rewrites the whole cache to a file on every save"""
+
+    def __init__(
+        self,
+        file_path: Path,
+        cache_format: CacheFormat | None = None,
+        schema_version: int = LEGACY_SCHEMA_VERSION,
+        migrate: Callable[[Any, int], Any] | None = None,
+        legacy_path: Path | None = None,
+        logger: logging.Logger | None = None,
+    ) -> None:
+        self.file_path = file_path
+        self.format = cache_format or CacheFormat()
+        self.schema_version = schema_version
+        self.migrate = migrate
+        self.legacy_path = legacy_path
+        self.logger = logger or logging.getLogger(__name__)
+
+    def existing_path(self) -> Path | None:
+        for path in (self.file_path, self.legacy_path):
+            if path and path.exists():
+                return path
+        return None
+
+    def read(self) -> tuple[Any, bool] | None:
+        """Read and schema migrate the data, also returns whether the file is outdated"""
+        path = self.existing_path()
+        if not path:
+            return None
+        data, header = CacheFormat.loads(path.read_bytes())
+        schema_version = header.schema_version if header else LEGACY_SCHEMA_VERSION
+        if schema_version > self.schema_version:
+            raise ValueError(
+                f"{path} has schema version {schema_version}, newer than {self.schema_version}"
+            )
+        if schema_version < self.schema_version and self.migrate:
+            self.logger.info("Migrating %s from schema version %s", path, schema_version)
+            data = self.migrate(data, schema_version)
+        is_outdated = path != self.file_path or header != self.format.header(
+            self.schema_version
+        )
+        return data, is_outdated
+
+    def load(self) -> dict | None:
+        result = self.read()
+        if not result:
+            return None
+        data, is_outdated = result
+        if is_outdated:
+            self.logger.info("Converting %s to %s", self.existing_path(), self.file_path)
+            legacy_path = self.existing_path()
+            self.save(data)
+            if legacy_path and legacy_path != self.file_path:
+                legacy_path.unlink()
+        return data
+
+    def save(self, data: dict | None, changes: list[Op] | None = None) -> None:
+        serialized = self.format.dumps(data, self.schema_version)
+        tmp_path = self.file_path.with_suffix(f"{self.file_path.suffix}.tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(serialized)
+        os.replace(tmp_path, self.file_path)
+
+    def archive(self) -> None:
+        """Keep the files around as backups after they were imported elsewhere"""
+        for path in (self.file_path, self.legacy_path):
+            if path and path.exists():
+                path.rename(path.with_suffix(f"{path.suffix}.bak"))
+
+
+PATH_SEPARATOR = "\x1f"
+
+
+def encode_path(path: KeyPath) -> str:
+    # json.dumps escapes control characters so the separator never appears in a segment
+    return "".join(f"{PATH_SEPARATOR}{json.dumps(segment)}" for segment in path)
+
+
+class SqliteDatabase:
+    """A WAL mode SQLite database shared by all the caches stored in it"""
+
+    all: dict[Path, "SqliteDatabase"] = {}
+    all_lock = threading.Lock()
+
+    def __init__(self, file_path: Path) -> None:
+        self.file_path = file_path
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(
+            file_path, check_same_thread=False, isolation_level=None
+        )
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        # Dicts are stored as a row per key and lists as a row per element
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "cache TEXT NOT NULL, path TEXT NOT NULL, kind TEXT NOT NULL, value TEXT, "
+            "PRIMARY KEY (cache, path))"
+        )
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS list_items ("
+            "cache TEXT NOT NULL, path TEXT NOT NULL, position INTEGER NOT NULL, value TEXT NOT NULL, "
+            "PRIMARY KEY (cache, path, position))"
+        )
+
+    @classmethod
+    def get(cls, file_path: Path) -> "SqliteDatabase":
+        with cls.all_lock:
+            if file_path not in cls.all:
+                cls.all[file_path] = SqliteDatabase(file_path)
+            return cls.all[file_path]
+
+
+class SqliteStorage(Storage):
+    """Applies only the rows that changed since the last save"""
+
+    incremental = True
+
+    def __init__(
+        self,
+        database: SqliteDatabase,
+        name: str,
+        import_from: FileStorage | None = None,
+        logger: logging.Logger | None = None,
+    ) -> None:
+        self.database = database
+        self.name = name
+        self.import_from = import_from
+        self.logger = logger or logging.getLogger(__name__)
+
+    def load(self) -> dict | None:
+        data = self._read()
+        if data is None and self.import_from and self.import_from.existing_path():
+            data = self.import_file(self.import_from)
+        return data
+
+    def import_file(self, file_storage: FileStorage) -> dict:
+        self.logger.info(
+            "Importing %s into %s", file_storage.existing_path(), self.database.file_path
+        )
+        result = file_storage.read()
+        data = result[0] if result else {}
+        with self.database.lock, self.database.connection as connection:
+            connection.execute("BEGIN")
+            self._delete(connection, ())
+            self._insert(connection, (), data)
+        file_storage.archive()
+        return data
+
+    def save(self, data: dict | None, changes: list[Op] | None = None) -> None:
+        # Without the changes all of the cache's rows are rewritten
+        ops: list[Op] = changes if changes is not None else [("set", (), data)]
+        if not ops:
+            return
+        with self.database.lock, self.database.connection as connection:
+            connection.execute("BEGIN")
+            if not self._exists(connection):
+                self._insert(connection, (), {})
+            for op in ops:
+                self._apply(connection, op)
+        self.logger.debug("Applied %s row operations", len(ops))
+
+    def _exists(self, connection: sqlite3.Connection) -> bool:
+        row = connection.execute(
+            "SELECT 1 FROM entries WHERE cache = ? AND path = ''", (self.name,)
+        ).fetchone()
+        return row is not None
+
+    def _read(self) -> dict | None:
+        with self.database.lock:
+            connection = self.database.connection
+            if not self._exists(connection):
+                return None
+            rows = connection.execute(
+                "SELECT path, kind, value FROM entries WHERE cache = ? ORDER BY rowid",
+                (self.name,),
+            ).fetchall()
+            items = connection.execute(
+                "SELECT path, value FROM list_items WHERE cache = ? ORDER BY path, position",
+                (self.name,),
+            ).fetchall()
+        containers: dict[str, Any] = {}
+        for encoded, kind, value in rows:
+            node = {} if kind == "dict" else [] if kind == "list" else json.loads(value)
+            if kind != "value":
+                containers[encoded] = node
+            if encoded:
+                parent, _, key = encoded.rpartition(PATH_SEPARATOR)
+                containers[parent][json.loads(key)] = node
+        for encoded, value in items:
+            containers[encoded].append(json.loads(value))
+        return containers[""]
+
+    def _apply(self, connection: sqlite3.Connection, op: Op) -> None:
+        match op:
+            case ("set", path, value):
+                self._delete(connection, path)
+                self._insert(connection, path, value)
+            case ("del", path):
+                self._delete(connection, path)
+            case ("append", path, value):
+                connection.execute(
+                    "INSERT INTO list_items VALUES (?, ?, "
+                    "(SELECT COALESCE(MAX(position) + 1, 0) FROM list_items WHERE cache = ? AND path = ?), ?)",
+                    (self.name, encode_path(path), self.name, encode_path(path), json.dumps(value)),
+                )
+            case ("pop", path, index):
+                connection.execute(
+                    "DELETE FROM list_items WHERE rowid = (SELECT rowid FROM list_items "
+                    "WHERE cache = ? AND path = ? ORDER BY position LIMIT 1 OFFSET ?)",
+                    (self.name, encode_path(path), index),
+                )
+
+    def _delete(self, connection: sqlite3.Connection, path: KeyPath) -> None:
+        encoded = encode_path(path)
+        prefix = f"{encoded}{PATH_SEPARATOR}"
+        for table in ("entries", "list_items"):
+            connection.execute(
+                f"DELETE FROM {table} WHERE cache = ? AND (path = ? OR substr(path, 1, ?) = ?)",
+                (self.name, encoded, len(prefix), prefix),
+            )
+
+    def _insert(self, connection: sqlite3.Connection, path: KeyPath, value: Any) -> None:
+        encoded = encode_path(path)
+        if isinstance(value, dict):
+            connection.execute(
+                "INSERT INTO entries VALUES (?, ?, 'dict', NULL)", (self.name, encoded)
+            )
+            for key, child in value.items():
+                self._insert(connection, (*path, key), child)
+        elif isinstance(value, list):
+            connection.execute(
+                "INSERT INTO entries VALUES (?, ?, 'list', NULL)", (self.name, encoded)
+            )
+            connection.executemany(
+                "INSERT INTO list_items VALUES (?, ?, ?, ?)",
+                ((self.name, encoded, i, json.dumps(v)) for i, v in enumerate(value)),
+            )
+        else:
+            connection.execute(
+                "INSERT INTO entries VALUES (?, ?, 'value', ?)",
+                (self.name, encoded, json.dumps(value)),
+            )
+
+
+class JournalStorage(Storage):
+    """
+    Appends every operation to a journal that is replayed on top of the last snapshot,
+    the snapshot is rewritten once the journal grows past max_journal_bytes
+    """
+
+    incremental = True
+
+    def __init__(
+        self,
+        snapshot_storage: FileStorage,
+        journal_path: Path,
+        max_journal_bytes: int,
+        import_from: FileStorage | None = None,
+        logger: logging.Logger | None = None,
+    ) -> None:
+        self.snapshot_storage = snapshot_storage
+        self.journal_path = journal_path
+        self.max_journal_bytes = max_journal_bytes
+        self.import_from = import_from
+        self.logger = logger or logging.getLogger(__name__)
+        # The journaled data, written as the snapshot when compacting
+        self.snapshot: dict = {}
+        self.seq = 0
+
+    def load(self) -> dict | None:
+        stored = self.snapshot_storage.load()
+        if stored is None and self.import_from and (result := self.import_from.read()):
+            self.logger.info("Importing %s", self.import_from.existing_path())
+            stored = {"seq": 0, "data": result[0]}
+            self.snapshot_storage.save(stored)
+            self.import_from.archive()
+        data: dict | None = None
+        if stored is not None:
+            self.seq = stored["seq"]
+            data = stored["data"]
+        replayed = 0
+        if self.journal_path.exists():
+            with open(self.journal_path, "rb+") as f:
+                valid_size = 0
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # A torn write from a crash, drop it so later appends are replayable
+                        self.logger.warning("Truncating corrupt journal entry: %r", line)
+                        f.truncate(valid_size)
+                        break
+                    valid_size += len(line)
+                    if entry["seq"] <= self.seq:
+                        # Already in the snapshot, the journal wasn't truncated
+                        continue
+                    if data is None:
+                        data = {}
+                    apply(data, self._decode(entry))
+                    self.seq = entry["seq"]
+                    replayed += 1
+        self.logger.debug("Replayed %s journal entries", replayed)
+        self.snapshot = snapshot(data) if data is not None else {}
+        return data
+
+    def save(self, data: dict | None, changes: list[Op] | None = None) -> None:
+        if changes is None:
+            # Unknown changes e.g. a reset, the data becomes the new snapshot
+            self.snapshot = data or {}
+            self.compact()
+            return
+        if not changes:
+            return
+        lines: list[str] = []
+        for op in changes:
+            # Applied first so an operation that doesn't apply is never journaled
+            apply(self.snapshot, op)
+            self.seq += 1
+            lines.append(self._encode(self.seq, op))
+        with open(self.journal_path, "a") as f:
+            f.writelines(lines)
+            f.flush()
+            os.fsync(f.fileno())
+        if self.journal_path.stat().st_size > self.max_journal_bytes:
+            self.compact()
+
+    def compact(self) -> None:
+        self.logger.debug("Compacting %s", self.journal_path)
+        self.snapshot_storage.save({"seq": self.seq, "data": self.snapshot})
+        self.journal_path.unlink(missing_ok=True)
+
+    @staticmethod
+    def _encode(seq: int, op: Op) -> str:
+        entry: dict[str, Any] = {"seq": seq, "op": op[0], "path": op[1]}
+        if len(op) == 3:
+            entry["value" if op[0] != "pop" else "index"] = op[2]
+        return f"{json.dumps(entry, separators=(',', ':'))}\n"
+
+    @staticmethod
+    def _decode(entry: dict[str, Any]) -> Op:
+        path = tuple(entry["path"])
+        match entry["op"]:
+            case "set":
+                return ("set", path, entry["value"])
+            case "del":
+                return ("del", path)
+            case "append":
+                return ("append", path, entry["value"])
+            case "pop":
+                return ("pop", path, entry["index"])
+        raise ValueError(f"Unknown journal operation: {entry['op']}")
@@ -4,6 +4,8 @@
 
 import re
 import interactions
+from ytmusicbot.common.main import Cache, flush_caches_on_termination
+import ytmusicbot.youtube.aio as youtube
 from ytmusicbot.discord.common import (
     ButtonID,
     logger,
@@ -49,6 +51,8 @@ from ytmusicbot.discord.logic import (
     unfavourite,
     show_favourites,
     play_favourites,
+    cancel_playlist,
+    more_results,
     url_mapping,
 )
 
@@ -67,6 +71,12 @@ def get_url_from_custom_id(
     return url
 
 
+@interactions.listen(interactions.events.Startup)
+async def on_startup():
+    # Reads the caches off the event loop before the commands use them
+    await Cache.aload_all()
+
+
 DEFAULT_MAX_RESULTS = 3
 DEFAULT_INCLUDE_PLAYLISTS = False
 
@@ -160,6 +170,22 @@ async def on_unfavourite_cmp(ctx: interactions.ComponentContext):
     await unfavourite(url, ctx)
 
 
+@interactions.component_callback(ButtonID.cancel_playlist_rx)
+async def on_cancel_playlist_cmp(ctx: interactions.ComponentContext):
+    ingest_match = ButtonID.cancel_playlist_rx.match(ctx.custom_id)
+    if not ingest_match:
+        raise DiscordException(f"Invalid custom id: {ctx.custom_id}")
+    await cancel_playlist(ctx, ingest_match.group(1))
+
+
+@interactions.component_callback(ButtonID.more_rx)
+async def on_more_cmp(ctx: interactions.ComponentContext):
+    session_match = ButtonID.more_rx.match(ctx.custom_id)
+    if not session_match:
+        raise DiscordException(f"Invalid custom id: {ctx.custom_id}")
+    await more_results(ctx, session_match.group(1))
+
+
 @interactions.slash_command(
     name="show_favourites",
     description="Show your favourite songs",
@@ -526,6 +552,8 @@ async def on_restart_bot_cmd(ctx: interactions.SlashContext):
 def main():
     global bot_restarted, bot
     logger.debug("Starting bot")
+    flush_caches_on_termination()
+    youtube.warmup()
     bot.start()
     if bot_restarted[0]:
         logger.debug("Bot restarted")
@@ -0,0 +1,246 @@
+import audioop
+from pathlib import Path
+import subprocess
+import threading
+from interactions.api.voice.audio import AudioVolume
+from interactions.api.voice.opus import Decoder
+from ytmusicbot.discord.common import logger
+import ytmusicbot.youtube.aio as youtube
+from ytmusicbot.youtube.ogg_opus import (
+    OPUS_SAMPLE_RATE,
+    OggOpusError,
+    OggOpusReader,
+    packet_samples,
+)
+
+logger = logger.getChild("audio")
+FEED_CHUNK_BYTES = 64 * 1024
+# How long the feeder sleeps at the end of the file when the progress hook is quiet
+FEED_POLL_SECONDS = 0.5
+# Keeps a stream going through dropped connections instead of ending the song early
+STREAM_RECONNECT_ARGS = [
+    "-reconnect",
+    "1",
+    "-reconnect_streamed",
+    "1",
+    "-reconnect_delay_max",
+    "5",
+]
+# The player sends one 20ms frame every 20ms
+PASSTHROUGH_PACKET_SAMPLES = OPUS_SAMPLE_RATE // 50
+
+
+class ProgressiveAudio(AudioVolume):
+    """
+    Plays a song that is still downloading, ffmpeg reads it from stdin
+    while a feeder thread follows the tail of yt-dlp's temporary file
+    """
+
+    def __init__(self, progress: youtube.DownloadProgress) -> None:
+        super().__init__("pipe:0")
+        self.progress = progress
+        self.feeder = threading.Thread(
+            target=self._feed, name=f"feed-{progress.id}", daemon=True
+        )
+
+    def __repr__(self) -> str:
+        return f"<{type(self).__name__}: {self.progress.tmp_path}>"
+
+    def _create_process(self, *, block: bool = True) -> None:
+        before = (
+            self.ffmpeg_before_args
+            if isinstance(self.ffmpeg_before_args, list)
+            else self.ffmpeg_before_args.split()
+        )
+        after = (
+            self.ffmpeg_args
+            if isinstance(self.ffmpeg_args, list)
+            else self.ffmpeg_args.split()
+        )
+        cmd = [
+            "ffmpeg",
+            *before,
+            "-i",
+            self.source,
+            "-f",
+            "s16le",
+            "-ar",
+            "48000",
+            "-ac",
+            "2",
+            "-loglevel",
+            "warning",
+            "pipe:1",
+            "-vn",
+            *after,
+        ]
+        self.process = subprocess.Popen(
+            cmd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            stdin=subprocess.PIPE,
+        )
+        self.feeder.start()
+        self.read_ahead_task.start()
+        if block:
+            self.buffer.initialised.wait()
+
+    def _feed(self) -> None:
+        assert self.process and self.process.stdin and self.progress.tmp_path
+        stdin = self.process.stdin
+        try:
+            # The open file keeps being readable after yt-dlp renames it to the final name
+            with open(self.progress.tmp_path, "rb") as f:
+                while True:
+                    # Checked before reading so nothing written after the check is missed
+                    finished = self.progress.finished
+                    if chunk := f.read(FEED_CHUNK_BYTES):
+                        stdin.write(chunk)
+                        continue
+                    if finished:
+                        break
+                    self.progress.wait_for_more(f.tell(), FEED_POLL_SECONDS)
+        except (BrokenPipeError, ValueError):
+            # ffmpeg was killed e.g. the player was stopped
+            pass
+        except OSError as e:
+            logger.error("Failed to feed %s to ffmpeg: %s", self.progress.tmp_path, e)
+        finally:
+            try:
+                stdin.close()
+            except OSError:
+                pass
+
+
+class StreamAudio(AudioVolume):
+    """Plays a resolved stream URL directly, nothing is written to the downloads"""
+
+    def __init__(self, url: str) -> None:
+        super().__init__(url)
+        self.ffmpeg_before_args = list(STREAM_RECONNECT_ARGS)
+
+    def __repr__(self) -> str:
+        # The full URL is long and carries signatures
+        return f"<{type(self).__name__}: {self.source[:60]}...>"
+
+    def start(self, timeout: float) -> bool:
+        """Start ffmpeg and wait for the first audio, False if the stream couldn't be opened in time"""
+        self.pre_buffer()
+        self.buffer.initialised.wait(timeout)
+        if len(self.buffer):
+            return True
+        self.cleanup()
+        return False
+
+
+class OggOpusAudio(AudioVolume):
+    """
+    Plays an Ogg Opus download without ffmpeg, at full volume its packets are sent
+    as they are, otherwise they're decoded to apply the volume and the player encodes them again
+    """
+
+    def __init__(self, file_path: Path) -> None:
+        super().__init__(file_path)
+        self.reader = OggOpusReader(file_path)
+        self.decoder: Decoder | None = None
+        # Decoded audio that hasn't been sent yet
+        self.pcm = bytearray()
+        # Primes the decoder when switching from passing packets through to decoding them
+        self.last_packet = b""
+        self.complete = False
+        # Sample positions at 48kHz
+        self.position = 0
+        self.start_sample = 0
+        self.end_sample: int | None = None
+
+    def trim(self, start: float, end: float | None) -> None:
+        """Skip the audio before start and after end in seconds, packets are skipped whole"""
+        self.start_sample = int(start * OPUS_SAMPLE_RATE)
+        self.end_sample = int(end * OPUS_SAMPLE_RATE) if end is not None else None
+
+    @property
+    def audio_complete(self) -> bool:
+        return self.complete and not self.pcm
+
+    def pre_buffer(self, duration: None | float = None) -> None:
+        pass
+
+    def cleanup(self) -> None:
+        if reader := getattr(self, "reader", None):
+            reader.close()
+
+    def read(self, frame_size: int) -> bytes:
+        try:
+            if not self.pcm:
+                packet = self._read_packet()
+                if not packet:
+                    return b""
+                if (
+                    self._volume == 1.0
+                    and packet_samples(packet) == PASSTHROUGH_PACKET_SAMPLES
+                ):
+                    self.needs_encode = False
+                    self.last_packet = packet
+                    return packet
+                self._decode(packet)
+            while len(self.pcm) < frame_size and (packet := self._read_packet()):
+                self._decode(packet)
+        except OggOpusError as e:
+            logger.error("Stopped playing %s: %s", self.source, e)
+            self.complete = True
+            self.pcm.clear()
+            return b""
+        self.needs_encode = True
+        data = bytes(self.pcm[:frame_size])
+        del self.pcm[:frame_size]
+        if len(data) < frame_size:
+            # The end of the song
+            data += bytes(frame_size - len(data))
+        return audioop.mul(data, 2, self._volume)
+
+    def _read_packet(self) -> bytes:
+        while not self.complete:
+            packet = self.reader.read_packet()
+            if not packet or (
+                self.end_sample is not None and self.position >= self.end_sample
+            ):
+                self.complete = True
+                break
+            self.position += packet_samples(packet)
+            if self.position > self.start_sample:
+                return packet
+        return b""
+
+    def _decode(self, packet: bytes) -> None:
+        if self.decoder is None:
+            self.decoder = Decoder()
+        if self.last_packet:
+            # Packets that were sent as they are never reached the decoder
+            self.decoder.decode(self.last_packet)
+            self.last_packet = b""
+        self.pcm += self.decoder.decode(packet)
+
+
+def file_audio(
+    file_path: Path, analysis: youtube.AudioAnalysis | None = None
+) -> AudioVolume:
+    """Ogg Opus downloads skip ffmpeg, everything else is transcoded by it"""
+    start, end = 0.0, None
+    if analysis and youtube.trim_silence:
+        start, end = analysis["start"], analysis["end"]
+    if file_path.suffix == ".opus":
+        try:
+            audio = OggOpusAudio(file_path)
+            audio.trim(start, end)
+            return audio
+        except (OggOpusError, OSError) as e:
+            logger.warning("Playing %s with ffmpeg: %s", file_path, e)
+    audio = AudioVolume(file_path)
+    # Input options so -to is a position in the song rather than the output duration
+    before_args: list[str] = []
+    if start:
+        before_args += ["-ss", str(start)]
+    if end is not None:
+        before_args += ["-to", str(end)]
+    audio.ffmpeg_before_args = before_args
+    return audio
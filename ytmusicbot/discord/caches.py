@@ -2,13 +2,14 @@ import os
 import random
 import hashlib
 import time
-from typing import Literal, TypedDict
+from typing import Callable, Literal, TypedDict
 from ytmusicbot.discord.common import (
     logger,
     DiscordException,
 )
-import ytmusicbot.youtube as youtube
+import ytmusicbot.youtube.aio as youtube
 from ytmusicbot.common.main import Cache, load_dotenv
+from ytmusicbot.common.storage import Op
 
 
 load_dotenv()
@@ -22,6 +23,8 @@ class ConfigData(TypedDict):
 
 
 class Config(Cache[Literal["data"], ConfigData]):
+    FAVOURITES_PATH = ("data", "favourites")
+
     def __init__(self) -> None:
         super().__init__(
             "config",
@@ -40,13 +43,13 @@ class Config(Cache[Literal["data"], ConfigData]):
         if self.in_favourites(song):
             return
         self.favourites.append(song)
-        self.save()
+        self.save(("append", Config.FAVOURITES_PATH, song))
 
     def remove_favourite(self, url: str) -> None:
-        for song in self.favourites:
+        for index, song in enumerate(self.favourites):
             if song["url"] == url:
-                self.favourites.remove(song)
-                self.save()
+                self.favourites.pop(index)
+                self.save(("pop", Config.FAVOURITES_PATH, index))
                 return
 
     @property
@@ -56,7 +59,7 @@ class Config(Cache[Literal["data"], ConfigData]):
     @mute.setter
     def mute(self, value: bool):
         self["data"]["mute"] = value
-        self.save()
+        self.save(("set", ("data", "mute"), value))
 
     @property
     def loop(self):
@@ -65,7 +68,7 @@ class Config(Cache[Literal["data"], ConfigData]):
     @loop.setter
     def loop(self, value: bool):
         self["data"]["loop"] = value
-        self.save()
+        self.save(("set", ("data", "loop"), value))
 
     @property
     def volume(self):
@@ -79,7 +82,7 @@ class Config(Cache[Literal["data"], ConfigData]):
     @volume.setter
     def volume(self, value: int):
         self["data"]["volume"] = value
-        self.save()
+        self.save(("set", ("data", "volume"), value))
 
 
 class SongQueueData(TypedDict):
@@ -88,6 +91,8 @@ class SongQueueData(TypedDict):
 
 
 class SongQueue(Cache[Literal["data"], SongQueueData]):
+    QUEUE_PATH = ("data", "queue")
+
     def __init__(self) -> None:
         super().__init__(
             "song_queue",
@@ -99,6 +104,18 @@ class SongQueue(Cache[Literal["data"], SongQueueData]):
                 }
             },
         )
+        # Called after every change to the queue or the current song e.g. to reschedule prefetching
+        self.on_change: Callable[[], None] | None = None
+
+    def save(self, *changes: Op) -> None:
+        super().save(*changes)
+        if self.on_change:
+            self.on_change()
+
+    async def asave(self, *changes: Op) -> None:
+        await super().asave(*changes)
+        if self.on_change:
+            self.on_change()
 
     @property
     def current(self) -> youtube.SongMetadata | None:
@@ -108,10 +125,10 @@ class SongQueue(Cache[Literal["data"], SongQueueData]):
     def current(self, value: youtube.SongMetadata):
         for idx, song in enumerate(self.queue):
             if song["id"] == value["id"]:
-                logger.debug(f"Setting current song to {song}")
+                logger.debug("Setting current song to %s", song)
                 self.current_index = idx
                 return
-        logger.debug(f"Song {value} not found in queue")
+        logger.debug("Song %s not found in queue", value)
         raise DiscordException(f"Song {value} not found in queue")
 
     @property
@@ -121,7 +138,7 @@ class SongQueue(Cache[Literal["data"], SongQueueData]):
     @current_index.setter
     def current_index(self, value: int):
         self["data"]["current_index"] = value
-        self.save()
+        self.save(("set", ("data", "current_index"), value))
 
     @property
     def queue(self) -> list[youtube.SongMetadata]:
@@ -134,6 +151,7 @@ class SongQueue(Cache[Literal["data"], SongQueueData]):
         next_buffer = self.next
         was_current = self.queue[index]["id"] == current_buffer["id"]
         self.queue.pop(index)
+        self.save(("pop", SongQueue.QUEUE_PATH, index))
         if self.queue:
             if was_current:
                 self.current = next_buffer
@@ -141,12 +159,11 @@ class SongQueue(Cache[Literal["data"], SongQueueData]):
                 self.current = current_buffer
         else:
             self.current_index = 0
-        self.save()
 
     @queue.setter
     def queue(self, value: list[youtube.SongMetadata]):
         self["data"]["queue"] = value
-        self.save()
+        self.save(("set", SongQueue.QUEUE_PATH, value))
 
     @property
     def next_index(self) -> int:
@@ -158,7 +175,7 @@ class SongQueue(Cache[Literal["data"], SongQueueData]):
     @property
     def next(self) -> youtube.SongMetadata:
         next_song = self.queue[self.next_index]
-        self.logger.debug(f"Next song: {next_song}")
+        self.logger.debug("Next song: %s", next_song)
         return next_song
 
     @property
@@ -171,17 +188,35 @@ class SongQueue(Cache[Literal["data"], SongQueueData]):
     @property
     def previous(self) -> youtube.SongMetadata:
         previous_song = self.queue[self.previous_index]
-        self.logger.debug(f"Previous song: {previous_song}")
+        self.logger.debug("Previous song: %s", previous_song)
         return previous_song
 
     def append(self, value: youtube.SongMetadata) -> None:
-        if value not in self.queue:
-            self.queue = [*self.queue, value]
+        self.extend([value])
 
-    def extend(self, value: list[youtube.SongMetadata]) -> None:
+    def extend(self, value: list[youtube.SongMetadata]) -> list[youtube.SongMetadata]:
+        """The songs that weren't already queued are appended and returned"""
         missing = [song for song in value if song not in self.queue]
         if missing:
-            self.queue = [*self.queue, *missing]
+            self.queue.extend(missing)
+            self.save(*(("append", SongQueue.QUEUE_PATH, song) for song in missing))
+        return missing
+
+    def remove_ids(self, ids: set[str]) -> None:
+        """Remove the songs with these ids except the current one"""
+        current = self.current
+        queue = [
+            song
+            for song in self.queue
+            if song["id"] not in ids or (current and song["id"] == current["id"])
+        ]
+        if len(queue) == len(self.queue):
+            return
+        self.queue = queue
+        if current:
+            self.current = current
+        else:
+            self.current_index = 0
 
     def clear(self) -> None:
         self.logger.debug("Clearing queue")
@@ -194,8 +229,8 @@ class SongQueue(Cache[Literal["data"], SongQueueData]):
         if not current_buffer:
             return
         random.shuffle(self.queue)
+        self.save(("set", SongQueue.QUEUE_PATH, self.queue))
         self.current = current_buffer
-        self.save()
 
     def __contains__(self, value: youtube.SongMetadata) -> bool:
         return youtube.list_contains_song(self.queue, value)
@@ -214,16 +249,20 @@ class SearchResults(Cache[Literal["data"], list[youtube.SongMetadata]]):
             return None
 
     def extend(self, value: list[youtube.SongMetadata]) -> None:
+        if not value:
+            return
         self["data"].extend(value)
-        self.save()
+        self.save(*(("append", ("data",), song) for song in value))
 
     def append(self, value: youtube.SongMetadata) -> None:
         self["data"].append(value)
-        self.save()
+        self.save(("append", ("data",), value))
 
-    def save(self) -> None:
-        self.data["data"] = self["data"][-SearchResults.max_results :]
-        super().save()
+    def save(self, *changes: Op) -> None:
+        if (excess := len(self["data"]) - SearchResults.max_results) > 0:
+            del self["data"][:excess]
+            changes = (*changes, *[("pop", ("data",), 0)] * excess)
+        super().save(*changes)
 
 
 class UrlMappingEntry(TypedDict):
@@ -247,7 +286,7 @@ class UrlMapping(Cache[Literal["data"], dict[str, UrlMappingEntry]]):
         for key in expired_keys:
             del self["data"][key]
         if expired_keys:
-            self.save()
+            self.save(*(("del", ("data", key)) for key in expired_keys))
     
     def create_hash(self, url: str) -> str:
         """Create a hash for the URL and store the mapping"""
@@ -257,7 +296,7 @@ class UrlMapping(Cache[Literal["data"], dict[str, UrlMappingEntry]]):
             "url": url,
             "timestamp": time.time()
         }
-        self.save()
+        self.save(("set", ("data", url_hash), self["data"][url_hash]))
         return url_hash
     
     def get_url(self, url_hash: str) -> str | None:
@@ -265,3 +304,9 @@ class UrlMapping(Cache[Literal["data"], dict[str, UrlMappingEntry]]):
         self._cleanup_expired()
         entry = self["data"].get(url_hash)
         return entry["url"] if entry else None
+
+
+config = Config()
+song_queue = SongQueue()
+search_results = SearchResults()
+url_mapping = UrlMapping()
@@ -44,6 +44,8 @@ class ButtonID:
     queue_rx = re.compile("queue-(.*)")
     favourite_rx = re.compile("favourite-(.*)")
     unfavourite_rx = re.compile("unfavourite-(.*)")
+    cancel_playlist_rx = re.compile("cancel_playlist-(.*)")
+    more_rx = re.compile("more-(.*)")
     pause = "pause"
     resume = "resume"
     loop = "loop"
@@ -1,21 +1,15 @@
-from typing import TYPE_CHECKING
 import interactions
-import ytmusicbot.youtube as youtube
+import ytmusicbot.youtube.aio as youtube
 from ytmusicbot.common.main import logger
 from ytmusicbot.discord.common import ButtonID
-from ytmusicbot.discord.caches import UrlMapping
+from ytmusicbot.discord.caches import Config, url_mapping
 from interactions.api.voice.player import Player
 
-if TYPE_CHECKING:
-    from ytmusicbot.discord.logic import Config
-
-url_mapping = UrlMapping()
-
 
 def song_embed_component(
     song: youtube.SongMetadata | youtube.SongMetadata,
 ) -> interactions.Embed:
-    logger.debug(f"Embedding {song}")
+    logger.debug("Embedding %s", song)
     return interactions.Embed(
         title=song["title"],
         url=song["url"],
@@ -90,6 +84,24 @@ def queue_button(url: str) -> interactions.Button:
     )
 
 
+def cancel_playlist_button(ingest_id: str) -> interactions.Button:
+    return interactions.Button(
+        style=interactions.ButtonStyle.DANGER,
+        label="CANCEL",
+        emoji="✖️",
+        custom_id=f"cancel_playlist-{ingest_id}",
+    )
+
+
+def more_results_button(session_id: str) -> interactions.Button:
+    return interactions.Button(
+        style=interactions.ButtonStyle.SECONDARY,
+        label="More results",
+        emoji="🔎",
+        custom_id=f"more-{session_id}",
+    )
+
+
 def increase_volume_button() -> interactions.Button:
     return interactions.Button(
         style=interactions.ButtonStyle.PRIMARY,
@@ -150,7 +162,7 @@ def unfavourite_button(url: str) -> interactions.Button:
     )
 
 
-def volume_control_component(config: "Config"):
+def volume_control_component(config: Config):
     volume_bar = generate_volume_bar(config.volume, 15)
     volume_emoji = "🔊"
     if config.volume <= 0:
@@ -178,7 +190,7 @@ def generate_volume_bar(volume: int, length: int = 10) -> str:
 def now_playing_component(
     song: youtube.SongMetadata,
     player: Player | None,
-    config: "Config",
+    config: Config,
     footer="Now playing",
 ) -> tuple[interactions.Embed, list[interactions.Button]]:
     is_paused = player and player.paused
@@ -0,0 +1,73 @@
+import itertools
+from typing import AsyncGenerator
+from ytmusicbot.discord.common import logger
+import ytmusicbot.youtube.aio as youtube
+
+logger = logger.getChild("ingest")
+# Songs queued at a time, a playlist page is 100 songs
+INGEST_BATCH_SIZE = 50
+ingest_ids = itertools.count(1)
+# Playlists still being queued by id
+ingests: dict[str, "PlaylistIngest"] = {}
+# Bumped whenever the queue is replaced so refreshes of cached playlists don't touch the new queue
+generation = 0
+
+
+class PlaylistIngest:
+    """The rest of a playlist being queued in the background after its first song"""
+
+    def __init__(
+        self,
+        url: str,
+        songs: AsyncGenerator[list[youtube.SongMetadata], None],
+        generation: int,
+    ) -> None:
+        """generation is the one the playlist's first song was fetched in"""
+        self.id = str(next(ingest_ids))
+        self.url = url
+        self.songs = songs
+        self.generation = generation
+        # The first song is queued before the ingest starts
+        self.queued = 1
+        self.cancelled = False
+        self.finished = False
+        # Registered before anything is awaited so cancel_all can't miss it
+        ingests[self.id] = self
+
+    def cancel(self) -> None:
+        self.cancelled = True
+
+    @property
+    def stopped(self) -> bool:
+        return self.cancelled or self.generation != generation
+
+    async def close(self) -> None:
+        if ingests.pop(self.id, None) is None:
+            return
+        if not self.finished:
+            logger.debug("Stopped queueing %s after %d songs", self.url, self.queued)
+            await self.songs.aclose()
+
+    async def batches(self) -> AsyncGenerator[list[youtube.SongMetadata], None]:
+        """
+        The next songs of the playlist fetched off the event loop,
+        cancelling stops it once the page being fetched arrives
+        """
+        try:
+            while not self.stopped:
+                if not (batch := await anext(self.songs, None)):
+                    self.finished = True
+                    return
+                if self.stopped:
+                    return
+                self.queued += len(batch)
+                yield batch
+        finally:
+            await self.close()
+
+
+def cancel_all() -> None:
+    global generation
+    generation += 1
+    for ingest in ingests.values():
+        ingest.cancel()
@@ -1,9 +1,8 @@
 import asyncio
-import json
+from concurrent.futures import Future
 import os
-from pathlib import Path
 import random
-import threading
+import time
 from typing import cast
 import interactions
 from interactions.api.voice.audio import AudioVolume
@@ -15,27 +14,55 @@ from ytmusicbot.discord.common import (
     bot_restarted,
 )
 from ytmusicbot.discord.components import (
+    cancel_playlist_button,
+    more_results_button,
     play_button,
     queue_button,
     song_embed_component,
     now_playing_component,
     volume_control_component,
 )
-from ytmusicbot.discord.caches import Config, SearchResults, SongQueue, UrlMapping
-import ytmusicbot.youtube as youtube
-from ytmusicbot.common.main import REPO, CREATOR_NAME, CREATOR_DISCORD_CHAT_URL, Cache
+from ytmusicbot.discord.caches import config, search_results, song_queue, url_mapping
+import ytmusicbot.discord.prefetch as prefetch
+import ytmusicbot.discord.ingest as ingest
+import ytmusicbot.discord.search_sessions as search_sessions
+from ytmusicbot.discord.audio import ProgressiveAudio, StreamAudio, file_audio
+import ytmusicbot.youtube.aio as youtube
+from ytmusicbot.common.main import (
+    REPO,
+    CREATOR_NAME,
+    CREATOR_DISCORD_CHAT_URL,
+    Cache,
+)
 from interactions.ext.paginators import Paginator, Page
 
-from ytmusicbot.youtube.main import SongMetadata
-
 
 player: Player | None = None
-config = Config()
-song_queue = SongQueue()
-search_results = SearchResults()
-url_mapping = UrlMapping()
+# Bumped on every request to play a song so a slow download can't override a newer request
+playback_requests = 0
+# Volume multiplier that brings the current song to the target loudness
+song_gain = 1.0
 discord_msg_limit = int(os.getenv("DISCORD_MSG_LIMIT", 2000))
 PAGINATOR_PAGE_SIZE = 1500
+# Seconds a stream has to start producing audio before falling back to downloading
+STREAM_START_TIMEOUT = 10
+# Seconds between edits of a playlist's progress message, edits are rate limited
+INGEST_PROGRESS_INTERVAL = 3
+
+
+def pinned_song_ids() -> set[str]:
+    """The current song, the prefetched songs around it and the favourites are never evicted from the downloads"""
+    ids = {song["id"] for song in config.favourites}
+    if song_queue.current:
+        ids.update(
+            (song_queue.current["id"], song_queue.next["id"], song_queue.previous["id"])
+        )
+        ids.update(song["id"] for song in prefetch.lookahead())
+    return ids
+
+
+youtube.set_pinned_downloads(pinned_song_ids)
+song_queue.on_change = prefetch.schedule
 
 
 async def send(
@@ -52,17 +79,24 @@ async def send(
         page_1 = paginator.pages[0]
         page_1_debug = page_1.content[:100] if isinstance(page_1, Page) else page_1
 
-        logger.debug(f"Sending paginator {page_1_debug=}")
+        logger.debug("Sending paginator page_1_debug=%r", page_1_debug)
         await paginator.send(ctx)
     elif (
         not ctx.responded
         and isinstance(ctx, interactions.ComponentContext)
         and components
     ):
-        logger.debug(f"Editing origin {content_debug=} {embed=} {components=}")
+        logger.debug(
+            "Editing origin content_debug=%r embed=%r components=%r",
+            content_debug,
+            embed,
+            components,
+        )
         await ctx.edit_origin(content=content, embed=embed, components=components)
     else:
-        logger.debug(f"Sending {content} {embed=} {components=}")
+        logger.debug(
+            "Sending %s embed=%r components=%r", content, embed, components
+        )
         await ctx.send(
             content=content,
             embed=embed,
@@ -82,22 +116,53 @@ async def search(
     max_results: int,
     include_playlists: bool,
 ):
-    logger.debug(f"Searching for {query}")
-    results = youtube.search(query)
-    if not results:
-        await send(ctx, "No results found")
+    logger.debug("Searching for %s", query)
+    try:
+        session = await search_sessions.start(query, max_results, include_playlists)
+    except youtube.YoutubeException as e:
+        await send_error(ctx, e)
+        return
+    await send_search_results(ctx, session)
+
+
+async def more_results(ctx: interactions.InteractionContext, session_id: str):
+    logger.debug("More results for search %s", session_id)
+    if isinstance(ctx, interactions.ComponentContext):
+        await remove_clicked_button(ctx)
+    session = search_sessions.get(session_id)
+    if not session:
+        await send(ctx, "This search expired, search again for more results")
+        return
+    await send_search_results(ctx, session)
 
-    if include_playlists:
-        all_video_results = results
-    else:
-        all_video_results: list[SongMetadata] = []
-        for result in results:
-            _, is_playlist = youtube.get_id(result["url"])
-            if not is_playlist:
-                all_video_results.append(result)
-    if not all_video_results:
-        await send(ctx=ctx, content="No results found")
-    video_results = all_video_results[:max_results]
+
+async def remove_clicked_button(ctx: interactions.ComponentContext):
+    """
+    Responds by editing the clicked message so the results after it are sent
+    as new messages, its other buttons keep working
+    """
+    if ctx.responded or ctx.deferred or not ctx.message:
+        return
+    components = [
+        component
+        for row in ctx.message.components or []
+        for component in row.components
+        if getattr(component, "custom_id", None) != ctx.custom_id
+    ]
+    await ctx.edit_origin(components=components)
+
+
+async def send_search_results(
+    ctx: interactions.InteractionContext, session: search_sessions.SearchSession
+):
+    try:
+        video_results = await session.next_results()
+    except youtube.YoutubeException as e:
+        await send_error(ctx, e)
+        return
+    if not video_results:
+        await send(ctx, "No more results found" if session.shown else "No results found")
+        return
 
     search_results.extend(video_results)
     for result in video_results:
@@ -105,6 +170,8 @@ async def search(
         url_mapping.create_hash(url)
         embed = song_embed_component(result)
         components = [play_button(url), queue_button(url)]
+        if result is video_results[-1] and session.has_more:
+            components.append(more_results_button(session.id))
         await send(ctx, embed=embed, components=components)
 
 
@@ -134,9 +201,6 @@ async def handle_next_song(ctx: interactions.InteractionContext):
     if not player:
         return
     player_buffer = player
-    download_then_play_thread(
-        song_queue.next, ctx, asyncio.get_running_loop(), only_download=True
-    )
     await player_buffer._stopped.wait()
     if player_buffer != player:
         logger.debug("Player changed")
@@ -145,12 +209,7 @@ async def handle_next_song(ctx: interactions.InteractionContext):
         logger.debug("Looping")
         if not song_queue.current:
             return
-        download_then_play_thread(
-            song_queue.current,
-            ctx,
-            asyncio.get_running_loop(),
-            user_invoked=False,
-        )
+        download_then_play(song_queue.current, ctx, user_invoked=False)
     else:
         await next_(ctx, user_invoked=False)
 
@@ -158,11 +217,12 @@ async def handle_next_song(ctx: interactions.InteractionContext):
 async def play_song_in_voice_channel(
     ctx: interactions.InteractionContext,
     song: youtube.SongMetadata,
-    file_path: Path,
+    audio: AudioVolume,
     user_invoked=True,
+    gain=1.0,
 ):
-    logger.debug(f"Playing {file_path}")
-    global player
+    logger.debug("Playing %r", audio)
+    global player, song_gain
     if player:
         await stop_player(False)
     if isinstance(ctx.author, interactions.User):
@@ -175,7 +235,7 @@ async def play_song_in_voice_channel(
         if player and player.state.connected:
             if user_invoked:
                 logger.debug(
-                    f"Telling author to join {player.state.channel.name} voice channel"
+                    "Telling author to join %s voice channel", player.state.channel.name
                 )
                 await send(
                     ctx,
@@ -192,16 +252,17 @@ async def play_song_in_voice_channel(
         return
 
     voice_state = await author_voice_state.channel.connect()
-    logger.debug(f"Voice state {voice_state}")
+    logger.debug("Voice state %s", voice_state)
 
     song_queue.current = song
-    logger.debug(f"Current song: {song_queue.current}")
-    audio = AudioVolume(file_path)
-    logger.debug(f"Volume audio: {config.volume_audio}")
+    song_gain = gain
+    logger.debug("Current song: %s", song_queue.current)
+    logger.debug("Volume audio: %s", config.volume_audio)
     await stop_player(disconnect=False)
     voice_state = ctx.voice_state
     player = Player(audio=audio, v_state=voice_state, loop=asyncio.get_running_loop())
     player.play()
+    youtube.record_play(song["id"])
     asyncio.create_task(handle_next_song(ctx))
     # Volume can only be set after the player is playing for some reason
     set_player_current_audio_volume()
@@ -209,20 +270,8 @@ async def play_song_in_voice_channel(
 
 
 def append_to_queue(ctx: interactions.InteractionContext, song: youtube.SongMetadata):
+    # Prefetching the song if it's within the lookahead is rescheduled by the queue change
     song_queue.append(song)
-    if not song_queue.current:
-        return
-    if (
-        song_queue.current["id"] != song_queue.next["id"]
-        and song_queue.next["id"] == song["id"]
-    ):
-        download_then_play_thread(
-            song_queue.next,
-            ctx,
-            asyncio.get_running_loop(),
-            user_invoked=False,
-            only_download=True,
-        )
 
 
 async def load_title_or_url(
@@ -233,9 +282,10 @@ async def load_title_or_url(
 ):
     if should_defer:
         await defer(ctx)
+    await youtube.wait_until_warm()
     id, is_playlist = youtube.get_id(title_or_url)
     if not id:
-        results = youtube.search(title_or_url, max_results=1)
+        results = await youtube.search(title_or_url, max_results=1)
         if not results:
             await send(ctx, f'No results found for "{title_or_url}"')
             return
@@ -244,58 +294,133 @@ async def load_title_or_url(
         id, is_playlist = youtube.get_id(title_or_url)
         if not id:
             raise DiscordException(f"Invalid url {title_or_url}")
-    if is_playlist:
+    if is_playlist and (cached := await youtube.get_cached_playlist(title_or_url)):
+        logger.debug("Queueing %d cached songs of %s", len(cached), title_or_url)
+        # Songs that were queued before the playlist aren't the playlist's to remove
+        queued = song_queue.extend(cached[:1])
+        yield cached[0]
+        queued += song_queue.extend(cached[1:])
+        if should_show_queue:
+            await show_queue(ctx)
+        queued_ids = {song["id"] for song in queued}
+        asyncio.create_task(refresh_queued_playlist(ctx, title_or_url, queued_ids))
+    elif is_playlist:
+        generation = ingest.generation
+        batches = youtube.get_songs_in_playlist(
+            title_or_url, ingest.INGEST_BATCH_SIZE
+        )
         try:
-            for idx, sm in enumerate(youtube.get_songs_in_playlist(title_or_url)):
-                logger.debug(f"Appending {sm}")
-                append_to_queue(ctx, sm)
-                if idx == 0:
-                    yield sm
+            # Only the first song is waited for, the rest is queued in the background
+            [song] = await anext(batches)
         except youtube.YoutubeException as e:
             await send_error(ctx, e)
-        else:
-            if should_show_queue:
-                await show_queue(ctx)
+            return
+        logger.debug("Appending %s", song)
+        append_to_queue(ctx, song)
+        yield song
+        if should_show_queue:
+            await show_queue(ctx)
+        playlist = ingest.PlaylistIngest(title_or_url, batches, generation)
+        asyncio.create_task(ingest_playlist(ctx, playlist))
 
     else:
         song = search_results.get(id)
         if not song:
             try:
-                song = youtube.get_song_metadata(title_or_url)
+                song = await youtube.get_song_metadata(title_or_url)
                 search_results.append(song)
             except youtube.YoutubeException as e:
                 await send_error(ctx, e)
                 return
         append_to_queue(ctx, song)
-        logger.debug(f"Added {song} to queue")
+        logger.debug("Added %s to queue", song)
         yield song
         if should_show_queue:
             embed = song_embed_component(song).set_footer(text="Queued")
             await send(ctx, embed=embed)
 
 
+def ingest_progress(playlist: ingest.PlaylistIngest) -> str:
+    return f"Queueing the rest of the playlist, {playlist.queued} songs so far"
+
+
+async def ingest_playlist(
+    ctx: interactions.InteractionContext, playlist: ingest.PlaylistIngest
+):
+    try:
+        message = await ctx.send(
+            ingest_progress(playlist), components=[cancel_playlist_button(playlist.id)]
+        )
+    except Exception:
+        await playlist.close()
+        raise
+    last_update = time.perf_counter()
+    try:
+        async for songs in playlist.batches():
+            song_queue.extend(songs)
+            if time.perf_counter() - last_update >= INGEST_PROGRESS_INTERVAL:
+                last_update = time.perf_counter()
+                await message.edit(content=ingest_progress(playlist))
+    except youtube.YoutubeException as e:
+        await send_error(ctx, e)
+    if playlist.finished:
+        content = f"Queued all {playlist.queued} songs of the playlist"
+    else:
+        content = f"Stopped queueing the playlist after {playlist.queued} songs"
+    await message.edit(content=content, components=[])
+
+
+async def refresh_queued_playlist(
+    ctx: interactions.InteractionContext, url: str, queued_ids: set[str]
+):
+    """Apply the changes to a playlist since it was cached to the songs it queued"""
+    generation = ingest.generation
+    try:
+        added, removed = await youtube.refresh_playlist(url)
+    except youtube.YoutubeException as e:
+        logger.warning("Failed to refresh %s: %s", url, e)
+        return
+    if generation != ingest.generation:
+        logger.debug("Not updating the queue with %s, it was replaced", url)
+        return
+    removed &= queued_ids
+    if not added and not removed:
+        return
+    song_queue.remove_ids(removed)
+    song_queue.extend(added)
+    await send(
+        ctx,
+        f"The playlist changed since it was last loaded, queued {len(added)} new songs and removed {len(removed)}",
+    )
+
+
+async def cancel_playlist(ctx: interactions.InteractionContext, ingest_id: str):
+    logger.debug("Cancel playlist %s", ingest_id)
+    if playlist := ingest.ingests.get(ingest_id):
+        playlist.cancel()
+        await send(ctx, "Stopping queueing the playlist", ephemeral=True)
+    else:
+        await send(ctx, "The playlist is no longer being queued", ephemeral=True)
+
+
 async def play(title_or_url: str, ctx: interactions.InteractionContext):
-    logger.debug(f"Play {title_or_url}")
+    logger.debug("Play %s", title_or_url)
     await clear_queue(ctx, is_user_invoked=False, disconnect_player=False)
     is_first = True
     async for song in load_title_or_url(title_or_url, ctx, should_show_queue=False):
         if is_first:
             is_first = False
-            download_then_play_thread(
-                song,
-                ctx,
-                asyncio.get_running_loop(),
-            )
+            download_then_play(song, ctx)
 
 
 async def queue(title_or_url: str, ctx: interactions.InteractionContext):
-    logger.debug(f"Queue {title_or_url}")
+    logger.debug("Queue %s", title_or_url)
     async for _ in load_title_or_url(title_or_url, ctx, should_show_queue=True):
         pass
 
 
 async def favourite(url: str, ctx: interactions.InteractionContext):
-    logger.debug(f"Favourite {url}")
+    logger.debug("Favourite %s", url)
     async for song in load_title_or_url(
         url, ctx, should_show_queue=False, should_defer=False
     ):
@@ -304,7 +429,7 @@ async def favourite(url: str, ctx: interactions.InteractionContext):
 
 
 async def unfavourite(url: str, ctx: interactions.InteractionContext):
-    logger.debug(f"Unfavourite {url}")
+    logger.debug("Unfavourite %s", url)
     config.remove_favourite(url)
     await now_playing(ctx)
 
@@ -337,7 +462,7 @@ async def play_favourites(ctx: interactions.InteractionContext):
         append_to_queue(ctx, song)
     if not song_queue.current:
         return
-    download_then_play_thread(song_queue.current, ctx, asyncio.get_running_loop())
+    download_then_play(song_queue.current, ctx)
 
 
 async def pause(ctx: interactions.InteractionContext):
@@ -364,11 +489,7 @@ async def resume(ctx: interactions.InteractionContext):
             player.resume()
         else:
             await defer(ctx)
-            download_then_play_thread(
-                song_queue.current,
-                ctx,
-                asyncio.get_running_loop(),
-            )
+            download_then_play(song_queue.current, ctx)
             return
     else:
         await send(ctx, "Queue is empty")
@@ -387,7 +508,7 @@ def set_player_current_audio_volume():
     global player
     if player and player.current_audio:
         player.current_audio = cast(AudioVolume, player.current_audio)
-        player.current_audio.volume = config.volume_audio
+        player.current_audio.volume = config.volume_audio * song_gain
 
 
 async def set_volume(ctx: interactions.InteractionContext, volume: int):
@@ -435,8 +556,7 @@ async def unmute(ctx: interactions.InteractionContext):
         await send(ctx, "Already unmuted")
         return
     config.mute = False
-    if player and player.current_audio:
-        player.current_audio.volume = config.volume_audio  # type: ignore
+    set_player_current_audio_volume()
     await send_volume_control(ctx)
 
 
@@ -446,14 +566,9 @@ async def next_(ctx: interactions.InteractionContext, user_invoked=True):
         if user_invoked:
             await send(ctx, "No song in queue")
         return
-    if user_invoked and not youtube.downloads.get(song_queue.next["id"]):
+    if user_invoked and not await youtube.get_download(song_queue.next["id"]):
         await defer(ctx)
-    download_then_play_thread(
-        song_queue.next,
-        ctx,
-        asyncio.get_running_loop(),
-        user_invoked=user_invoked,
-    )
+    download_then_play(song_queue.next, ctx, user_invoked=user_invoked)
 
 
 async def previous(ctx: interactions.InteractionContext):
@@ -461,13 +576,9 @@ async def previous(ctx: interactions.InteractionContext):
     if not song_queue.current:
         await send(ctx, "No song in queue")
         return
-    if not youtube.downloads.get(song_queue.previous["id"]):
+    if not await youtube.get_download(song_queue.previous["id"]):
         await defer(ctx)
-    download_then_play_thread(
-        song_queue.previous,
-        ctx,
-        asyncio.get_running_loop(),
-    )
+    download_then_play(song_queue.previous, ctx)
 
 
 async def stop_player(disconnect: bool):
@@ -491,6 +602,8 @@ async def clear_queue(
         await send(ctx, "Queue is empty")
         return
     await stop_player(disconnect_player)
+    # A playlist still being queued would fill the cleared queue back up
+    ingest.cancel_all()
     song_queue.clear()
     if is_user_invoked:
         await send(ctx, "Queue cleared")
@@ -564,7 +677,7 @@ async def is_valid_song_number(
 
 
 async def dequeue(ctx: interactions.InteractionContext, song_number: int):
-    logger.debug(f"Dequeue {song_number}")
+    logger.debug("Dequeue %s", song_number)
     if not song_queue.current:
         await send(ctx, "No song in queue")
         return
@@ -642,17 +755,20 @@ async def creator(ctx: interactions.InteractionContext):
 async def reset_cache(ctx: interactions.InteractionContext):
     logger.debug("Reset cache")
     await stop_player(True)
-    for cache in Cache.all:
-        logger.debug(f"Resetting {cache.name}")
+    ingest.cancel_all()
+    for cache in Cache.all.values():
+        logger.debug("Resetting %s", cache.name)
         await owner_send(ctx, f"Resetting {cache.name}")
-        cache.reset()
+        await cache.areset()
     await owner_send(ctx, "Successfully reset all caches")
 
 
 async def metrics(ctx: interactions.InteractionContext):
     logger.debug("Metrics")
-    folder_metrics = youtube.download_folder_metrics()
-    content = f"Downloads folder size: {folder_metrics.size_mbs:.2f} MB\nSize limit: {folder_metrics.size_limit_mbs} MB\nTotal downloads: {folder_metrics.total_downloads}"
+    folder_metrics = await youtube.download_folder_metrics()
+    pool_metrics = youtube.download_pool.metrics()
+    content = f"Downloads folder size: {folder_metrics.size_mbs:.2f} MB\nSize limit: {folder_metrics.size_limit_mbs} MB\nTotal downloads: {folder_metrics.total_downloads}\nEviction policy: {folder_metrics.eviction_policy}\nCache hit ratio: {folder_metrics.hit_ratio:.1%} ({folder_metrics.cache_hits} hits, {folder_metrics.cache_misses} misses)"
+    content += f"\nDownload workers: {pool_metrics.workers}\nQueued downloads: {pool_metrics.queue_depth}\nActive downloads: {pool_metrics.active_jobs}\nDownload wait: {pool_metrics.average_wait:.2f}s average, {pool_metrics.max_wait:.2f}s max"
     await owner_send(
         ctx,
         content=content,
@@ -660,7 +776,7 @@ async def metrics(ctx: interactions.InteractionContext):
 
 
 async def skip_to(ctx: interactions.InteractionContext, song_number: int):
-    logger.debug(f"Skip to {song_number}")
+    logger.debug("Skip to %s", song_number)
     if not song_queue.current:
         await send(ctx, "No song in queue")
         return
@@ -674,16 +790,17 @@ async def skip_to(ctx: interactions.InteractionContext, song_number: int):
 async def random_(ctx: interactions.InteractionContext):
     logger.debug("Random")
     await defer(ctx)
-    all_songs: list[youtube.SongMetadata] = []
-    for file in youtube.randoms_songs_dir.iterdir():
-        with open(file, "r") as f:
-            songs = json.load(f)
-            all_songs.extend(songs)
+    try:
+        all_songs = await youtube.get_random_songs()
+    except youtube.YoutubeException as e:
+        await send_error(ctx, e)
+        return
     if not all_songs:
         await send(ctx, "No random songs available")
         return
     random.shuffle(all_songs)
     songs = all_songs[:50]
+    ingest.cancel_all()
     song_queue.clear()
     song_queue.extend(songs)
     search_results.extend(songs)
@@ -695,6 +812,7 @@ async def stop_bot(ctx: interactions.InteractionContext):
     logger.debug("Stop bot")
     await owner_send(ctx, "Stopping bot")
     await stop_player(True)
+    await Cache.aflush_all()
     await bot.stop()
 
 
@@ -706,33 +824,171 @@ async def restart_bot(ctx: interactions.InteractionContext):
     await stop_bot(ctx)
 
 
-def download_then_play_thread(
+def download_then_play(
     song: youtube.SongMetadata,
     ctx: interactions.InteractionContext,
-    event_loop: asyncio.AbstractEventLoop,
-    only_download=False,
     user_invoked=True,
 ):
-    def thread_func():
-        nonlocal song
-        try:
-            file_path, song = youtube.download_single(song["url"], song["id"])
-        except youtube.YoutubeException as e:
-            asyncio.run_coroutine_threadsafe(
-                send_error(ctx, e),
-                event_loop,
+    """
+    Play the song from the downloads, streaming it if PLAYBACK_MODE says so or queueing
+    its download on the download pool ahead of prefetches
+    """
+    global playback_requests
+    playback_requests += 1
+    # Only the latest song to play is still relevant
+    youtube.download_pool.cancel_queued(
+        youtube.DownloadPriority.PLAYBACK, keep=(song["id"],)
+    )
+    asyncio.create_task(play_or_download(song, ctx, playback_requests, user_invoked))
+
+
+async def play_or_download(
+    song: youtube.SongMetadata,
+    ctx: interactions.InteractionContext,
+    playback_request: int,
+    user_invoked: bool,
+):
+    try:
+        # Downloaded songs don't wait behind prefetches for a download worker
+        downloaded = await youtube.get_downloaded(song["id"])
+        stream = not downloaded and await youtube.should_stream(song["id"])
+    except youtube.YoutubeException as e:
+        await send_error(ctx, e)
+        return
+    if downloaded:
+        if playback_request != playback_requests:
+            logger.debug("Not playing %s, another song was requested", song["id"])
+            return
+        await play_downloaded(ctx, downloaded, user_invoked)
+    elif stream:
+        await stream_then_play(song, ctx, playback_request, user_invoked)
+    else:
+        queue_download_then_play(song, ctx, playback_request, user_invoked)
+
+
+async def stream_then_play(
+    song: youtube.SongMetadata,
+    ctx: interactions.InteractionContext,
+    playback_request: int,
+    user_invoked: bool,
+):
+    loop = asyncio.get_running_loop()
+    try:
+        stream_url, song = await youtube.resolve_stream(song["url"], song["id"])
+        audio = StreamAudio(stream_url)
+        if not await loop.run_in_executor(None, audio.start, STREAM_START_TIMEOUT):
+            raise youtube.YoutubeException(
+                f"Failed to open the stream of {song['url']}"
             )
-        else:
-            if not only_download:
-                asyncio.run_coroutine_threadsafe(
-                    play_song_in_voice_channel(
-                        ctx,
-                        song,
-                        file_path=file_path,
-                        user_invoked=user_invoked,
-                    ),
-                    event_loop,
-                )
+    except youtube.YoutubeException as e:
+        logger.warning(
+            "Streaming %s failed, downloading it instead: %s", song["id"], e
+        )
+        youtube.invalidate_stream(song["id"])
+        if playback_request == playback_requests:
+            queue_download_then_play(song, ctx, playback_request, user_invoked)
+        return
+    if playback_request != playback_requests:
+        logger.debug("Not playing %s, another song was requested", song["id"])
+        audio.cleanup()
+        return
+    logger.debug("Streaming %s", song["id"])
+    await play_song_in_voice_channel(ctx, song, audio, user_invoked=user_invoked)
+
+
+def queue_download_then_play(
+    song: youtube.SongMetadata,
+    ctx: interactions.InteractionContext,
+    playback_request: int,
+    user_invoked: bool,
+):
+    progress: youtube.DownloadProgress | None = None
+    # Watched before submitting so the progress can't miss the end of the download,
+    # the song was found not to be downloaded before it was queued
+    if youtube.progressive_playback:
+        progress = youtube.download_progress.watch(song["id"])
+    future = youtube.download_pool.submit(
+        song["url"], song["id"], youtube.DownloadPriority.PLAYBACK
+    )
+    if progress:
+        future.add_done_callback(
+            lambda future: youtube.download_progress.unwatch(
+                song["id"], failed=future.cancelled() or future.exception() is not None
+            )
+        )
+    asyncio.create_task(
+        play_when_downloaded(
+            future, ctx, song, progress, playback_request, user_invoked
+        )
+    )
+
+
+async def play_when_downloaded(
+    future: Future[youtube.DownloadResponse],
+    ctx: interactions.InteractionContext,
+    song: youtube.SongMetadata,
+    progress: youtube.DownloadProgress | None,
+    playback_request: int,
+    user_invoked: bool,
+):
+    download = asyncio.wrap_future(future)
+    if progress:
+        # Start playing from the partial file as soon as enough of it is buffered
+        buffered = asyncio.get_running_loop().run_in_executor(
+            None,
+            progress.wait_until_buffered,
+            youtube.progressive_playback_buffer_bytes,
+        )
+        await asyncio.wait((download, buffered), return_when=asyncio.FIRST_COMPLETED)
+        if not download.done() and await buffered:
+            if playback_request != playback_requests:
+                logger.debug("Not playing %s, another song was requested", song["id"])
+                return
+            logger.debug("Progressively playing %s", song["id"])
+            await play_song_in_voice_channel(
+                ctx, song, ProgressiveAudio(progress), user_invoked=user_invoked
+            )
+            try:
+                await download
+            except asyncio.CancelledError:
+                pass
+            except youtube.YoutubeException as e:
+                await send_error(ctx, e)
+            return
+    try:
+        downloaded = await download
+    except asyncio.CancelledError:
+        logger.debug("Download cancelled")
+        return
+    except youtube.YoutubeException as e:
+        await send_error(ctx, e)
+        return
+    if playback_request != playback_requests:
+        logger.debug("Not playing %s, another song was requested", song["id"])
+        return
+    await play_downloaded(ctx, downloaded, user_invoked)
+
 
-    thread = threading.Thread(target=thread_func)
-    thread.start()
+async def play_downloaded(
+    ctx: interactions.InteractionContext,
+    downloaded: youtube.DownloadResponse,
+    user_invoked: bool,
+):
+    file_path, song = downloaded
+    try:
+        analysis = await youtube.get_analysis(song["id"])
+    except youtube.YoutubeException as e:
+        await send_error(ctx, e)
+        return
+    gain = (
+        youtube.gain_multiplier(analysis["gain"])
+        if analysis and youtube.loudness_normalization
+        else 1.0
+    )
+    await play_song_in_voice_channel(
+        ctx,
+        song,
+        file_audio(file_path, analysis),
+        user_invoked=user_invoked,
+        gain=gain,
+    )
@@ -0,0 +1,113 @@
+import asyncio
+from concurrent.futures import Future
+import os
+from ytmusicbot.common.main import in_event_loop
+from ytmusicbot.discord.caches import song_queue
+from ytmusicbot.discord.common import logger
+import ytmusicbot.youtube.aio as youtube
+
+logger = logger.getChild("prefetch")
+prefetch_next_songs = int(os.getenv("PREFETCH_NEXT_SONGS", "2"))
+prefetch_previous_songs = int(os.getenv("PREFETCH_PREVIOUS_SONGS", "1"))
+reschedule_pending = False
+# In-flight prefetches by video id
+prefetches: dict[str, Future[youtube.DownloadResponse]] = {}
+# Reschedules run one at a time, the lookups of one can't interleave with the next
+reschedule_lock = asyncio.Lock()
+
+
+def lookahead() -> list[youtube.SongMetadata]:
+    """
+    The songs around the current one that should be downloaded,
+    nearest first alternating between the next and previous songs
+    """
+    queue = song_queue.queue
+    if not queue:
+        return []
+    current_index = song_queue.current_index
+    songs: list[youtube.SongMetadata] = []
+    seen = {queue[current_index]["id"]}
+    for distance in range(1, max(prefetch_next_songs, prefetch_previous_songs) + 1):
+        indices: list[int] = []
+        if distance <= prefetch_next_songs:
+            indices.append((current_index + distance) % len(queue))
+        if distance <= prefetch_previous_songs:
+            indices.append((current_index - distance) % len(queue))
+        for index in indices:
+            song = queue[index]
+            if song["id"] not in seen:
+                seen.add(song["id"])
+                songs.append(song)
+    return songs
+
+
+def has_room() -> bool:
+    """Prefetching stops once eviction would have to make room for it"""
+    low_water = youtube.max_downloads_size_ibytes * youtube.downloads_low_water_ratio
+    return youtube.download_index.total_size < low_water
+
+
+async def reschedule() -> None:
+    async with reschedule_lock:
+        try:
+            await reschedule_downloads()
+        except youtube.YoutubeException as e:
+            logger.warning("Failed to prefetch: %s", e)
+
+
+async def reschedule_downloads() -> None:
+    """Queue downloads for the lookahead window and cancel the queued ones that left it"""
+    global reschedule_pending
+    reschedule_pending = False
+    songs = lookahead()
+    ids = [song["id"] for song in songs]
+    next_id = song_queue.queue[song_queue.next_index]["id"] if songs else None
+    youtube.download_pool.cancel_queued(youtube.DownloadPriority.NEXT, keep=ids)
+    youtube.download_pool.cancel_queued(youtube.DownloadPriority.PREFETCH, keep=ids)
+    for song in songs:
+        if await youtube.get_download_file(song["id"]):
+            continue
+        if await youtube.should_stream(song["id"]):
+            if song["id"] == next_id:
+                asyncio.create_task(resolve_stream(song))
+            continue
+        if not has_room():
+            logger.debug("Downloads are near the size limit, not prefetching")
+            return
+        priority = (
+            youtube.DownloadPriority.NEXT
+            if song["id"] == next_id
+            else youtube.DownloadPriority.PREFETCH
+        )
+        future = youtube.download_pool.submit(song["url"], song["id"], priority)
+        if prefetches.get(song["id"]) is not future:
+            prefetches[song["id"]] = future
+            future.add_done_callback(
+                lambda future, id=song["id"]: on_prefetch_done(id, future)
+            )
+
+
+def schedule() -> None:
+    """Reschedule once the current burst of queue changes is done e.g. loading a playlist"""
+    global reschedule_pending
+    if not in_event_loop():
+        # e.g. the queue loaded from its cache, the first change on the loop prefetches
+        return
+    if reschedule_pending:
+        return
+    reschedule_pending = True
+    asyncio.get_running_loop().call_soon(lambda: asyncio.create_task(reschedule()))
+
+
+async def resolve_stream(song: youtube.SongMetadata) -> None:
+    try:
+        await youtube.resolve_stream(song["url"], song["id"])
+    except youtube.YoutubeException as e:
+        logger.warning("Failed to resolve the stream of %s: %s", song["id"], e)
+
+
+def on_prefetch_done(id: str, future: Future[youtube.DownloadResponse]) -> None:
+    if prefetches.get(id) is future:
+        del prefetches[id]
+    if not future.cancelled() and (e := future.exception()):
+        logger.warning("Failed to prefetch %s: %s", id, e)
@@ -0,0 +1,77 @@
+import asyncio
+import os
+import secrets
+import time
+from ytmusicbot.discord.common import logger
+import ytmusicbot.youtube.aio as youtube
+
+logger = logger.getChild("search_sessions")
+# Seconds a search's "More results" button keeps working after it was last used
+search_session_ttl = int(os.getenv("SEARCH_SESSION_TTL", 15 * 60))
+sessions: dict[str, "SearchSession"] = {}
+
+
+class SearchSession:
+    """
+    A search whose results are shown a few at a time, YouTube's next page is only
+    fetched once the results already fetched have all been shown
+    """
+
+    def __init__(self, query: str, page_size: int, include_playlists: bool) -> None:
+        self.id = secrets.token_hex(6)
+        self.query = query
+        self.page_size = page_size
+        self.include_playlists = include_playlists
+        # Fetched but not shown yet
+        self.pending: list[youtube.SongMetadata] = []
+        self.seen: set[str] = set()
+        self.continuation: str | None = None
+        self.shown = 0
+        # A double click on "More results" doesn't show the same results twice
+        self.lock = asyncio.Lock()
+        self.expires_at = time.monotonic() + search_session_ttl
+
+    @property
+    def has_more(self) -> bool:
+        return bool(self.pending or self.continuation)
+
+    def add(self, page: youtube.SearchResultsPage) -> None:
+        self.continuation = page.continuation
+        for song in page.songs:
+            _, is_playlist = youtube.get_id(song["url"])
+            if song["id"] in self.seen or (is_playlist and not self.include_playlists):
+                continue
+            self.seen.add(song["id"])
+            self.pending.append(song)
+
+    async def next_results(self) -> list[youtube.SongMetadata]:
+        async with self.lock:
+            while len(self.pending) < self.page_size and self.continuation:
+                logger.debug("Fetching the next page of %r", self.query)
+                self.add(await youtube.search_more(self.continuation))
+            results = self.pending[: self.page_size]
+            del self.pending[: self.page_size]
+            self.shown += len(results)
+            self.expires_at = time.monotonic() + search_session_ttl
+            return results
+
+
+def expire() -> None:
+    now = time.monotonic()
+    for id in [id for id, session in sessions.items() if session.expires_at < now]:
+        del sessions[id]
+
+
+async def start(
+    query: str, page_size: int, include_playlists: bool
+) -> SearchSession:
+    expire()
+    session = SearchSession(query, page_size, include_playlists)
+    session.add(await youtube.search_page(query))
+    sessions[session.id] = session
+    return session
+
+
+def get(session_id: str) -> SearchSession | None:
+    expire()
+    return sessions.get(session_id)
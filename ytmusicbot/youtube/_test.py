@@ -1,8 +1,54 @@
+import asyncio
+from concurrent.futures import CancelledError
+import json
+from pathlib import Path
+import sys
+import threading
+import time
+import pytest
+import ytmusicbot.common.main as common
+from ytmusicbot.common.main import Cache
+import ytmusicbot.youtube.aio as aio
+from ytmusicbot.youtube.analysis import AnalysisException, parse_analysis
+from ytmusicbot.youtube.download_pool import DownloadPool, DownloadPriority
+from ytmusicbot.youtube.eviction import AccessLog, ARCPolicy, LFUPolicy, LRUPolicy
+from ytmusicbot.youtube.ogg_opus import (
+    OGG_PAGE_HEADER,
+    OggOpusError,
+    OggOpusReader,
+    packet_samples,
+)
+from ytmusicbot.youtube.progress import DownloadProgressTracker
+from ytmusicbot.youtube.search_client import (
+    YOUTUBE_HOST,
+    ConnectionPool,
+    SearchClient,
+    SearchException,
+    continuation_fixture_path,
+    fixture_path,
+    parse_videos,
+)
 from ytmusicbot.youtube.main import (
+    DEFAULT_STREAM_URL_LIFETIME,
+    DownloadIndex,
+    OperationTimeoutException,
+    PlaylistDiff,
+    Playlists,
+    SongMetadata,
+    SearchQueries,
+    SearchResultsPage,
+    SongMetadataCache,
+    StreamResponse,
+    cached_search,
+    cached_search_page,
+    get_playlist_id,
+    normalize_query,
+    stream_url_expiry,
     get_id,
     search,
     download_single,
     get_songs_in_playlist,
+    playlist_entries,
 )
 
 
@@ -35,6 +81,518 @@ def test_rx():
     tester(playlist_urls, are_playlists=True)
 
 
+def test_download_index(tmp_path: Path):
+    (tmp_path / "jJPMnTXl63E.webm").touch()
+    (tmp_path / "Or2sMfOcTtw.webm.part").touch()
+    (tmp_path / "pj").mkdir()
+    (tmp_path / "pj" / "pjBcnA0Aj6A.m4a").touch()
+    index = DownloadIndex(tmp_path, sharded=True, policy=LRUPolicy())
+    assert index.get("jJPMnTXl63E") == tmp_path / "jJPMnTXl63E.webm"
+    assert index.get("pjBcnA0Aj6A") == tmp_path / "pj" / "pjBcnA0Aj6A.m4a"
+    assert index.get("Or2sMfOcTtw") is None
+    assert index.shard_folder("Mvaosumc4hU") == tmp_path / "Mv"
+    index.remove("jJPMnTXl63E")
+    assert index.get("jJPMnTXl63E") is None
+
+
+def make_eviction_index(tmp_path: Path, policy) -> DownloadIndex:
+    index = DownloadIndex(tmp_path, sharded=False, policy=policy)
+    for i in range(10):
+        file = tmp_path / f"{i:011d}.webm"
+        file.write_bytes(b"0" * 100)
+        index.add(f"{i:011d}", file)
+        index.touch(f"{i:011d}", accessed=i)
+    return index
+
+
+def test_download_index_eviction(tmp_path: Path):
+    index = make_eviction_index(tmp_path, LRUPolicy())
+    assert index.total_size == 1000
+    index.touch(f"{0:011d}")
+    assert index.evict(max_size=1000, target_size=500) == []
+    evicted = index.evict(max_size=900, target_size=500, pinned={f"{1:011d}"})
+    assert [f.name for f in evicted] == [f"{i:011d}.webm" for i in range(2, 7)]
+    assert index.total_size == 500
+    assert index.get(f"{0:011d}")
+    assert index.get(f"{1:011d}")
+
+
+def test_lfu_eviction(tmp_path: Path):
+    index = make_eviction_index(tmp_path, LFUPolicy())
+    for _ in range(3):
+        index.touch(f"{0:011d}", accessed=10)
+    evicted = index.evict(max_size=900, target_size=800)
+    assert [f.name for f in evicted] == [f"{i:011d}.webm" for i in range(1, 3)]
+
+
+def test_arc_eviction(tmp_path: Path):
+    index = make_eviction_index(tmp_path, ARCPolicy())
+    # Replayed songs move to the frequent list, one-off plays are evicted first
+    for i in range(5):
+        index.touch(f"{i:011d}", accessed=10 + i)
+    evicted = index.evict(max_size=900, target_size=500)
+    assert [f.name for f in evicted] == [f"{i:011d}.webm" for i in range(5, 10)]
+    # Streamed plays of songs that aren't downloaded aren't tracked
+    index.touch(f"{10:011d}", accessed=20)
+    assert f"{10:011d}" not in index.policy.t1
+    # Playing an evicted song again is a ghost hit which grows the recent list's target
+    file = tmp_path / f"{5:011d}.webm"
+    file.write_bytes(b"0" * 100)
+    index.add(f"{5:011d}", file)
+    index.touch(f"{5:011d}", accessed=21)
+    assert index.policy.p > 0
+    assert f"{5:011d}" in index.policy.t2
+
+
+def test_access_log(tmp_path: Path):
+    access_log = AccessLog(tmp_path / "access.log", max_lines=4)
+    for accessed, id in enumerate(["a", "b", "a"]):
+        access_log.append(id, accessed)
+    assert AccessLog(access_log.file_path, 4).load() == {"a": (2, 2), "b": (1, 1)}
+    assert access_log.play_count("a") == 2
+    assert access_log.play_count("c") == 0
+    access_log.append("c", 3)
+    access_log.append("a", 4)
+    # Compacted to one line per song
+    assert len(access_log.file_path.read_text().splitlines()) == 3
+    assert AccessLog(access_log.file_path, 4).load() == {
+        "a": (4, 3),
+        "b": (1, 1),
+        "c": (3, 1),
+    }
+
+
+def test_download_pool():
+    release = threading.Event()
+    order: list[str] = []
+
+    def download(url: str, id: str):
+        release.wait()
+        order.append(id)
+        if id == "broken":
+            raise ValueError(id)
+        return id
+
+    pool = DownloadPool(1, download)
+    # Occupies the only worker so the rest queue up
+    blocker = pool.submit("", "blocker", DownloadPriority.PLAYBACK)
+    while not pool.metrics().active_jobs:
+        pass
+    prefetch = pool.submit("", "prefetch", DownloadPriority.PREFETCH)
+    stale_next = pool.submit("", "stale", DownloadPriority.NEXT)
+    next_ = pool.submit("", "next", DownloadPriority.NEXT)
+    broken = pool.submit("", "broken", DownloadPriority.PREFETCH)
+    # Asking for a queued song again shares its job and can only raise its priority
+    assert pool.submit("", "broken", DownloadPriority.PLAYBACK) is broken
+    assert pool.cancel_queued(DownloadPriority.NEXT, keep=("next",)) == 1
+    assert pool.metrics().queue_depth == 3
+    release.set()
+    assert next_.result() == "next"
+    assert prefetch.result() == "prefetch"
+    assert blocker.result() == "blocker"
+    with pytest.raises(ValueError):
+        broken.result()
+    with pytest.raises(CancelledError):
+        stale_next.result()
+    assert order == ["blocker", "broken", "next", "prefetch"]
+    metrics = pool.metrics()
+    assert metrics.queue_depth == 0
+    assert metrics.max_wait >= metrics.average_wait > 0
+
+
+def test_download_progress():
+    tracker = DownloadProgressTracker()
+    progress = tracker.watch("jJPMnTXl63E")
+    assert tracker.watch("jJPMnTXl63E") is progress
+    info = {"info_dict": {"id": "jJPMnTXl63E"}}
+    # Unwatched videos are ignored
+    tracker.hook({"status": "downloading", "info_dict": {"id": "other"}})
+    tracker.hook(
+        {
+            "status": "downloading",
+            "tmpfilename": "a.webm.part",
+            "downloaded_bytes": 10,
+            **info,
+        }
+    )
+    assert progress.tmp_path == Path("a.webm.part")
+    results: list[bool] = []
+    waiter = threading.Thread(
+        target=lambda: results.append(progress.wait_until_buffered(20))
+    )
+    waiter.start()
+    tracker.hook(
+        {
+            "status": "downloading",
+            "tmpfilename": "a.webm.part",
+            "downloaded_bytes": 30,
+            **info,
+        }
+    )
+    waiter.join()
+    assert results == [True]
+    tracker.hook({"status": "finished", **info})
+    assert progress.finished and not progress.failed
+    # Finishing before enough is buffered means playing the finished file instead
+    assert not progress.wait_until_buffered(100)
+    tracker.unwatch("jJPMnTXl63E", failed=True)
+    assert not progress.failed
+    assert tracker.watch("jJPMnTXl63E") is not progress
+
+
+def test_stream_url_expiry():
+    url = "https://rr1---sn-x.googlevideo.com/videoplayback?expire=1760000000&ei=abc&itag=251"
+    assert stream_url_expiry(url) == 1760000000
+    before = time.time()
+    assert stream_url_expiry("https://example.com/audio.webm") >= (
+        before + DEFAULT_STREAM_URL_LIFETIME
+    )
+
+
+def ogg_page(serial: int, packets: list[bytes], continued=False) -> bytes:
+    """A page holding packets, the last one is continued on the next page if continued"""
+    lacing = bytearray()
+    for i, packet in enumerate(packets):
+        lacing += b"\xff" * (len(packet) // 255)
+        if not (continued and i == len(packets) - 1):
+            lacing.append(len(packet) % 255)
+    header = OGG_PAGE_HEADER.pack(b"OggS", 0, 0, 0, serial, 0, 0, len(lacing))
+    return header + bytes(lacing) + b"".join(packets)
+
+
+def test_ogg_opus_reader(tmp_path: Path):
+    head = b"OpusHead" + bytes([1, 2]) + bytes(9)
+    # CELT 20ms frames, 1 frame per packet
+    packets = [bytes([0xFC]) + bytes([i]) * size for i, size in enumerate((3, 300, 254))]
+    long_packet = packets[1]
+    file_path = tmp_path / "song.opus"
+    file_path.write_bytes(
+        ogg_page(1, [head])
+        + ogg_page(1, [b"OpusTags" + bytes(8)])
+        + ogg_page(1, [packets[0], long_packet[:255]], continued=True)
+        + ogg_page(2, [b"another stream"])
+        + ogg_page(1, [long_packet[255:], packets[2]])
+    )
+    with OggOpusReader(file_path) as reader:
+        assert reader.channels == 2
+        assert [reader.read_packet() for _ in range(4)] == [*packets, b""]
+
+    not_opus = tmp_path / "song.webm"
+    not_opus.write_bytes(ogg_page(1, [b"OggVorbis"]))
+    with pytest.raises(OggOpusError):
+        OggOpusReader(not_opus)
+
+
+def test_packet_samples():
+    assert packet_samples(b"") == 0
+    # CELT 20ms, SILK 60ms, hybrid 10ms
+    assert packet_samples(bytes([31 << 3])) == 960
+    assert packet_samples(bytes([3 << 3])) == 2880
+    assert packet_samples(bytes([12 << 3])) == 480
+    # 2 frames and an arbitrary number of frames
+    assert packet_samples(bytes([31 << 3 | 1])) == 1920
+    assert packet_samples(bytes([17 << 3 | 3, 5])) == 5 * 240
+
+
+ANALYSIS_OUTPUT = """
+Input #0, ogg, from 'jJPMnTXl63E.opus':
+  Duration: 00:03:20.00, start: 0.007500, bitrate: 130 kb/s
+[silencedetect @ 0x1] silence_start: 0
+[silencedetect @ 0x1] silence_end: 1.25 | silence_duration: 1.25
+[silencedetect @ 0x1] silence_start: 90.5
+[silencedetect @ 0x1] silence_end: 91.5 | silence_duration: 1
+[silencedetect @ 0x1] silence_start: 196.4
+[silencedetect @ 0x1] silence_end: 200 | silence_duration: 3.6
+[Parsed_ebur128_0 @ 0x2] Summary:
+
+  Integrated loudness:
+    I:          -9.0 LUFS
+    Threshold: -19.2 LUFS
+
+  True peak:
+    Peak:        0.5 dBFS
+"""
+
+
+def test_parse_analysis():
+    analysis = parse_analysis(ANALYSIS_OUTPUT, -14, 12)
+    assert analysis == {"loudness": -9.0, "gain": -5.0, "start": 1.25, "end": 196.4}
+
+    # Turned up only as far as the peak allows
+    quiet = ANALYSIS_OUTPUT.replace("-9.0 LUFS", "-30.0 LUFS").replace(
+        "Peak:        0.5", "Peak:       -6.0"
+    )
+    assert parse_analysis(quiet, -14, 12)["gain"] == 5.0
+    no_peak = quiet.replace("-6.0 dBFS", "-20.0 dBFS")
+    assert parse_analysis(no_peak, -14, 12)["gain"] == 12
+
+    # Older ffmpeg versions don't end a silence that lasts until the end of the file
+    unended = ANALYSIS_OUTPUT.replace(
+        "[silencedetect @ 0x1] silence_end: 200 | silence_duration: 3.6\n", ""
+    )
+    assert parse_analysis(unended, -14, 12)["end"] == 196.4
+    no_silence = "\n".join(
+        line for line in ANALYSIS_OUTPUT.splitlines() if "silence" not in line
+    )
+    assert parse_analysis(no_silence, -14, 12)["start"] == 0.0
+    assert parse_analysis(no_silence, -14, 12)["end"] is None
+
+    with pytest.raises(AnalysisException):
+        parse_analysis("Duration: 00:03:20.00", -14, 12)
+
+
+def test_song_metadata_cache(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(common, "cache_dir", tmp_path)
+    monkeypatch.setattr(Cache, "all", {})
+    monkeypatch.setattr(SongMetadataCache, "max_size", 2)
+    cache = SongMetadataCache()
+
+    def song(id: str) -> SongMetadata:
+        return {
+            "id": id,
+            "title": id,
+            "url": f"https://www.youtube.com/watch?v={id}",
+            "thumbnail_url": "",
+        }
+
+    assert cache.get_valid("a") is None
+    cache.add([song("a"), song("b")])
+    assert cache.get_valid("a") == song("a")
+    # b is the least recently used
+    cache.add([song("c")])
+    assert cache.get_valid("b") is None
+    assert cache.get_valid("a") == song("a")
+    assert cache.get_valid("c") == song("c")
+
+    monkeypatch.setattr(SongMetadataCache, "lifetime", -1)
+    assert cache.get_valid("a") is None
+    assert "a" not in cache.data
+
+
+def test_playlists(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(common, "cache_dir", tmp_path)
+    monkeypatch.setattr(Cache, "all", {})
+    youtube_main = sys.modules["ytmusicbot.youtube.main"]
+    song_metadata_cache = SongMetadataCache()
+    monkeypatch.setattr(youtube_main, "song_metadata_cache", song_metadata_cache)
+    playlists = Playlists()
+    songs: list[SongMetadata] = [
+        {"id": id, "title": id, "url": id, "thumbnail_url": ""} for id in "abc"
+    ]
+
+    assert playlists.songs("PL1") is None
+    song_metadata_cache.add(songs)
+    playlists.add("PL1", songs)
+    assert playlists.songs("PL1") == songs
+    assert playlists.is_fresh("PL1")
+    monkeypatch.setattr(Playlists, "refresh_interval", 0)
+    assert not playlists.is_fresh("PL1")
+    del song_metadata_cache["b"]
+    # Served from the extractor again so the song isn't left out
+    assert playlists.songs("PL1") is None
+
+    assert get_playlist_id("https://www.youtube.com/watch?v=jJPMnTXl63E&list=PL1") == "PL1"
+    assert get_playlist_id("https://www.youtube.com/watch?v=jJPMnTXl63E") is None
+
+
+def test_normalize_query():
+    assert normalize_query("  Never Gonna   Give You Up! ") == "never gonna give you up"
+    assert normalize_query("AC/DC - Thunderstruck") == "ac dc thunderstruck"
+    assert normalize_query("Beyoncé") == "beyoncé"
+
+
+def test_cached_search(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(common, "cache_dir", tmp_path)
+    monkeypatch.setattr(Cache, "all", {})
+    youtube_main = sys.modules["ytmusicbot.youtube.main"]
+    monkeypatch.setattr(youtube_main, "search_queries", SearchQueries())
+    searches: list[str] = []
+    release = threading.Event()
+
+    def search_page(query: str, max_results: int | None = None) -> SearchResultsPage:
+        searches.append(query)
+        release.wait(5)
+        songs: list[SongMetadata] = [
+            {"id": str(i), "title": query, "url": "", "thumbnail_url": ""}
+            for i in range(max_results or 3)
+        ]
+        return SearchResultsPage(songs, None if max_results else "token")
+
+    monkeypatch.setattr(youtube_main, "search_page", search_page)
+    results: list[list[SongMetadata]] = []
+    threads = [
+        threading.Thread(target=lambda: results.append(cached_search("Daft Punk")))
+        for _ in range(3)
+    ]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.1)
+    release.set()
+    for thread in threads:
+        thread.join()
+    # Concurrent identical queries share one search
+    assert searches == ["Daft Punk"]
+    assert len(results) == 3 and all(len(r) == 3 for r in results)
+    # Served from the cache, including a limit of the unlimited results
+    assert len(cached_search("daft  punk!")) == 3
+    assert [song["id"] for song in cached_search("Daft Punk", 1)] == ["0"]
+    # The continuation is cached with the full page
+    assert cached_search_page("Daft Punk").continuation == "token"
+    assert searches == ["Daft Punk"]
+
+
+def test_aio_off_event_loop(monkeypatch: pytest.MonkeyPatch):
+    youtube_main = sys.modules["ytmusicbot.youtube.main"]
+    song: SongMetadata = {"id": "0", "title": "", "url": "", "thumbnail_url": ""}
+    threads: dict[str, int] = {}
+
+    def blocking(name: str, result=None):
+        def call(*_):
+            threads[name] = threading.get_ident()
+            return result
+
+        return call
+
+    def songs(url: str):
+        threads["get_songs_in_playlist"] = threading.get_ident()
+        yield from [song] * 3
+
+    for name, result in [
+        ("get_youtube_dl", None),
+        ("cached_search", [song]),
+        ("cached_search_page", SearchResultsPage([song], "token")),
+        ("search_more", SearchResultsPage([song], None)),
+        ("get_song_metadata", song),
+        ("get_downloaded", None),
+        ("should_stream", False),
+        ("get_random_songs", [song]),
+        ("get_cached_playlist", [song]),
+        ("refresh_playlist", PlaylistDiff([], set())),
+        ("get_playlist_songs", [song]),
+        ("resolve_stream", StreamResponse("", song)),
+        ("download_folder_metrics", None),
+        ("record_play", None),
+    ]:
+        monkeypatch.setattr(youtube_main, name, blocking(name, result))
+    monkeypatch.setattr(youtube_main, "get_songs_in_playlist", songs)
+    monkeypatch.setattr(youtube_main, "warmed_up", threading.Event())
+    monkeypatch.setattr(youtube_main, "cached_search_results", lambda *_: None)
+    monkeypatch.setattr(youtube_main.downloads, "get", blocking("downloads.get"))
+    monkeypatch.setattr(
+        youtube_main.downloads, "analysis", blocking("downloads.analysis")
+    )
+    monkeypatch.setattr(
+        youtube_main.download_index, "get", blocking("download_index.get")
+    )
+
+    async def call_all() -> int:
+        await aio.wait_until_warm()
+        await aio.search("Sauti Sol")
+        await aio.search_page("Sauti Sol")
+        await aio.search_more("token")
+        await aio.get_song_metadata("")
+        await aio.get_download("0")
+        await aio.get_downloaded("0")
+        await aio.get_download_file("0")
+        await aio.get_analysis("0")
+        await aio.should_stream("0")
+        await aio.get_random_songs()
+        await aio.get_cached_playlist("")
+        await aio.refresh_playlist("")
+        await aio.get_playlist_songs("")
+        assert [len(batch) async for batch in aio.get_songs_in_playlist("", 2)] == [
+            1,
+            2,
+        ]
+        await aio.resolve_stream("", "0")
+        await aio.download_folder_metrics()
+        aio.record_play("0")
+        return threading.get_ident()
+
+    loop_thread = asyncio.run(call_all())
+    common.cache_io_executor.submit(lambda: None).result()
+    assert len(threads) == 18
+    assert loop_thread not in threads.values()
+
+
+def test_aio_timeout():
+    async def slow_call():
+        await aio.run("sleep", time.sleep, 1, timeout=0.05)
+
+    with pytest.raises(OperationTimeoutException):
+        asyncio.run(slow_call())
+
+
+def make_results(ids: list[str], continuation: str | None) -> list[dict]:
+    items: list[dict] = [
+        {
+            "videoRenderer": {
+                "videoId": id,
+                "title": {"runs": [{"text": f"Song {id}"}]},
+                "thumbnail": {"thumbnails": [{"url": f"https://i.ytimg.com/{id}"}]},
+            }
+        }
+        for id in ids
+    ]
+    if continuation:
+        command = {"token": continuation, "request": "CONTINUATION_REQUEST_TYPE_SEARCH"}
+        items.append(
+            {
+                "continuationItemRenderer": {
+                    "continuationEndpoint": {"continuationCommand": command}
+                }
+            }
+        )
+    return items
+
+
+def make_results_page(ids: list[str], continuation: str | None = None) -> str:
+    data = {"contents": make_results(ids, continuation)}
+    return f"<script>var ytInitialData = {json.dumps(data)};</script>"
+
+
+def test_parse_videos():
+    page = make_results_page(["a", "b", "a", "c"])
+    videos = parse_videos(page)
+    # Shelves repeat videos
+    assert [video["id"] for video in videos] == ["a", "b", "c"]
+    assert videos[0] == {
+        "id": "a",
+        "title": "Song a",
+        "url_suffix": "/watch?v=a",
+        "thumbnails": ["https://i.ytimg.com/a"],
+    }
+    # Parsing stops before the malformed video once enough are found
+    malformed = page.replace('{"videoId": "c"', '{"videoId": "c"]')
+    assert [video["id"] for video in parse_videos(malformed, 2)] == ["a", "b"]
+    with pytest.raises(SearchException):
+        parse_videos(malformed)
+    with pytest.raises(SearchException):
+        parse_videos("<html></html>")
+
+
+def test_search_replay(tmp_path: Path):
+    fixture_path(tmp_path, "Sauti Sol!").write_text(make_results_page(["a", "b"]))
+    client = SearchClient(ConnectionPool(YOUTUBE_HOST, 1, 1), tmp_path)
+    assert [video["id"] for video in client.search("sauti sol", 1).videos] == ["a"]
+    assert client.pool.opened == 0
+    with pytest.raises(SearchException):
+        client.search("Daft Punk")
+
+
+def test_search_continuation(tmp_path: Path):
+    fixture_path(tmp_path, "Sauti Sol").write_text(make_results_page(["a", "b"], "1"))
+    continuation = {"continuationItems": make_results(["b", "c"], "2")}
+    continuation_fixture_path(tmp_path, "1").write_text(json.dumps(continuation))
+    client = SearchClient(ConnectionPool(YOUTUBE_HOST, 1, 1), tmp_path)
+    assert client.search("Sauti Sol") == (parse_videos(make_results_page(["a", "b"])), "1")
+    # Parsing stopped before the continuation
+    assert client.search("Sauti Sol", 1).continuation is None
+    page = client.continue_search("1")
+    assert [video["id"] for video in page.videos] == ["b", "c"]
+    assert page.continuation == "2"
+
+
 def test_search():
     query = "Sauti Sol"
     results = search(query, max_results=10)
@@ -46,6 +604,23 @@ def test_mix(download=False):
     test_playlist(url, download=download)
 
 
+def test_playlist_entries():
+    from yt_dlp.utils import OnDemandPagedList
+
+    fetched_pages: list[int] = []
+
+    def page(page_number: int):
+        fetched_pages.append(page_number)
+        return [{"id": f"{page_number}-{i}"} for i in range(2 if page_number < 2 else 1)]
+
+    entries = playlist_entries(OnDemandPagedList(page, 2))
+    assert next(iter(entries))["id"] == "0-0"
+    # Only the first page is fetched for the first entry
+    assert fetched_pages == [0]
+    assert [entry["id"] for entry in entries] == ["0-1", "1-0", "1-1", "2-0"]
+    assert list(playlist_entries(iter([{"id": "a"}]))) == [{"id": "a"}]
+
+
 def test_playlist(
     url="https://www.youtube.com/watch?v=jJPMnTXl63E&list=PL3yHf51-oxPi37LMBbuxJoEPA_SE5ymlU",
     download=False,
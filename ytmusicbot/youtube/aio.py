@@ -0,0 +1,186 @@
+import asyncio
+from concurrent.futures import Future, ThreadPoolExecutor
+import importlib
+import itertools
+import os
+from pathlib import Path
+from typing import Any, AsyncGenerator, Callable, Iterator, TypeVar
+from ytmusicbot.common.main import cache_io_executor
+from ytmusicbot.youtube.analysis import AudioAnalysis, gain_multiplier  # noqa: F401
+from ytmusicbot.youtube.main import (  # noqa: F401
+    DownloadFolderMetrics,
+    DownloadMetadata,
+    DownloadPriority,
+    DownloadProgress,
+    DownloadResponse,
+    OperationTimeoutException,
+    PlaylistDiff,
+    SearchResultsPage,
+    SongMetadata,
+    StreamResponse,
+    YoutubeException,
+    download_index,
+    download_pool,
+    download_progress,
+    downloads,
+    downloads_low_water_ratio,
+    get_id,
+    list_contains_song,
+    logger,
+    loudness_normalization,
+    max_downloads_size_ibytes,
+    progressive_playback,
+    progressive_playback_buffer_bytes,
+    set_pinned_downloads,
+    trim_silence,
+    warmup,
+)
+
+# The package's star import shadows the module with its main function
+youtube = importlib.import_module("ytmusicbot.youtube.main")
+
+logger = logger.getChild("aio")
+youtube_workers = int(os.getenv("YOUTUBE_WORKERS", "4"))
+youtube_timeout = float(os.getenv("YOUTUBE_TIMEOUT", "60"))
+# A whole playlist is fetched page by page so it gets longer
+playlist_timeout = float(os.getenv("YOUTUBE_PLAYLIST_TIMEOUT", "600"))
+# Every blocking YouTube call of the bot runs here, downloads have their own pool
+executor = ThreadPoolExecutor(max_workers=youtube_workers, thread_name_prefix="youtube")
+
+T = TypeVar("T")
+
+
+async def wait(future: Future[T], operation: str, timeout: float) -> T:
+    """
+    Cancelling the caller or timing out drops the call if it hasn't started yet,
+    a started call can't be interrupted so it finishes in its thread and is ignored
+    """
+    try:
+        return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+    except TimeoutError:
+        logger.warning("Timed out after %ss trying to %s", timeout, operation)
+        raise OperationTimeoutException(operation, timeout)
+
+
+async def run(
+    operation: str, func: Callable[..., T], *args: Any, timeout: float = youtube_timeout
+) -> T:
+    return await wait(executor.submit(func, *args), operation, timeout)
+
+
+async def wait_until_warm() -> None:
+    if youtube.warmed_up.is_set():
+        return
+    await run("warm up", youtube.get_youtube_dl)
+
+
+async def search(query: str, max_results: int | None = None) -> list[SongMetadata]:
+    """Cached queries don't leave the event loop"""
+    if (results := youtube.cached_search_results(query, max_results)) is not None:
+        logger.debug("Search results for %r are cached", query)
+        return results
+    return await run("search", youtube.cached_search, query, max_results)
+
+
+async def search_page(query: str) -> SearchResultsPage:
+    return await run("search", youtube.cached_search_page, query)
+
+
+async def search_more(continuation: str) -> SearchResultsPage:
+    return await run("get more search results", youtube.search_more, continuation)
+
+
+async def get_song_metadata(url: str) -> SongMetadata:
+    return await run("get the song", youtube.get_song_metadata, url)
+
+
+async def get_download(id: str) -> DownloadMetadata | None:
+    """Syncing the downloads with the file system may extract the song's metadata"""
+    return await run("check the download", youtube.downloads.get, id)
+
+
+async def get_downloaded(id: str) -> DownloadResponse | None:
+    """Downloaded songs are played from here without waiting for a download worker"""
+    return await run("check the download", youtube.get_downloaded, id)
+
+
+async def get_download_file(id: str) -> Path | None:
+    """The first lookup indexes the downloads folder"""
+    return await run("check the download", youtube.download_index.get, id)
+
+
+async def get_analysis(id: str) -> AudioAnalysis | None:
+    return await run("get the analysis", youtube.downloads.analysis, id)
+
+
+async def should_stream(id: str) -> bool:
+    """STREAM_THEN_CACHE reads the access log to know if the song was played before"""
+    return await run("check the playback mode", youtube.should_stream, id)
+
+
+async def get_cached_playlist(url: str) -> list[SongMetadata] | None:
+    return await run("load the cached playlist", youtube.get_cached_playlist, url)
+
+
+async def refresh_playlist(url: str) -> PlaylistDiff:
+    return await run(
+        "refresh the playlist", youtube.refresh_playlist, url, timeout=playlist_timeout
+    )
+
+
+async def get_playlist_songs(url: str) -> list[SongMetadata]:
+    return await run(
+        "get the playlist", youtube.get_playlist_songs, url, timeout=playlist_timeout
+    )
+
+
+async def get_random_songs() -> list[SongMetadata]:
+    return await run("load the random songs", youtube.get_random_songs)
+
+
+def take(songs: Iterator[SongMetadata], size: int) -> list[SongMetadata]:
+    return list(itertools.islice(songs, size))
+
+
+async def get_songs_in_playlist(
+    url: str, batch_size: int
+) -> AsyncGenerator[list[SongMetadata], None]:
+    """
+    A playlist's songs in batches as its pages are fetched,
+    the first song comes on its own so it can be played straight away
+    """
+    songs = youtube.get_songs_in_playlist(url)
+    step: Future[list[SongMetadata]] | None = None
+    try:
+        size = 1
+        while True:
+            step = executor.submit(take, songs, size)
+            if not (batch := await wait(step, "get the playlist", youtube_timeout)):
+                return
+            yield batch
+            size = batch_size
+    finally:
+        # The generator can't be closed while a batch is being taken from it,
+        # closing it also caches the metadata of the songs fetched so far
+        if step:
+            step.add_done_callback(lambda _: executor.submit(songs.close))
+        else:
+            songs.close()
+
+
+async def resolve_stream(url: str, id: str) -> StreamResponse:
+    return await run("resolve the stream", youtube.resolve_stream, url, id)
+
+
+def invalidate_stream(id: str) -> None:
+    """Nothing waits for the stream URL to be forgotten"""
+    executor.submit(youtube.stream_urls.invalidate, id)
+
+
+async def download_folder_metrics() -> DownloadFolderMetrics:
+    return await run("measure the downloads", youtube.download_folder_metrics)
+
+
+def record_play(id: str) -> None:
+    """Appends to the access log on the cache io thread, nothing waits for it"""
+    cache_io_executor.submit(youtube.record_play, id)
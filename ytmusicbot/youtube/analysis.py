@@ -0,0 +1,129 @@
+from pathlib import Path
+import re
+import subprocess
+from typing import TypedDict
+
+# Quieter than this counts as silence
+SILENCE_THRESHOLD_DB = -50
+# Shorter gaps aren't trimmed
+SILENCE_MIN_SECONDS = 0.5
+# How close to the start or end of a song a silence has to be to be trimmed
+SILENCE_EDGE_SECONDS = 0.1
+# Headroom left under full scale when a quiet song is turned up
+PEAK_CEILING_DB = -1.0
+
+DURATION_RE = re.compile(r"Duration: (\d+):(\d{2}):(\d{2}(?:\.\d+)?)")
+INTEGRATED_LOUDNESS_RE = re.compile(r"^\s*I:\s+(-?[\d.]+|-inf) LUFS", re.MULTILINE)
+TRUE_PEAK_RE = re.compile(r"^\s*Peak:\s+(-?[\d.]+|-inf) dBFS", re.MULTILINE)
+SILENCE_RE = re.compile(r"silence_(start|end): (-?[\d.]+)")
+
+
+class AudioAnalysis(TypedDict):
+    # Integrated loudness in LUFS
+    loudness: float
+    # dB to turn the song up or down by to reach the target loudness
+    gain: float
+    # Seconds of leading silence to skip
+    start: float
+    # Where the trailing silence starts in seconds, None if there is none
+    end: float | None
+
+
+class AnalysisException(Exception):
+    def __init__(self, message: str) -> None:
+        super().__init__(message)
+
+
+def gain_multiplier(gain: float) -> float:
+    """The volume multiplier of a gain in dB"""
+    return 10 ** (gain / 20)
+
+
+def analysis_command(file_path: Path) -> list[str]:
+    return [
+        "ffmpeg",
+        "-hide_banner",
+        "-nostdin",
+        "-nostats",
+        "-i",
+        str(file_path),
+        "-vn",
+        "-af",
+        # The per frame measurements are only logged at the verbose level
+        "ebur128=framelog=verbose:peak=true,"
+        f"silencedetect=noise={SILENCE_THRESHOLD_DB}dB:d={SILENCE_MIN_SECONDS}",
+        "-f",
+        "null",
+        "-",
+    ]
+
+
+def parse_float(value: str) -> float:
+    return float("-inf") if value == "-inf" else float(value)
+
+
+def parse_analysis(
+    output: str, target_loudness: float, max_gain: float
+) -> AudioAnalysis:
+    """Read ffmpeg's ebur128 and silencedetect output"""
+    if not (loudness_match := INTEGRATED_LOUDNESS_RE.search(output)):
+        raise AnalysisException("ffmpeg didn't report the integrated loudness")
+    loudness = parse_float(loudness_match.group(1))
+    gain = max(-max_gain, min(max_gain, target_loudness - loudness))
+    if peak_match := TRUE_PEAK_RE.search(output):
+        gain = min(gain, max(0.0, PEAK_CEILING_DB - parse_float(peak_match.group(1))))
+
+    duration = None
+    if duration_match := DURATION_RE.search(output):
+        hours, minutes, seconds = duration_match.groups()
+        duration = int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+    silences: list[tuple[float, float | None]] = []
+    for kind, value in SILENCE_RE.findall(output):
+        if kind == "start":
+            silences.append((float(value), None))
+        elif silences and silences[-1][1] is None:
+            silences[-1] = (silences[-1][0], float(value))
+
+    start = 0.0
+    end = None
+    if silences and silences[0][0] <= SILENCE_EDGE_SECONDS and silences[0][1]:
+        start = silences[0][1]
+        if duration is not None and start >= duration - SILENCE_EDGE_SECONDS:
+            # The whole song is silent
+            start = 0.0
+    if silences:
+        last_start, last_end = silences[-1]
+        # Newer ffmpeg versions also end a silence that lasts until the end of the file
+        reaches_end = last_end is None or (
+            duration is not None and last_end >= duration - SILENCE_EDGE_SECONDS
+        )
+        if reaches_end and last_start > start:
+            end = last_start
+    return AudioAnalysis(
+        loudness=loudness if loudness != float("-inf") else -70.0,
+        gain=round(gain, 2),
+        start=round(start, 3),
+        end=round(end, 3) if end is not None else None,
+    )
+
+
+def analyse(
+    file_path: Path, target_loudness: float, max_gain: float
+) -> AudioAnalysis:
+    """Measure a song with a single ffmpeg pass, the decoding runs in ffmpeg's own process"""
+    try:
+        process = subprocess.run(
+            analysis_command(file_path),
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            text=True,
+            errors="replace",
+            check=False,
+        )
+    except OSError as e:
+        raise AnalysisException(f"Failed to run ffmpeg: {e}")
+    if process.returncode:
+        raise AnalysisException(
+            f"ffmpeg exited with {process.returncode}: {process.stderr[-500:]}"
+        )
+    return parse_analysis(process.stderr, target_loudness, max_gain)
@@ -0,0 +1,154 @@
+from collections import deque
+from concurrent.futures import Future
+from enum import IntEnum
+import heapq
+import itertools
+import threading
+import time
+from typing import TYPE_CHECKING, Callable, Iterable, NamedTuple
+from ytmusicbot.common.main import logger
+
+if TYPE_CHECKING:
+    from ytmusicbot.youtube.main import DownloadResponse
+
+logger = logger.getChild("youtube").getChild("download_pool")
+# Number of recent jobs the wait time metrics are computed over
+WAIT_TIMES_WINDOW = 100
+
+
+class DownloadPriority(IntEnum):
+    """Lower runs first"""
+
+    PLAYBACK = 0
+    NEXT = 1
+    PREFETCH = 2
+
+
+class DownloadJob:
+    def __init__(self, url: str, id: str, priority: DownloadPriority) -> None:
+        self.url = url
+        self.id = id
+        self.priority = priority
+        self.submitted = time.perf_counter()
+        self.future: Future["DownloadResponse"] = Future()
+
+
+class DownloadPoolMetrics(NamedTuple):
+    workers: int
+    queue_depth: int
+    active_jobs: int
+    average_wait: float
+    max_wait: float
+
+
+class DownloadPool:
+    """
+    A fixed number of download threads fed from a priority queue,
+    a video id is only ever queued or downloading once
+    """
+
+    def __init__(
+        self, workers: int, download: Callable[[str, str], "DownloadResponse"]
+    ) -> None:
+        if workers < 1:
+            raise ValueError(f"Download pool needs at least 1 worker, got {workers}")
+        self.workers = workers
+        self.download = download
+        self.condition = threading.Condition()
+        self.heap: list[tuple[DownloadPriority, int, DownloadJob]] = []
+        self.counter = itertools.count()
+        self.queued: dict[str, DownloadJob] = {}
+        self.active: dict[str, DownloadJob] = {}
+        self.wait_times: deque[float] = deque(maxlen=WAIT_TIMES_WINDOW)
+        self.threads: list[threading.Thread] = []
+
+    def submit(
+        self, url: str, id: str, priority: DownloadPriority
+    ) -> Future["DownloadResponse"]:
+        with self.condition:
+            self._start_workers()
+            if job := self.active.get(id):
+                return job.future
+            if job := self.queued.get(id):
+                if priority < job.priority:
+                    # The old heap entry is skipped once its priority no longer matches
+                    logger.debug("Raising %s to %s", id, priority.name)
+                    job.priority = priority
+                    self._push(job)
+                return job.future
+            job = DownloadJob(url, id, priority)
+            self.queued[id] = job
+            self._push(job)
+            logger.debug(
+                "Queued %s as %s, queue depth %d", id, priority.name, len(self.queued)
+            )
+            self.condition.notify()
+            return job.future
+
+    def _push(self, job: DownloadJob) -> None:
+        heapq.heappush(self.heap, (job.priority, next(self.counter), job))
+
+    def cancel_queued(
+        self, priority: DownloadPriority, keep: Iterable[str] = ()
+    ) -> int:
+        """Cancel the queued jobs of priority that aren't for an id in keep, running jobs are left alone"""
+        keep = set(keep)
+        cancelled = 0
+        with self.condition:
+            for id, job in list(self.queued.items()):
+                if job.priority == priority and id not in keep:
+                    del self.queued[id]
+                    job.future.cancel()
+                    cancelled += 1
+        if cancelled:
+            logger.debug("Cancelled %d queued %s downloads", cancelled, priority.name)
+        return cancelled
+
+    def metrics(self) -> DownloadPoolMetrics:
+        with self.condition:
+            wait_times = list(self.wait_times)
+            return DownloadPoolMetrics(
+                self.workers,
+                len(self.queued),
+                len(self.active),
+                sum(wait_times) / len(wait_times) if wait_times else 0.0,
+                max(wait_times, default=0.0),
+            )
+
+    def _start_workers(self) -> None:
+        while len(self.threads) < self.workers:
+            thread = threading.Thread(
+                target=self._work, name=f"download-{len(self.threads)}", daemon=True
+            )
+            self.threads.append(thread)
+            thread.start()
+
+    def _next_job(self) -> DownloadJob:
+        with self.condition:
+            while True:
+                while not self.heap:
+                    self.condition.wait()
+                priority, _, job = heapq.heappop(self.heap)
+                if self.queued.get(job.id) is not job or priority != job.priority:
+                    continue
+                del self.queued[job.id]
+                self.active[job.id] = job
+                wait = time.perf_counter() - job.submitted
+                self.wait_times.append(wait)
+                return job
+
+    def _work(self) -> None:
+        while True:
+            job = self._next_job()
+            logger.debug("Downloading %s as %s", job.id, job.priority.name)
+            try:
+                if job.future.set_running_or_notify_cancel():
+                    try:
+                        result = self.download(job.url, job.id)
+                    except BaseException as e:
+                        job.future.set_exception(e)
+                    else:
+                        job.future.set_result(result)
+            finally:
+                with self.condition:
+                    del self.active[job.id]
@@ -0,0 +1,264 @@
+import heapq
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from pathlib import Path
+import threading
+from typing import Iterable, Iterator, NamedTuple
+from ytmusicbot.common.main import logger
+
+logger = logger.getChild("youtube").getChild("eviction")
+
+
+class AccessRecord(NamedTuple):
+    last_access: float
+    count: int
+
+
+class AccessLog:
+    """
+    Persistent history of song plays as "<id> <unix time>" lines, compacted
+    into "<id> <last access> <count>" lines once it grows past max_lines
+    """
+
+    def __init__(self, file_path: Path, max_lines: int) -> None:
+        self.file_path = file_path
+        self.max_lines = max_lines
+        self.records: dict[str, AccessRecord] = {}
+        self.lines = 0
+        self.lock = threading.Lock()
+
+    def load(self) -> dict[str, AccessRecord]:
+        with self.lock:
+            self.records.clear()
+            self.lines = 0
+            if not self.file_path.exists():
+                return {}
+            with open(self.file_path, "r") as f:
+                for line in f:
+                    fields = line.split()
+                    if len(fields) not in (2, 3):
+                        logger.warning("Skipping corrupt access log line: %r", line)
+                        continue
+                    id, accessed, count = fields[0], float(fields[1]), 1
+                    if len(fields) == 3:
+                        count = int(fields[2])
+                    previous = self.records.get(id)
+                    if previous:
+                        accessed = max(accessed, previous.last_access)
+                        count += previous.count
+                    self.records[id] = AccessRecord(accessed, count)
+                    self.lines += 1
+            return dict(self.records)
+
+    def append(self, id: str, accessed: float) -> None:
+        with self.lock:
+            previous = self.records.get(id)
+            count = previous.count + 1 if previous else 1
+            self.records[id] = AccessRecord(accessed, count)
+            with open(self.file_path, "a") as f:
+                f.write(f"{id} {accessed:.0f}\n")
+            self.lines += 1
+            if self.lines > self.max_lines:
+                self._compact()
+
+    def play_count(self, id: str) -> int:
+        record = self.records.get(id)
+        return record.count if record else 0
+
+    def _compact(self) -> None:
+        logger.debug("Compacting %s", self.file_path)
+        tmp_path = self.file_path.with_suffix(f"{self.file_path.suffix}.tmp")
+        with open(tmp_path, "w") as f:
+            for id, record in self.records.items():
+                f.write(f"{id} {record.last_access:.0f} {record.count}\n")
+        tmp_path.replace(self.file_path)
+        self.lines = len(self.records)
+
+
+class EvictionPolicy(ABC):
+    """Decides which downloads to evict first, every method is called with the index lock held"""
+
+    name: str
+
+    @abstractmethod
+    def restore(self, history: dict[str, AccessRecord]) -> None:
+        """Apply the access log's history once the downloads are indexed"""
+
+    @abstractmethod
+    def record_access(self, id: str, accessed: float) -> None: ...
+
+    @abstractmethod
+    def record_insert(self, id: str, inserted: float) -> None: ...
+
+    @abstractmethod
+    def record_remove(self, id: str) -> None: ...
+
+    @abstractmethod
+    def victims(self, candidates: Iterable[str]) -> Iterator[str]:
+        """The candidates in the order they should be evicted"""
+
+
+class LRUPolicy(EvictionPolicy):
+    name = "lru"
+
+    def __init__(self) -> None:
+        self.last_access: dict[str, float] = {}
+
+    def restore(self, history: dict[str, AccessRecord]) -> None:
+        for id, record in history.items():
+            self.last_access[id] = record.last_access
+
+    def record_access(self, id: str, accessed: float) -> None:
+        self.last_access[id] = accessed
+
+    def record_insert(self, id: str, inserted: float) -> None:
+        self.last_access.setdefault(id, inserted)
+
+    def record_remove(self, id: str) -> None:
+        self.last_access.pop(id, None)
+
+    def victims(self, candidates: Iterable[str]) -> Iterator[str]:
+        heap = [(self.last_access.get(id, 0), id) for id in candidates]
+        heapq.heapify(heap)
+        while heap:
+            yield heapq.heappop(heap)[1]
+
+
+class LFUPolicy(EvictionPolicy):
+    """Least frequently played first, ties broken by least recently played"""
+
+    name = "lfu"
+
+    def __init__(self) -> None:
+        self.last_access: dict[str, float] = {}
+        # Kept after removal so a popular song that got evicted is protected once re-downloaded
+        self.counts: dict[str, int] = {}
+
+    def restore(self, history: dict[str, AccessRecord]) -> None:
+        for id, record in history.items():
+            self.last_access[id] = record.last_access
+            self.counts[id] = record.count
+
+    def record_access(self, id: str, accessed: float) -> None:
+        self.last_access[id] = accessed
+        self.counts[id] = self.counts.get(id, 0) + 1
+
+    def record_insert(self, id: str, inserted: float) -> None:
+        self.last_access.setdefault(id, inserted)
+
+    def record_remove(self, id: str) -> None:
+        pass
+
+    def victims(self, candidates: Iterable[str]) -> Iterator[str]:
+        heap = [
+            (self.counts.get(id, 0), self.last_access.get(id, 0), id)
+            for id in candidates
+        ]
+        heapq.heapify(heap)
+        while heap:
+            yield heapq.heappop(heap)[2]
+
+
+class ARCPolicy(EvictionPolicy):
+    """
+    Adaptive Replacement Cache, balances between songs played once recently (t1)
+    and songs played repeatedly (t2) using the ghost lists of what each evicted (b1, b2)
+    """
+
+    name = "arc"
+
+    def __init__(self) -> None:
+        self.t1: OrderedDict[str, None] = OrderedDict()
+        self.t2: OrderedDict[str, None] = OrderedDict()
+        self.b1: OrderedDict[str, None] = OrderedDict()
+        self.b2: OrderedDict[str, None] = OrderedDict()
+        # Downloaded (usually just before playing) but not played yet, so the first play isn't a repeat
+        self.unplayed: set[str] = set()
+        # Target size of t1
+        self.p = 0.0
+
+    @property
+    def capacity(self) -> int:
+        return max(len(self.t1) + len(self.t2), 1)
+
+    def restore(self, history: dict[str, AccessRecord]) -> None:
+        # Reorders the indexed files, ones that were never played stay in front of t1
+        for id, record in sorted(history.items(), key=lambda item: item[1].last_access):
+            if id in self.t1 or id in self.t2:
+                self.t1.pop(id, None)
+                self.t2.pop(id, None)
+                self.unplayed.discard(id)
+                target = self.t2 if record.count > 1 else self.t1
+                target[id] = None
+
+    def _ghost_hit(self, id: str) -> None:
+        """Adapt p towards the list that evicted id too early"""
+        if id in self.b1:
+            self.p = min(self.capacity, self.p + max(len(self.b2) / len(self.b1), 1))
+            del self.b1[id]
+        else:
+            self.p = max(0.0, self.p - max(len(self.b1) / len(self.b2), 1))
+            del self.b2[id]
+
+    def record_access(self, id: str, accessed: float) -> None:
+        # Streamed songs aren't downloaded so they don't take room in t1 or t2,
+        # an evicted song is a ghost hit once it's downloaded and played again
+        if id in self.unplayed:
+            self.unplayed.discard(id)
+            if id in self.b1 or id in self.b2:
+                self._ghost_hit(id)
+                del self.t1[id]
+                self.t2[id] = None
+            else:
+                self.t1.move_to_end(id)
+        elif id in self.t1:
+            del self.t1[id]
+            self.t2[id] = None
+        elif id in self.t2:
+            self.t2.move_to_end(id)
+
+    def record_insert(self, id: str, inserted: float) -> None:
+        if id not in self.t1 and id not in self.t2:
+            self.t1[id] = None
+            self.unplayed.add(id)
+
+    def record_remove(self, id: str) -> None:
+        self.unplayed.discard(id)
+        if id in self.t1:
+            del self.t1[id]
+            self.b1[id] = None
+        elif id in self.t2:
+            del self.t2[id]
+            self.b2[id] = None
+        for ghosts in (self.b1, self.b2):
+            while len(ghosts) > self.capacity:
+                ghosts.popitem(last=False)
+
+    def victims(self, candidates: Iterable[str]) -> Iterator[str]:
+        candidates = set(candidates)
+        # Files that were never accessed or inserted through the policy go first
+        yield from candidates.difference(self.t1, self.t2)
+        t1 = [id for id in self.t1 if id in candidates]
+        t2 = [id for id in self.t2 if id in candidates]
+        t1_index = t2_index = 0
+        while t1_index < len(t1) or t2_index < len(t2):
+            t1_len = len(t1) - t1_index
+            if t1_index < len(t1) and (t1_len > self.p or t2_index >= len(t2)):
+                yield t1[t1_index]
+                t1_index += 1
+            else:
+                yield t2[t2_index]
+                t2_index += 1
+
+
+EVICTION_POLICIES: dict[str, type[EvictionPolicy]] = {
+    policy.name: policy for policy in (LRUPolicy, LFUPolicy, ARCPolicy)
+}
+
+
+def make_eviction_policy(name: str) -> EvictionPolicy:
+    if name not in EVICTION_POLICIES:
+        raise ValueError(
+            f"Unknown eviction policy: {name}, choose one of {', '.join(EVICTION_POLICIES)}"
+        )
+    return EVICTION_POLICIES[name]()
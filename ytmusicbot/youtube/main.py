@@ -1,14 +1,48 @@
+from concurrent.futures import ThreadPoolExecutor
+import itertools
 import json
 import os
 import re
+import threading
 import time
-from typing import Any, Generator, NamedTuple, TypedDict, cast
-import yt_dlp
-from youtube_search import YoutubeSearch
+from urllib.parse import parse_qs, urlparse
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Generator,
+    Iterable,
+    NamedTuple,
+    NotRequired,
+    TypedDict,
+    TypeVar,
+    cast,
+)
 from pathlib import Path
 from ytmusicbot.common.main import Cache, load_dotenv, logger, cache_dir
+from ytmusicbot.common.singleflight import SingleFlight
+from ytmusicbot.common.storage import Op
+from ytmusicbot.youtube.analysis import AnalysisException, AudioAnalysis, analyse
+from ytmusicbot.youtube.download_pool import DownloadPool, DownloadPriority  # noqa: F401
+from ytmusicbot.youtube.progress import DownloadProgress, DownloadProgressTracker  # noqa: F401
+from ytmusicbot.youtube.search_client import (
+    YOUTUBE_HOST,
+    ConnectionPool,
+    SearchClient,
+    SearchException,
+    SearchPage,
+)
+from ytmusicbot.youtube.eviction import (
+    AccessLog,
+    EvictionPolicy,
+    make_eviction_policy,
+)
 import sys
 
+# yt_dlp is slow to import so it's only imported when first used
+if TYPE_CHECKING:
+    import yt_dlp
+
 
 load_dotenv()
 
@@ -17,6 +51,51 @@ IBYTES_TO_MBS = 1024**2
 max_downloads_size_ibytes = (
     int(os.getenv("MAX_DOWNLOADS_SIZE_MBS", "1000")) * IBYTES_TO_MBS
 )
+# Eviction frees space down to this fraction of the limit so it doesn't run on every download
+downloads_low_water_ratio = float(os.getenv("DOWNLOADS_LOW_WATER_RATIO", "0.9"))
+# Store downloads as downloads/ab/abcdefghijk.webm so huge caches don't slow down the folder
+sharded_downloads = os.getenv("SHARDED_DOWNLOADS", "false").lower() == "true"
+# "lru", "lfu" or "arc"
+downloads_eviction_policy = os.getenv("DOWNLOADS_EVICTION_POLICY", "lru").lower()
+# Play history lines kept before the access log is compacted to one line per song
+access_log_max_lines = int(os.getenv("ACCESS_LOG_MAX_LINES", "10000"))
+# Concurrent yt-dlp downloads, more just split the bandwidth between them
+download_workers = int(os.getenv("DOWNLOAD_WORKERS", "2"))
+# Start playing uncached songs while they download, Windows can't rename the file yt-dlp writes while it's being read
+progressive_playback = (
+    os.getenv("PROGRESSIVE_PLAYBACK", "false" if os.name == "nt" else "true").lower()
+    == "true"
+)
+progressive_playback_buffer_bytes = (
+    int(os.getenv("PROGRESSIVE_PLAYBACK_BUFFER_KBS", "128")) * 1024
+)
+# "download", "stream" or "stream_then_cache" (stream the first play, download once a song is replayed)
+playback_mode = os.getenv("PLAYBACK_MODE", "download").lower()
+PLAYBACK_MODES = ("download", "stream", "stream_then_cache")
+if playback_mode not in PLAYBACK_MODES:
+    raise ValueError(
+        f"Unknown PLAYBACK_MODE: {playback_mode}, choose one of {', '.join(PLAYBACK_MODES)}"
+    )
+# Downloads are stored as Ogg Opus so playback can send their packets without transcoding
+opus_downloads = os.getenv("OPUS_DOWNLOADS", "true").lower() == "true"
+# Bitrate songs that aren't already Opus are transcoded at, Opus sources are only remuxed
+opus_downloads_bitrate_kbps = int(os.getenv("OPUS_DOWNLOADS_BITRATE_KBPS", "96"))
+# Songs are measured once after they're downloaded, playback applies the results
+loudness_normalization = os.getenv("LOUDNESS_NORMALIZATION", "true").lower() == "true"
+loudness_target_lufs = float(os.getenv("LOUDNESS_TARGET_LUFS", "-14"))
+loudness_max_gain_db = float(os.getenv("LOUDNESS_MAX_GAIN_DB", "12"))
+trim_silence = os.getenv("TRIM_SILENCE", "true").lower() == "true"
+# Concurrent analyses, each one is an ffmpeg process
+analysis_workers = int(os.getenv("ANALYSIS_WORKERS", "1"))
+# Keep-alive connections to YouTube kept open between searches
+search_connections = int(os.getenv("SEARCH_CONNECTIONS", "4"))
+search_timeout = float(os.getenv("SEARCH_TIMEOUT", "10"))
+# Searches read saved results pages from this folder instead of YouTube
+search_replay_dir = os.getenv("SEARCH_REPLAY_DIR")
+# Used when a stream URL doesn't say when it expires
+DEFAULT_STREAM_URL_LIFETIME = 5 * 60 * 60
+# Stream URLs this close to expiring are resolved again since a song may outlast them
+STREAM_URL_EXPIRY_MARGIN = 15 * 60
 randoms_songs_dir = Path("random_songs")
 randoms_songs_dir.mkdir(exist_ok=True)
 
@@ -60,6 +139,11 @@ class ExtractPlaylistInfoException(YoutubeException):
         super().__init__(f"Failed to extract playlist info from {url}")
 
 
+class OperationTimeoutException(YoutubeException):
+    def __init__(self, operation: str, timeout: float) -> None:
+        super().__init__(f"Youtube took longer than {timeout}s to {operation}")
+
+
 YOUTUBE_HOME_URL = "https://www.youtube.com"
 VIDEO_ID_RX = r"(?:^|\W)(?:youtube(?:-nocookie)?\.com/(?:.*[?&]v=|v/|e(?:mbed)?/|shorts/|[^/]+/.+/)|youtu\.be/)([\w-]+)"
 PLAYLIST_MAGIC_STR = "list="
@@ -72,6 +156,10 @@ class SongMetadata(TypedDict):
     thumbnail_url: str
 
 
+class DownloadMetadata(SongMetadata):
+    analysis: NotRequired[AudioAnalysis]
+
+
 def list_contains_song(song_list: list[SongMetadata], song: SongMetadata) -> bool:
     for s in song_list:
         if s["id"] == song["id"]:
@@ -79,14 +167,88 @@ def list_contains_song(song_list: list[SongMetadata], song: SongMetadata) -> boo
     return False
 
 
+class SearchResultsPage(NamedTuple):
+    songs: list[SongMetadata]
+    # Fetches the next page with search_more, None if there isn't one
+    continuation: str | None
+
+
 def search(query: str, max_results: int | None = None) -> list[SongMetadata]:
-    yts_results = cast(
-        list[dict[str, Any]], YoutubeSearch(query, max_results=max_results).to_dict()
-    )
-    results = [info_to_song_metadata(r, is_search_info=True) for r in yts_results]
+    return search_page(query, max_results).songs
+
+
+def search_page(query: str, max_results: int | None = None) -> SearchResultsPage:
+    """The first page of results, only a full page comes with its continuation"""
+    try:
+        page = search_client.search(query, max_results)
+    except SearchException as e:
+        raise YoutubeException(f"Searching for {query} failed: {e}")
     logger.debug(
-        f"Search results for: query={query}, max_results={max_results}: {yts_results}"
+        "Search results for: query=%s, max_results=%s: %s",
+        query,
+        max_results,
+        page.videos,
     )
+    return songs_page(page)
+
+
+def search_more(continuation: str) -> SearchResultsPage:
+    """Only the page after the one the continuation came with"""
+    try:
+        page = search_client.continue_search(continuation)
+    except SearchException as e:
+        raise YoutubeException(f"Getting more search results failed: {e}")
+    logger.debug("More search results: %s", page.videos)
+    return songs_page(page)
+
+
+def songs_page(page: SearchPage) -> SearchResultsPage:
+    songs = [info_to_song_metadata(v, is_search_info=True) for v in page.videos]
+    song_metadata_cache.add(songs)
+    return SearchResultsPage(songs, page.continuation)
+
+
+def normalize_query(query: str) -> str:
+    """Queries that only differ in case, spacing or punctuation find the same songs"""
+    return " ".join(re.sub(r"[^\w\s]", " ", query.casefold()).split())
+
+
+def search_cache_key(query: str, max_results: int | None) -> str:
+    return f"{max_results or 'all'}:{normalize_query(query)}"
+
+
+def cached_search(query: str, max_results: int | None = None) -> list[SongMetadata]:
+    """Concurrent calls for the same query share one search"""
+    if (results := cached_search_results(query, max_results)) is not None:
+        return results
+    key = search_cache_key(query, max_results)
+    return search_flights.do(key, _cached_search, key, query, max_results).songs
+
+
+def cached_search_page(query: str) -> SearchResultsPage:
+    """The full first page of results with its continuation"""
+    key = search_cache_key(query, None)
+    if (page := search_queries.get_page(key)) is not None:
+        return page
+    return search_flights.do(key, _cached_search, key, query, None)
+
+
+def _cached_search(
+    key: str, query: str, max_results: int | None
+) -> SearchResultsPage:
+    page = search_page(query, max_results)
+    search_queries.add(key, page.songs, page.continuation)
+    return page
+
+
+def cached_search_results(
+    query: str, max_results: int | None
+) -> list[SongMetadata] | None:
+    results = search_queries.get_valid(search_cache_key(query, max_results))
+    if results is None and max_results:
+        # The results of the same query without a limit include these
+        if unlimited := search_queries.get_valid(search_cache_key(query, None)):
+            results = unlimited[:max_results]
     return results
 
 
@@ -95,19 +257,168 @@ class DownloadResponse(NamedTuple):
     metadata: SongMetadata
 
 
-class Downloads(Cache[str, SongMetadata]):
+class StreamResponse(NamedTuple):
+    stream_url: str
+    metadata: SongMetadata
+
+
+# yt-dlp's in progress files
+TEMPORARY_DOWNLOAD_SUFFIXES = {".part", ".ytdl", ".temp", ".tmp"}
+
+
+def is_temporary_download(file: Path) -> bool:
+    return (
+        any(suffix in TEMPORARY_DOWNLOAD_SUFFIXES for suffix in file.suffixes)
+        or ".part-Frag" in file.name
+    )
+
+
+class DownloadIndex:
+    """
+    Maps video ids to their downloaded files and keeps a running total of their size,
+    built with a single scan of the downloads folder, the policy picks what to evict
+    """
+
+    def __init__(
+        self,
+        folder: Path,
+        sharded: bool,
+        policy: EvictionPolicy,
+        access_log: AccessLog | None = None,
+    ) -> None:
+        self.folder = folder
+        self.sharded = sharded
+        self.policy = policy
+        self.access_log = access_log
+        self.files: dict[str, Path] = {}
+        self.sizes: dict[str, int] = {}
+        self.total_size = 0
+        # Songs that were already downloaded when requested and ones that weren't
+        self.hits = 0
+        self.misses = 0
+        self.built = False
+        self.lock = threading.RLock()
+
+    def shard_folder(self, id: str) -> Path:
+        return self.folder / id[:2] if self.sharded else self.folder
+
+    @property
+    def output_template(self) -> str:
+        if self.sharded:
+            return f"{self.folder}/%(id).2s/%(id)s.%(ext)s"
+        return f"{self.folder}/%(id)s.%(ext)s"
+
+    def build(self) -> None:
+        with self.lock:
+            if self.built:
+                return
+            start = time.perf_counter()
+            # Files from both layouts are indexed so toggling SHARDED_DOWNLOADS keeps the cache
+            for entry in self.folder.iterdir():
+                files = entry.iterdir() if entry.is_dir() else (entry,)
+                for file in files:
+                    if file.is_file() and not is_temporary_download(file):
+                        self._track(file.name.partition(".")[0], file)
+            if self.access_log:
+                try:
+                    self.policy.restore(self.access_log.load())
+                except Exception as e:
+                    logger.error("Failed to load %s: %s", self.access_log.file_path, e)
+            self.built = True
+            logger.debug(
+                "Indexed %d downloads in %.3fs",
+                len(self.files),
+                time.perf_counter() - start,
+            )
+
+    def get(self, id: str) -> Path | None:
+        if not self.built:
+            self.build()
+        return self.files.get(id)
+
+    def add(self, id: str, file: Path) -> None:
+        if not self.built:
+            self.build()
+        with self.lock:
+            self._track(id, file)
+
+    def _track(self, id: str, file: Path) -> None:
+        stat = file.stat()
+        # Replacing the file of a tracked id isn't an eviction as far as the policy is concerned
+        if id not in self.files:
+            self.policy.record_insert(id, stat.st_mtime)
+        self.total_size += stat.st_size - self.sizes.get(id, 0)
+        self.files[id] = file
+        self.sizes[id] = stat.st_size
+
+    def _untrack(self, id: str) -> Path | None:
+        self.total_size -= self.sizes.pop(id, 0)
+        file = self.files.pop(id, None)
+        if file:
+            self.policy.record_remove(id)
+        return file
+
+    def touch(self, id: str, accessed: float | None = None) -> None:
+        with self.lock:
+            self.policy.record_access(id, accessed or time.time())
+
+    def record_request(self, hit: bool) -> None:
+        """Counted from every download worker"""
+        with self.lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def remove(self, id: str) -> Path | None:
+        if not self.built:
+            self.build()
+        with self.lock:
+            return self._untrack(id)
+
+    def evict(
+        self, max_size: int, target_size: int, pinned: Iterable[str] = ()
+    ) -> list[Path]:
+        """If over max_size, untrack files in the policy's order until at most target_size, pinned ids are kept"""
+        if not self.built:
+            self.build()
+        with self.lock:
+            if self.total_size <= max_size:
+                return []
+            candidates = self.files.keys() - set(pinned)
+            evicted: list[Path] = []
+            for id in self.policy.victims(candidates):
+                if self.total_size <= target_size:
+                    break
+                if file := self._untrack(id):
+                    evicted.append(file)
+            return evicted
+
+    def find(self, id: str) -> Path | None:
+        """Look for the file of id on disk, only for when yt-dlp doesn't report the path"""
+        for file in self.shard_folder(id).glob(f"{id}.*"):
+            if not is_temporary_download(file):
+                return file
+        return None
+
+    def clear(self) -> None:
+        with self.lock:
+            for id in self.files:
+                self.policy.record_remove(id)
+            self.files.clear()
+            self.sizes.clear()
+            self.total_size = 0
+            self.built = False
+
+
+class Downloads(Cache[str, DownloadMetadata]):
     def __init__(self) -> None:
         super().__init__("downloads", logger, {}, on_reset=clear_downloads)
-        self.currently_downloading: set[str] = set()
 
     def download_file_path(self, id: str) -> Path | None:
-        try:
-            file = next(download_folder.glob(f"{id}.*"))
-            logger.debug(f"Checked {file} exists")
-            return file
-        except StopIteration:
-            logger.debug(f"No file found for {id}")
-            return None
+        file = download_index.get(id)
+        logger.debug("Checked %s file: %s", id, file)
+        return file
 
     def url(self, id: str) -> str:
         return f"{YOUTUBE_HOME_URL}/watch?v={id}"
@@ -115,81 +426,340 @@ class Downloads(Cache[str, SongMetadata]):
     def add(self, metadata: SongMetadata):
         id = metadata["id"]
         if not self.download_file_path(id):
-            self.logger.debug(f"File system out of sync, downloading {id}")
+            self.logger.debug("File system out of sync, downloading %s", id)
             download_single(metadata["url"], id)
 
-        self[metadata["id"]] = metadata
-        self.logger.debug(f"Added {id}")
+        self[metadata["id"]] = DownloadMetadata(**metadata)
+        self.logger.debug("Added %s", id)
+
+    def analysis(self, id: str) -> AudioAnalysis | None:
+        """The analysis of a download if it's been analysed, doesn't check the file system"""
+        metadata = super().get(id)
+        return metadata.get("analysis") if metadata else None
+
+    def set_analysis(self, id: str, analysis: AudioAnalysis) -> None:
+        if metadata := super().get(id):
+            self[id] = {**metadata, "analysis": analysis}
 
     def remove(self, id: str):
-        if file := self.download_file_path(id):
-            self.logger.debug(f"File system out of sync, deleting {file}")
-            file.unlink()
+        if file := download_index.remove(id):
+            self.logger.debug("File system out of sync, deleting %s", file)
+            file.unlink(missing_ok=True)
 
         del self[id]
-        self.logger.debug(f"Removed {id}")
+        self.logger.debug("Removed %s", id)
 
-    def get(self, id: str) -> SongMetadata | None:
+    def get(self, id: str) -> DownloadMetadata | None:
         metadata = super().get(id)
         file_path = self.download_file_path(id)
         if metadata and not file_path:
-            self.logger.debug(f"Database out of sync, removing {id}")
+            self.logger.debug("Database out of sync, removing %s", id)
             self.remove(id)
             metadata = None
         elif not metadata and file_path:
-            self.logger.debug(f"Database out of sync, adding {id}")
+            self.logger.debug("Database out of sync, adding %s", id)
             url = self.url(id)
             metadata = get_song_metadata(url)
             self.add(metadata)
-        self.logger.debug(f"Checked {id} in DB, result: {metadata is not None}")
+        self.logger.debug("Checked %s in DB, result: %s", id, metadata is not None)
         return metadata
 
 
+class StreamUrl(TypedDict):
+    url: str
+    expires_at: float
+    metadata: SongMetadata
+
+
+class StreamUrls(Cache[str, StreamUrl]):
+    """Resolved bestaudio URLs by video id, kept until shortly before they expire"""
+
+    def __init__(self) -> None:
+        super().__init__("stream_urls", logger, {})
+
+    def _cleanup_expired(self) -> None:
+        deadline = time.time() + STREAM_URL_EXPIRY_MARGIN
+        expired = [
+            id for id, entry in self.data.items() if entry["expires_at"] < deadline
+        ]
+        for id in expired:
+            del self.data[id]
+        if expired:
+            self.save(*(("del", (id,)) for id in expired))
+
+    def get_valid(self, id: str) -> StreamUrl | None:
+        self._cleanup_expired()
+        return self.get(id)
+
+    def add(self, id: str, url: str, metadata: SongMetadata) -> None:
+        self._cleanup_expired()
+        self[id] = {
+            "url": url,
+            "expires_at": stream_url_expiry(url),
+            "metadata": metadata,
+        }
+
+    def invalidate(self, id: str) -> None:
+        if id in self:
+            del self[id]
+
+
+class CachedSongMetadata(TypedDict):
+    metadata: SongMetadata
+    cached_at: float
+
+
+class CachedSearch(TypedDict):
+    results: list[SongMetadata]
+    cached_at: float
+    continuation: NotRequired[str | None]
+
+
+CachedEntry = TypeVar("CachedEntry", CachedSongMetadata, CachedSearch)
+
+
+class LRUCache(Cache[str, CachedEntry]):
+    """Entries expire after lifetime seconds, past max_size the least recently used are evicted"""
+
+    lifetime: int
+    max_size: int
+
+    def __init__(self, name: str) -> None:
+        super().__init__(name, logger, {})
+        self.lock = threading.Lock()
+
+    def get_entry(self, key: str) -> CachedEntry | None:
+        with self.lock:
+            entry = self.data.pop(key, None)
+            if entry is None:
+                return None
+            if time.time() - entry["cached_at"] > self.lifetime:
+                self.save(("del", (key,)))
+                return None
+            # Moved to the end as the most recently used, the order is saved with the next change
+            self.data[key] = entry
+            return entry
+
+    def add_entries(self, entries: Iterable[tuple[str, CachedEntry]]) -> None:
+        changes: list[Op] = []
+        with self.lock:
+            for key, entry in entries:
+                # Deleted first so the entry is also the most recently used once reloaded
+                if self.data.pop(key, None) is not None:
+                    changes.append(("del", (key,)))
+                self.data[key] = entry
+                changes.append(("set", (key,), entry))
+            while len(self.data) > self.max_size:
+                key = next(iter(self.data))
+                del self.data[key]
+                changes.append(("del", (key,)))
+        if changes:
+            self.save(*changes)
+
+
+class SongMetadataCache(LRUCache[CachedSongMetadata]):
+    """Song metadata by video id so lookups skip the extractor"""
+
+    # Seconds before a song's metadata is extracted again, 1 week default
+    lifetime = int(os.getenv("SONG_METADATA_CACHE_LIFETIME", 7 * 24 * 60 * 60))
+    max_size = int(os.getenv("SONG_METADATA_CACHE_MAX_SONGS", 10000))
+
+    def __init__(self) -> None:
+        super().__init__("song_metadata")
+
+    def get_valid(self, id: str) -> SongMetadata | None:
+        entry = self.get_entry(id)
+        return entry["metadata"] if entry else None
+
+    def add(self, songs: Iterable[SongMetadata]) -> None:
+        cached_at = time.time()
+        self.add_entries(
+            (song["id"], {"metadata": song_metadata(song), "cached_at": cached_at})
+            for song in songs
+        )
+
+
+class SearchQueries(LRUCache[CachedSearch]):
+    """Search results by normalized query and max results"""
+
+    # Seconds before a query is searched again, 1 day default
+    lifetime = int(os.getenv("SEARCH_CACHE_LIFETIME", 24 * 60 * 60))
+    max_size = int(os.getenv("SEARCH_CACHE_MAX_QUERIES", 1000))
+
+    def __init__(self) -> None:
+        super().__init__("search_queries")
+
+    def get_valid(self, key: str) -> list[SongMetadata] | None:
+        entry = self.get_entry(key)
+        return entry["results"] if entry else None
+
+    def get_page(self, key: str) -> SearchResultsPage | None:
+        if not (entry := self.get_entry(key)):
+            return None
+        return SearchResultsPage(entry["results"], entry.get("continuation"))
+
+    def add(
+        self, key: str, results: list[SongMetadata], continuation: str | None = None
+    ) -> None:
+        entry: CachedSearch = {
+            "results": results,
+            "cached_at": time.time(),
+            "continuation": continuation,
+        }
+        self.add_entries([(key, entry)])
+
+
+class CachedPlaylist(TypedDict):
+    # In playlist order, the songs' metadata is in the song metadata cache
+    ids: list[str]
+    fetched_at: float
+
+
+class PlaylistDiff(NamedTuple):
+    added: list[SongMetadata]
+    removed: set[str]
+
+
+class Playlists(Cache[str, CachedPlaylist]):
+    """The songs of the playlists that were loaded before by playlist id"""
+
+    # Seconds before a cached playlist is fetched again when it's queued, 1 hour default
+    refresh_interval = int(os.getenv("PLAYLIST_REFRESH_INTERVAL", 60 * 60))
+
+    def __init__(self) -> None:
+        super().__init__("playlists", logger, {})
+
+    def is_fresh(self, playlist_id: str) -> bool:
+        if not (playlist := self.get(playlist_id)):
+            return False
+        return time.time() - playlist["fetched_at"] < self.refresh_interval
+
+    def songs(self, playlist_id: str) -> list[SongMetadata] | None:
+        """None if the playlist isn't cached or the metadata of one of its songs expired"""
+        if not (playlist := self.get(playlist_id)):
+            return None
+        songs: list[SongMetadata] = []
+        for id in playlist["ids"]:
+            if not (metadata := song_metadata_cache.get_valid(id)):
+                logger.debug("Metadata of %s in %s expired", id, playlist_id)
+                return None
+            songs.append(metadata)
+        return songs
+
+    def add(self, playlist_id: str, songs: list[SongMetadata]) -> None:
+        self[playlist_id] = {
+            "ids": [song["id"] for song in songs],
+            "fetched_at": time.time(),
+        }
+
+
+def stream_url_expiry(url: str) -> float:
+    expire = parse_qs(urlparse(url).query).get("expire")
+    if expire and expire[0].isdigit():
+        return float(expire[0])
+    return time.time() + DEFAULT_STREAM_URL_LIFETIME
+
+
 class DownloadFolderMetrics(NamedTuple):
     size: int
     size_mbs: float
     total_downloads: int
     size_limit_mbs: float
+    eviction_policy: str
+    cache_hits: int
+    cache_misses: int
+
+    @property
+    def hit_ratio(self) -> float:
+        requests = self.cache_hits + self.cache_misses
+        return self.cache_hits / requests if requests else 0.0
 
 
 def download_folder_metrics() -> DownloadFolderMetrics:
-    files = list(download_folder.iterdir())
-    size = sum(f.stat().st_size for f in files)
+    download_index.build()
+    size = download_index.total_size
     size_mbs = size / IBYTES_TO_MBS
-    total_downloads = len(files)
+    total_downloads = len(download_index.files)
     limit = max_downloads_size_ibytes / IBYTES_TO_MBS
-    return DownloadFolderMetrics(size, size_mbs, total_downloads, limit)
+    return DownloadFolderMetrics(
+        size,
+        size_mbs,
+        total_downloads,
+        limit,
+        download_index.policy.name,
+        download_index.hits,
+        download_index.misses,
+    )
 
 
-def download_folder_is_over_limit():
-    metrics = download_folder_metrics()
-    logger.debug(f"Downloads folder size: {metrics.size_mbs:.2f} MB")
-    is_over_limit = metrics.size > max_downloads_size_ibytes
-    if is_over_limit:
-        logger.warning(
-            f"Downloads folder size ({metrics.size_mbs:.2f} MB) is over the limit ({metrics.size_limit_mbs} MB)"
-        )
-    return is_over_limit
+def no_pinned_downloads() -> set[str]:
+    return set()
+
+
+# Ids that must survive eviction e.g. the current song and its neighbours, set by the player
+pinned_downloads: Callable[[], set[str]] = no_pinned_downloads
+
+
+def set_pinned_downloads(provider: Callable[[], set[str]]) -> None:
+    global pinned_downloads
+    pinned_downloads = provider
+
+
+def should_stream(id: str) -> bool:
+    """Whether a song that isn't downloaded should be streamed instead of downloaded"""
+    match playback_mode:
+        case "stream":
+            return True
+        case "stream_then_cache":
+            download_index.build()
+            return access_log.play_count(id) == 0
+        case _:
+            return False
+
+
+def record_play(id: str) -> None:
+    """Record that a song started playing, the eviction policy and access log learn from plays"""
+    accessed = time.time()
+    download_index.touch(id, accessed)
+    try:
+        access_log.append(id, accessed)
+    except Exception as e:
+        logger.error("Failed to record play of %s: %s", id, e)
 
 
 def check_downloads_folder_size():
-    if not download_folder_is_over_limit():
+    try:
+        pinned = pinned_downloads()
+    except Exception as e:
+        logger.error("Failed to get pinned downloads: %s", e)
+        pinned = set()
+    evicted = download_index.evict(
+        max_downloads_size_ibytes,
+        int(max_downloads_size_ibytes * downloads_low_water_ratio),
+        pinned,
+    )
+    if not evicted:
         return
-    sorted_by_oldest_access = sorted(
-        download_folder.glob("*"), key=lambda f: f.stat().st_atime
+    metrics = download_folder_metrics()
+    logger.warning(
+        "Downloads folder was over the limit (%s MB), evicted %s files down to %.2f MB",
+        metrics.size_limit_mbs,
+        len(evicted),
+        metrics.size_mbs,
     )
-    for file in sorted_by_oldest_access:
-        file.unlink()
-        if not download_folder_is_over_limit():
-            return
+    for file in evicted:
+        try:
+            file.unlink(missing_ok=True)
+        except Exception as e:
+            logger.error("Failed to delete %s: %s", file, e)
 
 
 def info_to_song_metadata(
-    info: dict[str, Any], is_search_info=False, is_mix_info=False
+    info: dict[str, Any], is_search_info=False, is_flat_info=False
 ) -> SongMetadata:
     if is_search_info:
         url = f"{YOUTUBE_HOME_URL}{info['url_suffix']}"
-    elif is_mix_info:
+    elif is_flat_info:
         url = info["url"]
     else:
         url = info["original_url"]
@@ -206,10 +776,39 @@ def info_to_song_metadata(
 
 
 def get_song_metadata(url: str, download=False) -> SongMetadata:
+    id, _ = get_id(url)
+    if not id:
+        return info_to_song_metadata(extract_info(url, download))
+    if not download:
+        if metadata := song_metadata_cache.get_valid(id):
+            logger.debug("Metadata of %s is cached", id)
+            return metadata
+        # A download in flight extracts the same metadata
+        if download_flight := video_flights.join(("download", id)):
+            logger.debug("Waiting for the download of %s for its metadata", id)
+            return download_flight.result().metadata
+    return video_flights.do(
+        ("metadata" if not download else "download_metadata", id),
+        _get_song_metadata,
+        url,
+        download,
+    )
+
+
+def _get_song_metadata(url: str, download: bool) -> SongMetadata:
+    metadata = info_to_song_metadata(extract_info(url, download))
+    song_metadata_cache.add([metadata])
+    return metadata
+
+
+def extract_info(url: str, download=False) -> dict[str, Any]:
+    youtube_dl = get_youtube_dl()
+    import yt_dlp
+
     try:
         info = youtube_dl.extract_info(url, download=download)
         if not info:
-            logger.error(f"Weird, info is {info} for {url}")
+            logger.error("Weird, info is %s for %s", info, url)
             raise ExtractVideoInfoException(url)
     except yt_dlp.utils.YoutubeDLError as e:
         logger.error(e)
@@ -221,93 +820,314 @@ def get_song_metadata(url: str, download=False) -> SongMetadata:
                     raise UnavailableVideoException(msg)
 
         raise YoutubeException(f"Error downloading {url}: {e}")
-    return info_to_song_metadata(info)
+    return cast(dict[str, Any], info)
 
 
 def clear_downloads():
     logger.debug("Clearing downloads")
-    for file in download_folder.glob("*"):
+    for file in download_folder.rglob("*"):
+        if file.is_dir():
+            continue
         try:
             file.unlink()
         except Exception as e:
-            logger.error(f"Failed to delete {file}: {e}")
-
+            logger.error("Failed to delete %s: %s", file, e)
+    download_index.clear()
 
-downloads = Downloads()
 
 download_folder = cache_dir / "downloads"
 download_folder.mkdir(exist_ok=True)
+access_log = AccessLog(cache_dir / "access.log", access_log_max_lines)
+download_index = DownloadIndex(
+    download_folder,
+    sharded_downloads,
+    make_eviction_policy(downloads_eviction_policy),
+    access_log,
+)
+# Keyed by ("download" | "metadata" | "download_metadata" | "stream", video id)
+# and ("playlist", playlist id)
+video_flights: SingleFlight[tuple[str, str], Any] = SingleFlight()
+
+downloads = Downloads()
+stream_urls = StreamUrls()
+song_metadata_cache = SongMetadataCache()
+search_queries = SearchQueries()
+# Keyed by search query cache key
+search_flights: SingleFlight[str, SearchResultsPage] = SingleFlight()
+search_client = SearchClient(
+    ConnectionPool(YOUTUBE_HOST, search_connections, search_timeout),
+    Path(search_replay_dir) if search_replay_dir else None,
+)
+playlists = Playlists()
+
+download_progress = DownloadProgressTracker()
+# Loudness and silence analysis of finished downloads
+analysis_pool = ThreadPoolExecutor(
+    max_workers=analysis_workers, thread_name_prefix="analysis"
+)
+analysing: set[str] = set()
+analysing_lock = threading.Lock()
 
 opts = {
     "format": "bestaudio/best",
-    "outtmpl": f"{download_folder}/%(id)s.%(ext)s",
+    "outtmpl": download_index.output_template,
     "keepvideo": False,
+    "progress_hooks": [download_progress.hook],
 }
-youtube_dl = yt_dlp.YoutubeDL(opts)
+if opus_downloads:
+    opts["postprocessors"] = [
+        {
+            "key": "FFmpegExtractAudio",
+            "preferredcodec": "opus",
+            "preferredquality": str(opus_downloads_bitrate_kbps),
+        }
+    ]
+_youtube_dl: "yt_dlp.YoutubeDL | None" = None
+_youtube_dl_lock = threading.Lock()
+warmed_up = threading.Event()
+
+
+def get_youtube_dl() -> "yt_dlp.YoutubeDL":
+    """Import yt_dlp and build the YoutubeDL on first use, blocks while a warmup is in progress"""
+    global _youtube_dl
+    with _youtube_dl_lock:
+        if _youtube_dl is None:
+            start = time.perf_counter()
+            import yt_dlp
+
+            _youtube_dl = yt_dlp.YoutubeDL(opts)
+            logger.debug("Warmed up yt_dlp in %.2fs", time.perf_counter() - start)
+            warmed_up.set()
+        return _youtube_dl
+
+
+def _warmup():
+    download_index.build()
+    get_youtube_dl()
+
+
+def warmup() -> threading.Thread:
+    """Warm up the extractor stack in the background so startup isn't blocked by it"""
+    thread = threading.Thread(target=_warmup, name="youtube-warmup", daemon=True)
+    thread.start()
+    return thread
 
 
 def get_songs_in_playlist(
     url: str,
 ) -> Generator[SongMetadata, None, None]:
+    """
+    Yields a playlist's songs as its pages are fetched, the entries are left unprocessed
+    so nothing is extracted per song and the first song is available straight away
+    """
+    youtube_dl = get_youtube_dl()
+    import yt_dlp
+
     try:
-        # Mixes don't require processing
         info = youtube_dl.extract_info(url, download=False, process=False)
-        if not info:
-            logger.error(f"Weird, info is {info} for {url}")
-        is_mix = True
+        # Watch URLs with a list point to the playlist instead of listing it
+        while info and info.get("_type") in ("url", "url_transparent"):
+            info = youtube_dl.extract_info(info["url"], download=False, process=False)
     except yt_dlp.utils.YoutubeDLError as e:
         if msg := e.msg:
             match msg:
                 case _ if "The playlist does not exist" in msg:
                     raise UnavailablePlaylistException(url)
         raise ExtractPlaylistInfoException(url)
-    if not info or not info.get("entries"):
-        is_mix = False
-        info = youtube_dl.extract_info(url, download=False, process=True)
-        if not info:
-            raise ExtractPlaylistInfoException(url)
-        if not info.get("entries"):
-            raise UnavailablePlaylistException(url)
+    if not info:
+        logger.error("Weird, info is %s for %s", info, url)
+        raise ExtractPlaylistInfoException(url)
+    if info.get("entries") is None:
+        raise UnavailablePlaylistException(url)
 
-    logger.debug(f"{url} mix status: {is_mix}")
-    entries = info["entries"]
     is_empty = True
-    for entry in entries:
-        is_empty = False
-        metadata = info_to_song_metadata(entry, is_mix_info=is_mix)
-        yield metadata
+    songs: list[SongMetadata] = []
+    try:
+        for entry in playlist_entries(info["entries"]):
+            is_empty = False
+            metadata = info_to_song_metadata(entry, is_flat_info=True)
+            songs.append(metadata)
+            yield metadata
+    except yt_dlp.utils.YoutubeDLError as e:
+        logger.error(e)
+        raise ExtractPlaylistInfoException(url)
+    finally:
+        # Cached in one go so a long playlist doesn't save the cache once per song
+        song_metadata_cache.add(songs)
     if is_empty:
         raise EmptyPlaylistException(url)
+    if playlist_id := get_playlist_id(url):
+        playlists.add(playlist_id, songs)
+
+
+def playlist_entries(entries: Iterable[dict[str, Any]]) -> Iterable[dict[str, Any]]:
+    """Most extractors return a lazy generator, the paged ones are read a page at a time"""
+    from yt_dlp.utils import PagedList
+
+    if not isinstance(entries, PagedList):
+        yield from entries
+        return
+    # Pages are fetched as the slices reach them and cached by the list
+    for index in itertools.count():
+        if not (entry := entries.getslice(index, index + 1)):
+            return
+        yield entry[0]
+
+
+def get_playlist_id(url: str) -> str | None:
+    if playlist_ids := parse_qs(urlparse(url).query).get("list"):
+        return playlist_ids[0]
+    return None
+
+
+def get_cached_playlist(url: str) -> list[SongMetadata] | None:
+    """The songs of a playlist as they were the last time it was loaded"""
+    playlist_id = get_playlist_id(url)
+    return playlists.songs(playlist_id) if playlist_id else None
+
+
+def refresh_playlist(url: str) -> PlaylistDiff:
+    """
+    Load a playlist again, the songs added and removed since it was cached,
+    nothing changed if it was fetched within the refresh interval
+    """
+    playlist_id = get_playlist_id(url)
+    if playlist_id and playlists.is_fresh(playlist_id):
+        logger.debug("Not refreshing %s, it was fetched recently", url)
+        return PlaylistDiff([], set())
+    return video_flights.do(("playlist", playlist_id or url), _refresh_playlist, url)
+
+
+def _refresh_playlist(url: str) -> PlaylistDiff:
+    playlist_id = get_playlist_id(url)
+    cached = playlists.get(playlist_id) if playlist_id else None
+    cached_ids = set(cached["ids"]) if cached else set()
+    songs = list(get_songs_in_playlist(url))
+    ids = {song["id"] for song in songs}
+    diff = PlaylistDiff(
+        [song for song in songs if song["id"] not in cached_ids], cached_ids - ids
+    )
+    logger.debug(
+        "Refreshed %s, %d added, %d removed", url, len(diff.added), len(diff.removed)
+    )
+    return diff
+
+
+def get_playlist_songs(url: str) -> list[SongMetadata]:
+    if (songs := get_cached_playlist(url)) is not None:
+        return songs
+    return list(get_songs_in_playlist(url))
 
 
 def download_single(url: str, id: str) -> DownloadResponse:
-    logger.debug(f"Parsed ID {id}")
-    while id in downloads.currently_downloading:
-        logger.debug(f"Waiting for {id} to finish downloading")
-        time.sleep(1)
-
-    if metadata := downloads.get(id):
-        file_path = downloads.download_file_path(id)
-        if not file_path:
-            raise YoutubeException(f"Invalid db state {id} not in {file_path}")
-        logger.debug(f"Already downloaded {file_path}")
-        return DownloadResponse(file_path, metadata)
-
-    downloads.currently_downloading.add(id)
-    try:
-        check_downloads_folder_size()
-        metadata = get_song_metadata(url, download=True)
-    except Exception:
-        downloads.currently_downloading.remove(id)
-        raise
-    downloads.currently_downloading.remove(id)
+    """Concurrent calls for the same id share one download"""
+    logger.debug("Parsed ID %s", id)
+    return video_flights.do(("download", id), _download_single, url, id)
+
+
+def get_downloaded(id: str) -> DownloadResponse | None:
+    """The downloaded file of a song, None if it has to be downloaded"""
+    if not (metadata := downloads.get(id)):
+        return None
     file_path = downloads.download_file_path(id)
+    if not file_path:
+        raise YoutubeException(f"Invalid db state {id} not in {file_path}")
+    logger.debug("Already downloaded %s", file_path)
+    download_index.record_request(hit=True)
+    if "analysis" not in metadata:
+        # Downloaded before songs were analysed or the analysis failed
+        schedule_analysis(id, file_path)
+    return DownloadResponse(file_path, song_metadata(metadata))
+
+
+def _download_single(url: str, id: str) -> DownloadResponse:
+    if downloaded := get_downloaded(id):
+        return downloaded
+
+    download_index.record_request(hit=False)
+    info = extract_info(url, download=True)
+    metadata = info_to_song_metadata(info)
+    file_path = downloaded_file_path(info)
     if not file_path:
         raise YoutubeException(f"Failed to download {url}")
+    download_index.add(id, file_path)
     downloads.add(metadata)
+    song_metadata_cache.add([metadata])
+    check_downloads_folder_size()
+    schedule_analysis(id, file_path)
     return DownloadResponse(file_path, metadata)
 
 
+def song_metadata(metadata: DownloadMetadata) -> SongMetadata:
+    """Leaves out the analysis so it doesn't end up in the queue or favourites"""
+    return SongMetadata(
+        id=metadata["id"],
+        title=metadata["title"],
+        url=metadata["url"],
+        thumbnail_url=metadata["thumbnail_url"],
+    )
+
+
+def schedule_analysis(id: str, file_path: Path) -> None:
+    if not (loudness_normalization or trim_silence):
+        return
+    with analysing_lock:
+        if id in analysing:
+            return
+        analysing.add(id)
+    analysis_pool.submit(analyse_download, id, file_path)
+
+
+def analyse_download(id: str, file_path: Path) -> None:
+    try:
+        start = time.perf_counter()
+        analysis = analyse(file_path, loudness_target_lufs, loudness_max_gain_db)
+        logger.debug(
+            "Analysed %s in %.2fs: %s", id, time.perf_counter() - start, analysis
+        )
+        downloads.set_analysis(id, analysis)
+    except AnalysisException as e:
+        logger.warning("Failed to analyse %s: %s", id, e)
+    finally:
+        with analysing_lock:
+            analysing.discard(id)
+
+
+def downloaded_file_path(info: dict[str, Any]) -> Path | None:
+    for requested in info.get("requested_downloads") or []:
+        if (file_path := requested.get("filepath")) and Path(file_path).exists():
+            return Path(file_path)
+    return download_index.find(info["id"])
+
+
+download_pool = DownloadPool(download_workers, download_single)
+
+
+def resolve_stream(url: str, id: str) -> StreamResponse:
+    """The bestaudio stream URL of a video, concurrent calls for the same id share one extraction"""
+    if entry := stream_urls.get_valid(id):
+        logger.debug("Stream URL of %s is cached", id)
+        return StreamResponse(entry["url"], entry["metadata"])
+    return video_flights.do(("stream", id), _resolve_stream, url, id)
+
+
+def _resolve_stream(url: str, id: str) -> StreamResponse:
+    info = extract_info(url, download=False)
+    stream_url = info.get("url")
+    if not stream_url:
+        # Merged formats list the audio format separately
+        for requested in info.get("requested_formats") or []:
+            if requested.get("acodec") not in (None, "none"):
+                stream_url = requested["url"]
+                break
+    if not stream_url:
+        raise YoutubeException(f"No audio stream found for {url}")
+    metadata = info_to_song_metadata(info)
+    stream_urls.add(id, stream_url, metadata)
+    song_metadata_cache.add([metadata])
+    return StreamResponse(stream_url, metadata)
+
+
 def get_id(url: str) -> tuple[str | None, bool]:
     vid_id_match = re.search(VIDEO_ID_RX, url)
     is_playlist = PLAYLIST_MAGIC_STR in url
@@ -319,6 +1139,14 @@ def get_id(url: str) -> tuple[str | None, bool]:
     return id, is_playlist
 
 
+def get_random_songs() -> list[SongMetadata]:
+    songs: list[SongMetadata] = []
+    for file in randoms_songs_dir.iterdir():
+        with open(file, "r") as f:
+            songs.extend(json.load(f))
+    return songs
+
+
 def configure_random_songs():
     random_songs_config_path = Path("custom_random_songs_config.json")
     if not random_songs_config_path.exists():
@@ -328,7 +1156,7 @@ def configure_random_songs():
         for song in songs:
             artist = song["artist"]
             url = song["playlist_url"]
-            songs_metadata = list(get_songs_in_playlist(url))
+            songs_metadata = get_playlist_songs(url)
             file_path = randoms_songs_dir / f"{artist}.json"
             with open(file_path, "w") as f:
                 json.dump(songs_metadata, f, indent=4)
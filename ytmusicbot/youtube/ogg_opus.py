@@ -0,0 +1,102 @@
+from pathlib import Path
+import struct
+from typing import BinaryIO
+
+OGG_CAPTURE_PATTERN = b"OggS"
+# capture pattern, version, header type, granule position, serial, page sequence, CRC, segments
+OGG_PAGE_HEADER = struct.Struct("<4sBBqIIIB")
+# Samples at 48kHz of one frame for each TOC config, SILK, hybrid then CELT
+OPUS_FRAME_SAMPLES = (
+    (480, 960, 1920, 2880) * 3 + (480, 960) * 2 + (120, 240, 480, 960) * 4
+)
+OPUS_SAMPLE_RATE = 48000
+
+
+class OggOpusError(Exception):
+    def __init__(self, message: str) -> None:
+        super().__init__(message)
+
+
+def packet_samples(packet: bytes) -> int:
+    """The number of 48kHz samples in an Opus packet, read from its TOC byte"""
+    if not packet:
+        return 0
+    toc = packet[0]
+    frame_samples = OPUS_FRAME_SAMPLES[toc >> 3]
+    match toc & 0b11:
+        case 0:
+            frames = 1
+        case 1 | 2:
+            frames = 2
+        case _:
+            if len(packet) < 2:
+                raise OggOpusError("Opus packet is missing its frame count")
+            frames = packet[1] & 0b111111
+    return frame_samples * frames
+
+
+class OggOpusReader:
+    """
+    Reads the Opus packets of an Ogg Opus file one at a time,
+    the OpusHead and OpusTags headers are skipped
+    """
+
+    def __init__(self, file_path: Path) -> None:
+        self.file_path = file_path
+        self.file: BinaryIO = open(file_path, "rb")
+        self.serial: int | None = None
+        # Packets of the current page that haven't been read yet
+        self.packets: list[bytes] = []
+        # The start of a packet continued on the next page
+        self.partial = b""
+        try:
+            head = self.read_packet()
+            if not head.startswith(b"OpusHead"):
+                raise OggOpusError(f"{file_path} isn't an Ogg Opus file")
+            self.channels = head[9]
+            self.read_packet()  # OpusTags
+        except BaseException:
+            self.close()
+            raise
+
+    def __enter__(self) -> "OggOpusReader":
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.file.close()
+
+    def read_packet(self) -> bytes:
+        """The next packet, b"" at the end of the file"""
+        while not self.packets:
+            if not self._read_page():
+                return b""
+        return self.packets.pop(0)
+
+    def _read_page(self) -> bool:
+        header = self.file.read(OGG_PAGE_HEADER.size)
+        if len(header) < OGG_PAGE_HEADER.size:
+            return False
+        pattern, _, _, _, serial, _, _, segments = OGG_PAGE_HEADER.unpack(header)
+        if pattern != OGG_CAPTURE_PATTERN:
+            raise OggOpusError(f"Lost Ogg page sync in {self.file_path}")
+        lacing = self.file.read(segments)
+        body = self.file.read(sum(lacing))
+        if self.serial is None:
+            self.serial = serial
+        elif serial != self.serial:
+            # Only the first logical stream is played
+            return True
+        start = 0
+        packet = self.partial
+        for size in lacing:
+            packet += body[start : start + size]
+            start += size
+            # A lacing value under 255 ends the packet
+            if size < 255:
+                self.packets.append(packet)
+                packet = b""
+        self.partial = packet
+        return True
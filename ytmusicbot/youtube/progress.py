@@ -0,0 +1,78 @@
+from pathlib import Path
+import threading
+from typing import Any
+
+
+class DownloadProgress:
+    """How much of a video yt-dlp has written to its temporary file so far"""
+
+    def __init__(self, id: str) -> None:
+        self.id = id
+        self.tmp_path: Path | None = None
+        self.downloaded_bytes = 0
+        # Set once the file is complete or the download failed or was cancelled
+        self.finished = False
+        self.failed = False
+        self.condition = threading.Condition()
+
+    def update(self, tmp_path: Path, downloaded_bytes: int) -> None:
+        with self.condition:
+            self.tmp_path = tmp_path
+            self.downloaded_bytes = downloaded_bytes
+            self.condition.notify_all()
+
+    def finish(self, failed=False) -> None:
+        with self.condition:
+            if self.finished:
+                return
+            self.finished = True
+            self.failed = failed
+            self.condition.notify_all()
+
+    def wait_until_buffered(self, min_bytes: int) -> bool:
+        """Block until min_bytes are on disk, False if the download finished first"""
+        with self.condition:
+            while self.downloaded_bytes < min_bytes and not self.finished:
+                self.condition.wait()
+            return self.downloaded_bytes >= min_bytes and not self.finished
+
+    def wait_for_more(self, downloaded_bytes: int, timeout: float) -> None:
+        with self.condition:
+            if self.downloaded_bytes <= downloaded_bytes and not self.finished:
+                self.condition.wait(timeout)
+
+
+class DownloadProgressTracker:
+    """Feeds yt-dlp's progress hook into the DownloadProgress of the videos being watched"""
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.watched: dict[str, DownloadProgress] = {}
+
+    def watch(self, id: str) -> DownloadProgress:
+        with self.lock:
+            if (progress := self.watched.get(id)) is None:
+                progress = self.watched[id] = DownloadProgress(id)
+            return progress
+
+    def unwatch(self, id: str, failed=False) -> None:
+        with self.lock:
+            progress = self.watched.pop(id, None)
+        if progress:
+            progress.finish(failed)
+
+    def hook(self, status: dict[str, Any]) -> None:
+        info = status.get("info_dict") or {}
+        with self.lock:
+            progress = self.watched.get(info.get("id", ""))
+        if not progress:
+            return
+        match status["status"]:
+            case "downloading" if status.get("tmpfilename"):
+                progress.update(
+                    Path(status["tmpfilename"]), status.get("downloaded_bytes") or 0
+                )
+            case "finished":
+                progress.finish()
+            case "error":
+                progress.finish(failed=True)
@@ -0,0 +1,250 @@
+import gzip
+import hashlib
+import http.client
+import json
+from pathlib import Path
+import re
+import threading
+from typing import Any, NamedTuple
+from urllib.parse import quote_plus
+from ytmusicbot.common.main import logger
+
+logger = logger.getChild("youtube").getChild("search_client")
+YOUTUBE_HOST = "www.youtube.com"
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/126.0.0.0 Safari/537.36",
+    "Accept-Language": "en-US,en;q=0.9",
+    "Accept-Encoding": "gzip",
+    # Skips the cookie consent page served in the EU
+    "Cookie": "CONSENT=YES+1",
+}
+INITIAL_DATA_MARKER = "ytInitialData"
+VIDEO_RENDERER_KEY = '"videoRenderer":'
+CONTINUATION_KEY = '"continuationCommand":'
+CLIENT_VERSION_RE = re.compile(r'"INNERTUBE_CLIENT_VERSION":"([^"]+)"')
+# Used for continuations until a results page has told us the current one
+DEFAULT_CLIENT_VERSION = "2.20250801.00.00"
+WHITESPACE_RE = re.compile(r"\s*")
+decoder = json.JSONDecoder()
+
+
+class SearchException(Exception):
+    def __init__(self, message: str) -> None:
+        super().__init__(message)
+
+
+class SearchPage(NamedTuple):
+    videos: list[dict[str, Any]]
+    # Fetches the next page, None on the last page or when parsing stopped early
+    continuation: str | None
+
+
+class ConnectionPool:
+    """
+    Keep-alive HTTPS connections to one host shared by the threads that search,
+    at most size idle connections are kept open
+    """
+
+    def __init__(self, host: str, size: int, timeout: float) -> None:
+        self.host = host
+        self.size = size
+        self.timeout = timeout
+        self.idle: list[http.client.HTTPSConnection] = []
+        self.lock = threading.Lock()
+        self.opened = 0
+
+    def _connect(self) -> http.client.HTTPSConnection:
+        with self.lock:
+            self.opened += 1
+        return http.client.HTTPSConnection(self.host, timeout=self.timeout)
+
+    def _acquire(self) -> tuple[http.client.HTTPSConnection, bool]:
+        with self.lock:
+            if self.idle:
+                return self.idle.pop(), True
+        return self._connect(), False
+
+    def _release(self, connection: http.client.HTTPSConnection) -> None:
+        with self.lock:
+            if len(self.idle) < self.size:
+                self.idle.append(connection)
+                return
+        connection.close()
+
+    def request(
+        self,
+        method: str,
+        path: str,
+        body: bytes | None = None,
+        headers: dict[str, str] | None = None,
+    ) -> bytes:
+        connection, reused = self._acquire()
+        while True:
+            try:
+                connection.request(method, path, body, {**HEADERS, **(headers or {})})
+                response = connection.getresponse()
+                data = response.read()
+                break
+            except (http.client.HTTPException, OSError) as e:
+                connection.close()
+                if not reused:
+                    raise SearchException(f"Request to {self.host} failed: {e}")
+                # The server may have closed the idle connection, retried once on a new one
+                logger.debug("Reused connection to %s failed: %s", self.host, e)
+                connection, reused = self._connect(), False
+        if response.will_close:
+            connection.close()
+        else:
+            self._release(connection)
+        if response.status != 200:
+            raise SearchException(f"{self.host}{path} returned {response.status}")
+        if response.getheader("Content-Encoding") == "gzip":
+            data = gzip.decompress(data)
+        return data
+
+    def close(self) -> None:
+        with self.lock:
+            idle, self.idle = self.idle, []
+        for connection in idle:
+            connection.close()
+
+
+def fixture_path(fixtures_dir: Path, query: str) -> Path:
+    name = re.sub(r"\W+", "_", query.casefold()).strip("_")
+    return fixtures_dir / f"{name}.html"
+
+
+def continuation_fixture_path(fixtures_dir: Path, continuation: str) -> Path:
+    # Tokens are too long for file names
+    name = hashlib.sha1(continuation.encode()).hexdigest()[:16]
+    return fixtures_dir / f"continuation_{name}.json"
+
+
+def renderer_to_video(renderer: dict[str, Any]) -> dict[str, Any] | None:
+    """The fields of a videoRenderer a song's metadata is made from"""
+    id = renderer.get("videoId")
+    title = renderer.get("title", {})
+    if "runs" in title:
+        title = "".join(run.get("text", "") for run in title["runs"])
+    else:
+        title = title.get("simpleText")
+    if not id or not title:
+        return None
+    url_suffix = (
+        renderer.get("navigationEndpoint", {})
+        .get("commandMetadata", {})
+        .get("webCommandMetadata", {})
+        .get("url")
+    ) or f"/watch?v={id}"
+    thumbnails = [
+        thumbnail["url"]
+        for thumbnail in renderer.get("thumbnail", {}).get("thumbnails", [])
+        if "url" in thumbnail
+    ] or [f"https://i.ytimg.com/vi/{id}/hqdefault.jpg"]
+    return {"id": id, "title": title, "url_suffix": url_suffix, "thumbnails": thumbnails}
+
+
+def decode_object(text: str, key: str, index: int, end: int) -> tuple[Any, int]:
+    """The JSON value after the next key from index, None if there is none before end"""
+    index = text.find(key, index, end)
+    if index == -1:
+        return None, -1
+    index = WHITESPACE_RE.match(text, index + len(key)).end()  # type: ignore
+    try:
+        return decoder.raw_decode(text, index)
+    except json.JSONDecodeError as e:
+        raise SearchException(f"Malformed search results: {e}")
+
+
+def parse_results(
+    text: str, start: int, end: int, max_results: int | None
+) -> SearchPage:
+    """
+    Only the videoRenderer objects of the results are decoded instead of all of them,
+    parsing stops once max_results videos are found
+    """
+    videos: list[dict[str, Any]] = []
+    ids: set[str] = set()
+    index = start
+    while max_results is None or len(videos) < max_results:
+        renderer, next_index = decode_object(text, VIDEO_RENDERER_KEY, index, end)
+        if renderer is None:
+            break
+        index = next_index
+        # The same video can also be listed in a shelf
+        if (video := renderer_to_video(renderer)) and video["id"] not in ids:
+            ids.add(video["id"])
+            videos.append(video)
+    else:
+        # Stopped early, the next page would skip the videos that weren't parsed
+        return SearchPage(videos, None)
+    # The continuation comes after the page's videos
+    command, _ = decode_object(text, CONTINUATION_KEY, index, end)
+    return SearchPage(videos, command.get("token") if command else None)
+
+
+def parse_results_page(page: str, max_results: int | None = None) -> SearchPage:
+    start = page.find(INITIAL_DATA_MARKER)
+    if start == -1:
+        raise SearchException("The results page has no ytInitialData")
+    end = page.find("</script>", start)
+    return parse_results(page, start, end if end != -1 else len(page), max_results)
+
+
+def parse_videos(page: str, max_results: int | None = None) -> list[dict[str, Any]]:
+    return parse_results_page(page, max_results).videos
+
+
+class SearchClient:
+    """Reads YouTube's search results page, or replays saved pages from replay_dir offline"""
+
+    def __init__(self, pool: ConnectionPool, replay_dir: Path | None = None) -> None:
+        self.pool = pool
+        self.replay_dir = replay_dir
+        self.client_version = DEFAULT_CLIENT_VERSION
+
+    def results_page(self, query: str) -> str:
+        if self.replay_dir:
+            path = fixture_path(self.replay_dir, query)
+            try:
+                return path.read_text(encoding="utf-8")
+            except OSError as e:
+                raise SearchException(f"No saved results page for {query!r}: {e}")
+        data = self.pool.request("GET", f"/results?search_query={quote_plus(query)}")
+        page = data.decode("utf-8", errors="replace")
+        if match := CLIENT_VERSION_RE.search(page):
+            self.client_version = match.group(1)
+        return page
+
+    def continuation_response(self, continuation: str) -> str:
+        if self.replay_dir:
+            path = continuation_fixture_path(self.replay_dir, continuation)
+            try:
+                return path.read_text(encoding="utf-8")
+            except OSError as e:
+                raise SearchException(f"No saved continuation: {e}")
+        body = {
+            "context": {
+                "client": {
+                    "clientName": "WEB",
+                    "clientVersion": self.client_version,
+                    "hl": "en",
+                }
+            },
+            "continuation": continuation,
+        }
+        data = self.pool.request(
+            "POST",
+            "/youtubei/v1/search?prettyPrint=false",
+            json.dumps(body).encode(),
+            {"Content-Type": "application/json"},
+        )
+        return data.decode("utf-8", errors="replace")
+
+    def search(self, query: str, max_results: int | None = None) -> SearchPage:
+        return parse_results_page(self.results_page(query), max_results)
+
+    def continue_search(self, continuation: str) -> SearchPage:
+        """Only the page after the one the continuation came with"""
+        response = self.continuation_response(continuation)
+        return parse_results(response, 0, len(response), None)